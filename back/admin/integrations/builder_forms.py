@@ -322,6 +322,29 @@ class ManifestExtractDataForm(forms.Form):
         ),
         required=False,
     )
+    page_url = forms.CharField(
+        max_length=255,
+        label=_("Paginated response: Page url"),
+        initial="",
+        help_text=_(
+            "A fixed url for APIs that use page numbers or offsets. Use {{ PAGE_NUMBER }} or {{ PAGE_OFFSET }} in the url. Multiple pages will be fetched at the same time and it will stop at the first page without users."
+        ),
+        required=False,
+    )
+    page_size = forms.IntegerField(
+        label=_("Paginated response: Page size"),
+        help_text=_(
+            "Amount of users per page, used for {{ PAGE_OFFSET }}. Defaults to the amount of users on the first page."
+        ),
+        min_value=1,
+        required=False,
+    )
+    concurrent_pages = forms.IntegerField(
+        initial=4,
+        label=_("Paginated response: Pages to fetch at the same time"),
+        min_value=1,
+        required=False,
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -518,7 +518,7 @@ class IntegrationBuilderTestView(AdminPermMixin, View):
                 {"error": "no user selected"},
             )
         if test_type == "exists":
-            result = integration.user_exists(user, save_result=False)
+            result = integration.user_exists(user, save_result=False, use_cache=False)
         elif test_type == "execute":
             result = integration.execute(user)
         elif test_type == "revoke":
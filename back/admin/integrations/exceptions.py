@@ -2,6 +2,10 @@ class FailedPaginatedResponseError(Exception):
     pass
 
 
+class FetchBudgetExceededError(FailedPaginatedResponseError):
+    pass
+
+
 class KeyIsNotInDataError(Exception):
     pass
 
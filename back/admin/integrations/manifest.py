@@ -0,0 +1,128 @@
+import base64
+import hashlib
+import json
+
+from django.template import TemplateSyntaxError
+
+from misc.cache import LocalCache
+from misc.template_cache import template_cache
+
+
+def encode_basic_auth(credentials):
+    return "Basic " + base64.b64encode(credentials.encode("ascii")).decode("ascii")
+
+
+class CompiledHeader:
+    __slots__ = ("key", "value", "basic_auth", "encoded")
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        # If Basic authentication then swap to base64
+        self.basic_auth = (
+            key == "Authorization"
+            and isinstance(value, str)
+            and value.startswith("Basic")
+        )
+        self.encoded = None
+        if self.basic_auth:
+            credentials = value.split(" ", 1)[1]
+            if template_cache.needs_rendering(credentials):
+                # Only known when rendered
+                self.value = credentials
+            else:
+                self.encoded = encode_basic_auth(credentials)
+
+
+def compile_headers(headers):
+    return [CompiledHeader(key, value) for key, value in headers.items()]
+
+
+class CompiledRequest:
+    """
+    The parts of a request in the manifest that don't depend on the user or the
+    secrets: the JSON body is serialized once and the headers are classified.
+    """
+
+    __slots__ = ("url", "data", "headers", "expected")
+
+    def __init__(self, item):
+        self.url = item["url"]
+        self.data = json.dumps(item["data"]) if "data" in item else None
+        self.headers = compile_headers(item["headers"]) if item.get("headers") else None
+        self.expected = item.get("expected", "")
+
+    def templates(self):
+        yield self.url
+        yield self.expected
+        if self.data is not None:
+            yield self.data
+        for header in self.headers or []:
+            yield header.key
+            yield header.value
+
+
+class CompiledManifest:
+    def __init__(self, manifest):
+        self.headers = compile_headers(manifest.get("headers", {}))
+        # {path: compiled request}
+        self.requests = {
+            path: CompiledRequest(item) for path, item in self.request_items(manifest)
+        }
+
+    @staticmethod
+    def request_items(manifest):
+        items = [(("exists",), manifest.get("exists"))]
+        for key in ("execute", "revoke"):
+            items += [((key, i), item) for i, item in enumerate(manifest.get(key, []))]
+        for key in ("refresh", "access_token"):
+            items.append((("oauth", key), manifest.get("oauth", {}).get(key)))
+        # Skip anything that isn't (a complete) request
+        return [
+            (path, item)
+            for path, item in items
+            if isinstance(item, dict) and "url" in item
+        ]
+
+    def warm_templates(self):
+        # Parse all templates upfront, so they are ready when executing
+        texts = [header.key for header in self.headers]
+        texts += [header.value for header in self.headers]
+        for request in self.requests.values():
+            texts += request.templates()
+        for text in texts:
+            if template_cache.needs_rendering(text):
+                try:
+                    template_cache.get(text)
+                except TemplateSyntaxError:
+                    # Fails (and gets reported) when the request is made
+                    continue
+
+    def bind(self, manifest):
+        # Links the requests in this (equal) manifest to their compiled version.
+        # The item itself is kept, so the id can't be reused for another object.
+        return {
+            id(item): (item, self.requests[path])
+            for path, item in self.request_items(manifest)
+            if path in self.requests
+        }
+
+
+def manifest_hash(manifest):
+    return hashlib.blake2b(
+        json.dumps(manifest, sort_keys=True, default=str).encode(), digest_size=16
+    ).hexdigest()
+
+
+compiled_manifests = LocalCache(maxsize=256)
+
+
+def get_compiled_manifest(integration_id, manifest):
+    # Compiled once per process for every version of a manifest
+    key = (integration_id, manifest_hash(manifest))
+    compiled = compiled_manifests.get(key)
+    if compiled is None:
+        compiled = CompiledManifest(manifest)
+        compiled.warm_templates()
+        compiled_manifests.set(key, compiled)
+    return compiled
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.17 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("integrations", "0026_alter_integration_integration"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="integrationtrackerstep",
+            name="duration",
+            field=models.DurationField(null=True),
+        ),
+    ]
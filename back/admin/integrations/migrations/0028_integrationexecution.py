@@ -0,0 +1,56 @@
+# Generated by Django 5.2.17 on 2026-10-18 06:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+import misc.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("integrations", "0027_integrationtrackerstep_duration"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IntegrationExecution",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("step", models.PositiveIntegerField()),
+                ("tried", models.PositiveIntegerField()),
+                ("retry_on_failure", models.BooleanField(default=False)),
+                ("state", misc.fields.EncryptedJSONField(default=dict)),
+                (
+                    "integration",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="integrations.integration",
+                    ),
+                ),
+                (
+                    "new_hire",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "tracker",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="integrations.integrationtracker",
+                    ),
+                ),
+            ],
+        ),
+    ]
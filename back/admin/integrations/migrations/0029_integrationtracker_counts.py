@@ -0,0 +1,17 @@
+# Generated by Django 5.2.17 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("integrations", "0028_integrationexecution"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="integrationtracker",
+            name="counts",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    def add_schedule(apps, schema_editor):
+        from django_q.models import Schedule
+
+        Schedule.objects.get_or_create(
+            name="Refresh OAuth tokens",
+            defaults={
+                "func": "admin.integrations.tasks.refresh_oauth_tokens",
+                "schedule_type": Schedule.CRON,
+                "cron": "*/5 * * * *",
+            },
+        )
+
+    def remove_schedule(apps, schema_editor):
+        from django_q.models import Schedule
+
+        Schedule.objects.filter(name="Refresh OAuth tokens").delete()
+
+    dependencies = [
+        ("integrations", "0029_integrationtracker_counts"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_schedule, remove_schedule),
+    ]
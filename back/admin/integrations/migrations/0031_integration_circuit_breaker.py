@@ -0,0 +1,31 @@
+# Generated by Django 5.2.17 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("integrations", "0030_refresh_oauth_tokens_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="integration",
+            name="circuit_opened_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="integration",
+            name="failed_executions",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="integrationexecution",
+            name="waiting_for",
+            field=models.CharField(
+                choices=[("polling", "Polling"), ("recovery", "Recovery")],
+                default="polling",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -1,14 +1,22 @@
+import copy
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from json.decoder import JSONDecodeError
 
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
 from admin.integrations.exceptions import (
     DataIsNotJSONError,
     FailedPaginatedResponseError,
+    FetchBudgetExceededError,
     KeyIsNotInDataError,
 )
+from admin.integrations.models import IntegrationTracker, IntegrationTrackerStep
 from admin.integrations.utils import get_value_from_notation
+from misc.threads import in_thread
+from organization.models import Notification
 
 logger = logging.getLogger(__name__)
 
@@ -102,7 +110,9 @@ class PaginatedResponse:
         self.integration.params["NEXT_PAGE_TOKEN"] = token
         return self.integration._replace_vars(next_page)
 
-    def get_data_from_paginated_response(self):
+    def iter_pages(self):
+        # Yields the users per page, the next page is only fetched when the previous
+        # one has been processed
         success, response = self.integration.execute()
         if not success:
             raise FailedPaginatedResponseError(
@@ -110,6 +120,11 @@ class PaginatedResponse:
             )
 
         users = self.extract_data_from_list_response(response)
+        yield users
+
+        if self.integration.manifest.get("page_url"):
+            yield from self.iter_numbered_pages(len(users))
+            return
 
         amount_pages_to_fetch = self.integration.manifest.get(
             "amount_pages_to_fetch", 5
@@ -137,7 +152,148 @@ class PaginatedResponse:
             except KeyIsNotInDataError:
                 break
 
-            users += self.extract_data_from_list_response(response)
+            yield self.extract_data_from_list_response(response)
             fetched_pages += 1
 
-        return users
+    def fetch_page(self, page_number, page_size):
+        # Tracker steps are collected and saved afterwards, so this doesn't touch
+        # the database and can run in a thread
+        integration = copy.copy(self.integration)
+        integration.params = self.integration.params | {
+            "PAGE_NUMBER": page_number,
+            "PAGE_OFFSET": (page_number - 1) * page_size,
+        }
+        integration.tracker = IntegrationTracker()
+        integration.pending_tracker_steps = []
+        success, response = integration.run_request(
+            {"method": "GET", "url": self.integration.manifest["page_url"]}
+        )
+        return success, response, integration.pending_tracker_steps
+
+    def budget_exceeded(self, reason):
+        # Stopping halfway would silently leave out users, so this fails the fetch
+        tracker = getattr(self.integration, "tracker", None)
+        if tracker is not None and tracker.pk is not None:
+            IntegrationTrackerStep.objects.create(
+                tracker=tracker,
+                status_code=0,
+                json_response={},
+                text_response="",
+                url=self.integration.manifest["page_url"],
+                method="GET",
+                post_data={},
+                headers={},
+                expected="",
+                error=reason,
+            )
+        Notification.objects.create(
+            notification_type=Notification.Type.FAILED_INTEGRATION,
+            extra_text=self.integration.name,
+            description=reason,
+        )
+        raise FetchBudgetExceededError(reason)
+
+    def iter_numbered_pages(self, page_size):
+        # Pages are built from a page number or offset, so multiple pages can be
+        # fetched at the same time. Stops at the first page without users.
+        manifest = self.integration.manifest
+        page_size = manifest.get("page_size") or page_size
+        concurrent_pages = max(manifest.get("concurrent_pages") or 4, 1)
+        # No maximum amount of pages unless it's set, the budget limits it instead
+        amount_pages_to_fetch = manifest.get("amount_pages_to_fetch")
+        tracker = getattr(self.integration, "tracker", None)
+
+        if page_size == 0:
+            return
+
+        budget = FetchBudget()
+        page_number = 2
+        with ThreadPoolExecutor(max_workers=concurrent_pages) as executor:
+            while True:
+                reason = budget.exceeded()
+                if reason is not None:
+                    self.budget_exceeded(reason)
+
+                page_numbers = [
+                    number
+                    for number in range(page_number, page_number + concurrent_pages)
+                    if not amount_pages_to_fetch or number <= amount_pages_to_fetch
+                ]
+                if not page_numbers:
+                    return
+
+                started = time.monotonic()
+                if len(page_numbers) == 1:
+                    results = [self.fetch_page(page_numbers[0], page_size)]
+                else:
+                    # Results are returned in the order of the pages
+                    results = list(
+                        executor.map(
+                            in_thread(
+                                lambda number: self.fetch_page(number, page_size)
+                            ),
+                            page_numbers,
+                        )
+                    )
+                budget.add_time(time.monotonic() - started)
+
+                if tracker is not None and tracker.pk is not None:
+                    steps = [step for result in results for step in result[2]]
+                    for step in steps:
+                        step.tracker = tracker
+                    IntegrationTrackerStep.objects.bulk_create(steps)
+
+                for success, response, _steps in results:
+                    if not success:
+                        raise FailedPaginatedResponseError(
+                            _("Paginated URL fetch: %(response)s")
+                            % {"response": self.integration.clean_response(response)}
+                        )
+                    budget.add(response)
+
+                    try:
+                        users = self.extract_data_from_list_response(response)
+                    except KeyIsNotInDataError:
+                        return
+                    if not users:
+                        return
+                    yield users
+
+                page_number += len(page_numbers)
+
+    def get_data_from_paginated_response(self):
+        return [user for page in self.iter_pages() for user in page]
+
+
+class FetchBudget:
+    """
+    Limits how long fetching numbered pages can take and how much data can be
+    fetched, so fetching a large directory can't run into timeouts or run out of
+    memory. Only the time spent on requests counts, not processing the users.
+    """
+
+    def __init__(self):
+        self.fetch_time = 0
+        self.fetched_bytes = 0
+
+    def add_time(self, duration):
+        self.fetch_time += duration
+
+    def add(self, response):
+        content = getattr(response, "content", b"")
+        if isinstance(content, (bytes, str)):
+            self.fetched_bytes += len(content)
+
+    def exceeded(self):
+        # Returns the reason when the budget has been used
+        if self.fetch_time > settings.INTEGRATION_PAGES_TIME_BUDGET:
+            return _(
+                "Fetching pages took longer than %(seconds)s seconds, not all users "
+                "have been fetched"
+            ) % {"seconds": settings.INTEGRATION_PAGES_TIME_BUDGET}
+        if self.fetched_bytes > settings.INTEGRATION_PAGES_BYTE_BUDGET:
+            return _(
+                "Fetched more than %(bytes)s bytes of pages, not all users have "
+                "been fetched"
+            ) % {"bytes": settings.INTEGRATION_PAGES_BYTE_BUDGET}
+        return None
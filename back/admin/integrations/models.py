@@ -3,16 +3,17 @@ import io
 import json
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from json.decoder import JSONDecodeError as NativeJSONDecodeError
 
-import requests
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
-from django.template import Context, Template
+from django.template import Context
 from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
@@ -37,13 +38,26 @@ from twilio.rest import Client
 
 from admin.integrations.exceptions import PritunlMissingCredentialsError
 from admin.integrations.helpers.pritunl import pritunl_headers
+from admin.integrations.manifest import (
+    CompiledRequest,
+    compile_headers,
+    encode_basic_auth,
+    get_compiled_manifest,
+    manifest_hash,
+)
+from admin.integrations.redactor import get_redactor
 from admin.integrations.serializers import (
     SyncUsersManifestSerializer,
     WebhookManifestSerializer,
 )
-from admin.integrations.utils import get_value_from_notation
+from admin.integrations.sessions import session_pool
+from admin.integrations.utils import get_value_from_notation, retry_delay
 from misc.fernet_fields import EncryptedTextField
 from misc.fields import EncryptedJSONField
+from misc.lanes import BULK, INTEGRATIONS, lane
+from misc.task_stats import outbound_request
+from misc.template_cache import template_cache
+from misc.threads import in_thread
 from organization.models import Notification
 from organization.utils import has_manager_or_buddy_tags, send_email_with_notification
 
@@ -62,6 +76,8 @@ class IntegrationTracker(models.Model):
     category = models.IntegerField(choices=Category.choices)
     for_user = models.ForeignKey("users.User", on_delete=models.CASCADE, null=True)
     ran_at = models.DateTimeField(auto_now_add=True)
+    # Progress of syncing users (pages, users, created, updated, skipped, failed)
+    counts = models.JSONField(default=dict, blank=True)
 
     @property
     def ran_execute_block(self):
@@ -91,6 +107,8 @@ class IntegrationTrackerStep(models.Model):
     headers = models.JSONField()
     expected = models.TextField()
     error = models.TextField()
+    # How long the request took, including reading the response
+    duration = models.DurationField(null=True)
 
     @property
     def has_succeeded(self):
@@ -156,6 +174,126 @@ class IntegrationManager(models.Manager):
             .exclude(manifest__schedule__isnull=False)
         )
 
+    def check_user_exists(self, user, integrations, save_result=True, use_cache=True):
+        """
+        Checks if `user` has an account in each of the integrations. The checks run
+        concurrently and the trackers (and results) are saved in bulk afterwards.
+        Recent results are taken from the cache.
+
+        Returns {integration: True/False/None}, None if it couldn't be checked.
+        """
+        from users.models import IntegrationUser
+
+        integrations = list(integrations)
+        results = {}
+        to_check = []
+        manual_integrations = [
+            integration
+            for integration in integrations
+            if integration.skip_user_provisioning
+        ]
+        revoked = dict(
+            IntegrationUser.objects.filter(
+                user=user, integration__in=manual_integrations
+            ).values_list("integration_id", "revoked")
+            if manual_integrations
+            else []
+        )
+        for integration in integrations:
+            if integration.skip_user_provisioning:
+                results[integration] = revoked.get(integration.id) is False
+            elif len(integration.manifest.get("exists", [])):
+                to_check.append(integration)
+            else:
+                results[integration] = None
+
+        cached_results = {}
+        if use_cache and to_check:
+            cached = cache.get_many(
+                [integration._user_exists_cache_key(user) for integration in to_check]
+            )
+            for integration in to_check:
+                key = integration._user_exists_cache_key(user)
+                if key in cached:
+                    cached_results[integration] = cached[key]
+            results |= cached_results
+            to_check = [
+                integration for integration in to_check if integration not in results
+            ]
+
+        if not to_check:
+            if save_result and cached_results:
+                IntegrationUser.objects.save_results(user, cached_results)
+            return results
+
+        # Load everything the templates might need in this thread, so the checks
+        # don't have to query for it
+        user.personalize_context  # noqa: B018
+
+        trackers = {
+            integration: IntegrationTracker(
+                category=IntegrationTracker.Category.EXISTS,
+                integration=integration,
+                for_user=user,
+            )
+            for integration in to_check
+        }
+
+        # Tokens are refreshed in this thread, as refreshing locks the integration
+        # and saves it. The threads only make the requests.
+        ready = []
+        for integration in to_check:
+            integration.request_timeout = settings.INTEGRATION_CHECK_TIMEOUT
+            if integration._prepare_exists(user, trackers[integration]):
+                ready.append(integration)
+            else:
+                results[integration] = None
+
+        def check(integration):
+            return integration._request_exists()
+
+        max_workers = min(settings.INTEGRATION_CHECK_WORKERS, len(ready))
+        if max_workers <= 1:
+            results |= {integration: check(integration) for integration in ready}
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results |= dict(
+                    zip(
+                        ready,
+                        executor.map(in_thread(check), ready),
+                    )
+                )
+
+        IntegrationTracker.objects.bulk_create(trackers.values())
+        IntegrationTrackerStep.objects.bulk_create(
+            [
+                step
+                for integration in to_check
+                for step in integration.pending_tracker_steps
+            ]
+        )
+        # The trackers are saved now, any new steps can be saved directly
+        for integration in to_check:
+            integration.pending_tracker_steps = []
+
+        checked = {
+            integration: results[integration]
+            for integration in to_check
+            if results[integration] is not None
+        }
+        if use_cache:
+            cache.set_many(
+                {
+                    integration._user_exists_cache_key(user): exists
+                    for integration, exists in checked.items()
+                },
+                settings.INTEGRATION_EXISTS_CACHE_TIMEOUT,
+            )
+        if save_result:
+            IntegrationUser.objects.save_results(user, cached_results | checked)
+
+        return results
+
 
 class IntegrationInactiveManager(models.Manager):
     def get_queryset(self):
@@ -167,6 +305,11 @@ class Integration(models.Model):
         SLACK_BOT = 0, _("Slack bot")
         CUSTOM = 10, _("Custom")
 
+    class CircuitState(models.TextChoices):
+        CLOSED = "closed", _("Working")
+        OPEN = "open", _("Failing")
+        HALF_OPEN = "half_open", _("Recovering")
+
     class ManifestType(models.IntegerChoices):
         WEBHOOK = 0, _("Provision user accounts or trigger webhooks")
         SYNC_USERS = 1, _("Sync users")
@@ -199,6 +342,10 @@ class Integration(models.Model):
     extra_args = EncryptedJSONField(default=dict)
     enabled_oauth = models.BooleanField(default=False)
 
+    # Circuit breaker, new executions are held back while the integration is failing
+    failed_executions = models.PositiveIntegerField(default=0)
+    circuit_opened_at = models.DateTimeField(null=True, blank=True)
+
     # Slack
     app_id = models.CharField(max_length=100, default="")
     client_id = models.CharField(max_length=100, default="")
@@ -287,6 +434,7 @@ class Integration(models.Model):
                     schedule_type=Schedule.CRON,
                     cron=schedule_cron,
                     name=self.schedule_name,
+                    cluster=lane(BULK),
                 )
             return
 
@@ -296,8 +444,9 @@ class Integration(models.Model):
             return
 
         # if schedule changed, then update
-        if schedule_obj.cron != schedule_cron:
+        if schedule_obj.cron != schedule_cron or schedule_obj.cluster != lane(BULK):
             schedule_obj.cron = schedule_cron
+            schedule_obj.cluster = lane(BULK)
             schedule_obj.save()
 
     def register_manual_integration_run(self, user):
@@ -308,6 +457,7 @@ class Integration(models.Model):
             integration=self,
             defaults={"revoked": user.is_offboarding},
         )
+        self.clear_user_exists_cache(user)
 
     def cast_to_json(self, value):
         try:
@@ -317,10 +467,27 @@ class Integration(models.Model):
 
         return value
 
+    def compile_manifest(self):
+        # Binds the compiled version of the manifest to this instance. Done once per
+        # run, so changes to the manifest are picked up by the next one.
+        self.compiled_manifest = get_compiled_manifest(self.id, self.manifest)
+        self.compiled_requests = self.compiled_manifest.bind(self.manifest)
+        return self.compiled_manifest
+
+    def _compiled_request(self, data):
+        item, compiled = getattr(self, "compiled_requests", {}).get(
+            id(data), (None, None)
+        )
+        if item is not data:
+            # Not part of the manifest (or not compiled yet)
+            compiled = CompiledRequest(data)
+        return compiled
+
     def run_request(self, data):
-        url = self._replace_vars(data["url"])
-        if "data" in data:
-            post_data = self._replace_vars(json.dumps(data["data"]))
+        request = self._compiled_request(data)
+        url = self._replace_vars(request.url)
+        if request.data is not None:
+            post_data = self._replace_vars(request.data)
         else:
             post_data = {}
         if data.get("cast_data_to_json", True):
@@ -336,38 +503,39 @@ class Integration(models.Model):
             except KeyError:
                 error = f"{file_name} could not be found in the locally saved files"
                 if hasattr(self, "tracker"):
-                    IntegrationTrackerStep.objects.create(
+                    self._add_tracker_step(
                         status_code=0,
-                        tracker=self.tracker,
                         json_response={},
                         text_response=error,
                         url=self.clean_response(url),
                         method=data.get("method", "POST"),
-                        post_data=json.loads(
-                            self.clean_response(self.cast_to_json(post_data))
+                        post_data=self.redactor.redact_data(
+                            self.cast_to_json(post_data)
                         ),
-                        headers=json.loads(
-                            self.clean_response(self.headers(data.get("headers", {})))
+                        headers=self.redactor.redact_data(
+                            self._render_headers(request.headers)
                         ),
                         error=error,
                     )
                 return False, error
 
         response = None
-        headers = self.headers(data.get("headers", {}))
+        headers = self._render_headers(request.headers)
+        started = time.monotonic()
         try:
             if data.get("extra_headers", "") == "pritunl":
                 headers.update(
                     pritunl_headers(data.get("method", "POST"), url, self.extra_args)
                 )
-            response = requests.request(
-                data.get("method", "POST"),
-                url,
-                headers=headers,
-                data=post_data,
-                files=files_to_send,
-                timeout=120,
-            )
+            with outbound_request():
+                response = session_pool.get(self.id, url).request(
+                    data.get("method", "POST"),
+                    url,
+                    headers=headers,
+                    data=post_data,
+                    files=files_to_send,
+                    timeout=getattr(self, "request_timeout", 120),
+                )
         except PritunlMissingCredentialsError as e:
             error = str(e)
 
@@ -395,6 +563,8 @@ class Integration(models.Model):
         except:  # noqa E722
             error = "There was an unexpected error with the request"
 
+        duration = timedelta(seconds=time.monotonic() - started)
+
         if response is not None and error == "":
             if len(data.get("status_code", [])) and str(
                 response.status_code
@@ -412,28 +582,10 @@ class Integration(models.Model):
                 text_response = response.text
 
         if hasattr(self, "tracker"):
-            # TODO: JSON needs to be refactored
-            try:
-                json_payload = json.loads(self.clean_response(json_response))
-            except (NativeJSONDecodeError, TypeError):
-                json_payload = self.clean_response(json_response)
-
-            try:
-                json_post_payload = json.loads(
-                    self.clean_response(self.cast_to_json(post_data))
-                )
-            except (NativeJSONDecodeError, TypeError):
-                json_post_payload = self.clean_response(self.cast_to_json(post_data))
-
-            try:
-                json_headers_payload = json.loads(self.clean_response(headers))
-            except (NativeJSONDecodeError, TypeError):
-                json_headers_payload = self.clean_response(headers)
-
-            IntegrationTrackerStep.objects.create(
+            redactor = self.redactor
+            self._add_tracker_step(
                 status_code=0 if response is None else response.status_code,
-                tracker=self.tracker,
-                json_response=json_payload,
+                json_response=redactor.redact_data(json_response),
                 text_response=(
                     "Cannot display, could be file"
                     if data.get("save_as_file", False)
@@ -441,10 +593,11 @@ class Integration(models.Model):
                 ),
                 url=self.clean_response(url),
                 method=data.get("method", "POST"),
-                post_data=json_post_payload,
-                headers=json_headers_payload,
-                expected=self._replace_vars(data.get("expected", "")),
+                post_data=redactor.redact_data(self.cast_to_json(post_data)),
+                headers=redactor.redact_data(headers),
+                expected=self._replace_vars(request.expected),
                 error=self.clean_response(error),
+                duration=duration,
             )
 
         if error:
@@ -452,6 +605,20 @@ class Integration(models.Model):
 
         return True, response
 
+    def _add_tracker_step(self, **kwargs):
+        step = IntegrationTrackerStep(tracker=self.tracker, **kwargs)
+        # Trackers that haven't been saved yet get their steps saved in bulk later
+        if self.tracker.pk is None:
+            self.pending_tracker_steps.append(step)
+        else:
+            step.save()
+        return step
+
+    def _last_tracker_step(self):
+        if self.tracker.pk is None:
+            return self.pending_tracker_steps[-1]
+        return self.tracker.steps.last()
+
     def _replace_vars(self, text):
         params = {} if not hasattr(self, "params") else self.params
         if self.pk is not None:
@@ -461,9 +628,7 @@ class Integration(models.Model):
         if hasattr(self, "new_hire") and self.new_hire is not None:
             text = self.new_hire.personalize(text, self.extra_args | params)
             return text
-        t = Template(text)
-        context = Context(self.extra_args | params)
-        text = t.render(context)
+        text = template_cache.render(text, Context(self.extra_args | params))
         return text
 
     @property
@@ -471,29 +636,39 @@ class Integration(models.Model):
         return "oauth" in self.manifest and len(self.manifest.get("oauth", {}))
 
     def headers(self, headers=None):
-        if headers is None:
-            headers = {}
+        return self._render_headers(compile_headers(headers) if headers else None)
+
+    def _render_headers(self, compiled_headers=None):
+        if not compiled_headers:
+            compiled_manifest = getattr(self, "compiled_manifest", None)
+            compiled_headers = (
+                compiled_manifest.headers
+                if compiled_manifest is not None
+                else compile_headers(self.manifest.get("headers", {}))
+            )
 
-        headers = (
-            self.manifest.get("headers", {}).items()
-            if len(headers) == 0
-            else headers.items()
-        )
         new_headers = {}
-        for key, value in headers:
-            # If Basic authentication then swap to base64
-            if key == "Authorization" and value.startswith("Basic"):
-                auth_details = self._replace_vars(value.split(" ", 1)[1])
-                value = "Basic " + base64.b64encode(
-                    auth_details.encode("ascii")
-                ).decode("ascii")
+        for header in compiled_headers:
+            if header.encoded is not None:
+                value = header.encoded
+            elif header.basic_auth:
+                value = encode_basic_auth(self._replace_vars(header.value))
+            else:
+                value = self._replace_vars(header.value)
 
             # Adding an empty string to force to return a string instead of a
             # safestring. Ref: https://github.com/psf/requests/issues/6159
-            new_headers[self._replace_vars(key) + ""] = self._replace_vars(value) + ""
+            new_headers[self._replace_vars(header.key) + ""] = value + ""
         return new_headers
 
-    def user_exists(self, new_hire, save_result=True):
+    def _user_exists_cache_key(self, user):
+        return f"integration_user_exists_{self.id}_{user.id}"
+
+    def clear_user_exists_cache(self, user):
+        if self.pk is not None and user is not None:
+            cache.delete(self._user_exists_cache_key(user))
+
+    def user_exists(self, new_hire, save_result=True, use_cache=True):
         from users.models import IntegrationUser
 
         # check if user has been created manually
@@ -510,32 +685,57 @@ class Integration(models.Model):
         if not len(self.manifest.get("exists", [])):
             return None
 
-        self.tracker = IntegrationTracker.objects.create(
-            category=IntegrationTracker.Category.EXISTS,
-            integration=self,
-            for_user=new_hire,
-        )
+        user_exists = None
+        if use_cache:
+            user_exists = cache.get(self._user_exists_cache_key(new_hire))
+
+        if user_exists is None:
+            tracker = IntegrationTracker.objects.create(
+                category=IntegrationTracker.Category.EXISTS,
+                integration=self,
+                for_user=new_hire,
+            )
+            user_exists = self._run_exists(new_hire, tracker)
+            if user_exists is not None and use_cache:
+                cache.set(
+                    self._user_exists_cache_key(new_hire),
+                    user_exists,
+                    settings.INTEGRATION_EXISTS_CACHE_TIMEOUT,
+                )
+
+        if user_exists is not None and save_result:
+            IntegrationUser.objects.update_or_create(
+                integration=self,
+                user=new_hire,
+                defaults={"revoked": not user_exists},
+            )
 
+        return user_exists
+
+    def _run_exists(self, new_hire, tracker):
+        # Returns None if the check couldn't be done
+        if not self._prepare_exists(new_hire, tracker):
+            return None
+        return self._request_exists()
+
+    def _prepare_exists(self, new_hire, tracker):
+        # Returns False if the token couldn't be renewed
+        self.compile_manifest()
+        self.tracker = tracker
+        self.pending_tracker_steps = []
         self.new_hire = new_hire
         self.has_user_context = new_hire is not None
 
         # Renew token if necessary
-        if not self.renew_key():
-            return
+        return self.renew_key()
 
+    def _request_exists(self):
         success, response = self.run_request(self.manifest["exists"])
 
         if not success:
             return None
 
-        user_exists = self.tracker.steps.last().found_expected
-
-        if save_result:
-            IntegrationUser.objects.update_or_create(
-                integration=self, user=new_hire, defaults={"revoked": not user_exists}
-            )
-
-        return user_exists
+        return self._last_tracker_step().found_expected
 
     def needs_user_info(self, user):
         if self.skip_user_provisioning:
@@ -554,10 +754,17 @@ class Integration(models.Model):
         return len(form) > 0 or needs_more_info
 
     def revoke_user(self, user):
+        try:
+            return self._revoke_user(user)
+        finally:
+            self.clear_user_exists_cache(user)
+
+    def _revoke_user(self, user):
         if self.skip_user_provisioning:
             # should never be triggered
             return False, "Cannot revoke manual integration"
 
+        self.compile_manifest()
         self.new_hire = user
         self.has_user_context = True
 
@@ -583,37 +790,58 @@ class Integration(models.Model):
 
         return True, ""
 
-    def renew_key(self):
-        # Oauth2 refreshing access token if needed
-        success = True
-        if (
+    def needs_token_refresh(self, ahead=None):
+        # `ahead` refreshes tokens that are about to expire as well
+        return bool(
             self.has_oauth
             and "expires_in" in self.extra_args.get("oauth", {})
-            and self.expiring < timezone.now()
-        ):
-            success, response = self.run_request(self.manifest["oauth"]["refresh"])
+            and self.expiring < timezone.now() + (ahead or timedelta())
+        )
 
-            if not success:
-                user = self.new_hire if self.has_user_context else None
-                Notification.objects.create(
-                    notification_type=Notification.Type.FAILED_INTEGRATION,
-                    extra_text=self.name,
-                    created_for=user,
-                    description="Refresh url: " + str(response),
-                )
-                return success
+    def renew_key(self, ahead=None):
+        # Oauth2 refreshing access token if needed
+        if not self.needs_token_refresh(ahead):
+            return True
 
-            self.extra_args["oauth"] |= response.json()
-            if "expires_in" in response.json():
-                self.expiring = timezone.now() + timedelta(
-                    seconds=response.json()["expires_in"]
-                )
-            self.save(update_fields=["expiring", "extra_args"])
-            if hasattr(self, "tracker"):
-                # we need to clean the last step as we now probably got new secret keys
-                # that need to be masked
-                last_step = self.tracker.steps.last()
-                last_step.json_response = self.clean_response(last_step.json_response)
+        if self.pk is None:
+            return self._refresh_token()
+
+        # Only one refresh at the same time. The refresh token could be rotated, so
+        # others wait for it to finish and then use the new token.
+        with transaction.atomic():
+            locked = Integration.objects.select_for_update().get(pk=self.pk)
+            self.extra_args = locked.extra_args
+            self.expiring = locked.expiring
+            if not self.needs_token_refresh(ahead):
+                # Refreshed while waiting for the lock
+                return True
+            return self._refresh_token()
+
+    def _refresh_token(self):
+        success, response = self.run_request(self.manifest["oauth"]["refresh"])
+
+        if not success:
+            user = self.new_hire if getattr(self, "has_user_context", False) else None
+            Notification.objects.create(
+                notification_type=Notification.Type.FAILED_INTEGRATION,
+                extra_text=self.name,
+                created_for=user,
+                description="Refresh url: " + str(response),
+            )
+            return success
+
+        self.extra_args["oauth"] |= response.json()
+        if "expires_in" in response.json():
+            self.expiring = timezone.now() + timedelta(
+                seconds=response.json()["expires_in"]
+            )
+        self.save(update_fields=["expiring", "extra_args"])
+        if hasattr(self, "tracker"):
+            # we need to clean the last step as we now probably got new secret keys
+            # that need to be masked
+            last_step = self._last_tracker_step()
+            last_step.json_response = self.redactor.redact_data(last_step.json_response)
+            if last_step.pk is not None:
                 last_step.save()
 
         return success
@@ -652,7 +880,16 @@ class Integration(models.Model):
         # if exceeding the max amounts, then fail
         return False, response
 
-    def execute(self, new_hire=None, params=None, retry_on_failure=False):
+    def execute(self, new_hire=None, params=None, retry_on_failure=False, attempt=1):
+        try:
+            return self._execute(new_hire, params, retry_on_failure, attempt)
+        finally:
+            # The account has (probably) been created, don't use an old check
+            self.clear_user_exists_cache(new_hire)
+
+    def _execute(self, new_hire=None, params=None, retry_on_failure=False, attempt=1):
+        self.compile_manifest()
+        self.attempt = attempt
         self.params = params or {}
         self.params["responses"] = []
         self.params["files"] = {}
@@ -669,23 +906,242 @@ class Integration(models.Model):
             self.params |= new_hire.extra_fields
             self.new_hire = new_hire
 
+        if self.circuit_state == Integration.CircuitState.OPEN:
+            return self._hold_execution(params, retry_on_failure)
+
         # Renew token if necessary
         if not self.renew_key():
             return False, None
 
+        self._generate_secrets()
+
+        return self._run_execute(0, params, retry_on_failure)
+
+    def _generate_secrets(self):
         # Add generated secrets
         for item in self.manifest.get("initial_data_form", []):
             if "name" in item and item["name"] == "generate":
                 self.extra_args[item["id"]] = get_random_string(length=10)
 
+    def resume_execute(self, execution):
+        # Continue an execution that was waiting for polling
+        try:
+            return self._resume_execute(execution)
+        finally:
+            self.clear_user_exists_cache(execution.new_hire)
+
+    def _resume_execute(self, execution):
+        self.compile_manifest()
+        self.new_hire = execution.new_hire
+        self.has_user_context = True
+        self.tracker = execution.tracker
+        self.params = execution.state["params"]
+        self.params["files"] = {
+            name: io.BytesIO(base64.b64decode(content))
+            for name, content in execution.state["files"].items()
+        }
+        self.extra_args |= execution.state["generated"]
+        self.attempt = execution.state.get("attempt", 1)
+
+        # Renew token if necessary
+        if not self.renew_key():
+            return False, None
+
+        if execution.waiting_for == IntegrationExecution.WaitingFor.RECOVERY:
+            # Held back before anything was done
+            self._generate_secrets()
+
+        return self._run_execute(
+            execution.step,
+            execution.state["retry_params"],
+            execution.retry_on_failure,
+            tried=execution.tried + 1,
+        )
+
+    def _hold_execution(self, params, retry_on_failure):
+        # The integration is failing, don't add to that. Executions that would be
+        # retried are continued once it recovers.
+        if not (retry_on_failure and self.has_user_context):
+            return False, _("%(name)s is failing at the moment, try again later") % {
+                "name": self.name
+            }
+
+        self._save_execution(
+            0, 0, params, retry_on_failure, IntegrationExecution.WaitingFor.RECOVERY
+        )
+        return None, _("%(name)s is failing, this will continue once it recovers") % {
+            "name": self.name
+        }
+
+    def _schedule_poll(self, step, tried, params, retry_on_failure):
+        execution = self._save_execution(step, tried, params, retry_on_failure)
+        schedule(
+            "admin.integrations.tasks.poll_integration",
+            execution.id,
+            name=(
+                f"Polling integration {self.id} for new hire {self.new_hire.id} "
+                f"({execution.id})"
+            ),
+            next_run=timezone.now()
+            + timedelta(seconds=self.manifest["execute"][step]["polling"]["interval"]),
+            schedule_type=Schedule.ONCE,
+            cluster=lane(INTEGRATIONS),
+        )
+
+    def _save_execution(self, step, tried, params, retry_on_failure, waiting_for=None):
+        generated = {
+            item["id"]: self.extra_args[item["id"]]
+            for item in self.manifest.get("initial_data_form", [])
+            if item.get("name") == "generate" and item["id"] in self.extra_args
+        }
+        return IntegrationExecution.objects.create(
+            integration=self,
+            new_hire=self.new_hire,
+            tracker=self.tracker,
+            step=step,
+            tried=tried,
+            retry_on_failure=retry_on_failure,
+            waiting_for=waiting_for or IntegrationExecution.WaitingFor.POLLING,
+            state={
+                "params": {
+                    key: value for key, value in self.params.items() if key != "files"
+                },
+                "files": {
+                    name: base64.b64encode(file.getvalue()).decode()
+                    for name, file in self.params["files"].items()
+                },
+                "generated": generated,
+                "retry_params": self._retry_params(params),
+                "attempt": getattr(self, "attempt", 1),
+            },
+        )
+
+    def _retry_params(self, params):
+        # files and responses are rebuilt when retrying
+        return {
+            key: value
+            for key, value in (params or {}).items()
+            if key not in ["files", "responses"]
+        }
+
+    def _schedule_retry(self, params):
+        attempt = self.attempt + 1
+        retry_params = self._retry_params(params)
+        name = (
+            f"Retrying integration {self.id} for new hire {self.new_hire.id} "
+            f"({manifest_hash(retry_params)[:8]})"
+        )
+        # Replaces a retry of the same integration, new hire and params that is
+        # waiting
+        Schedule.objects.filter(name=name).delete()
+        schedule(
+            "admin.integrations.tasks.retry_integration",
+            self.new_hire.id,
+            self.id,
+            retry_params,
+            attempt,
+            name=name,
+            next_run=timezone.now() + retry_delay(self.attempt),
+            schedule_type=Schedule.ONCE,
+            cluster=lane(INTEGRATIONS),
+        )
+
+    @property
+    def circuit_state(self):
+        if self.circuit_opened_at is None:
+            return Integration.CircuitState.CLOSED
+        cooldown = timedelta(seconds=settings.INTEGRATION_CIRCUIT_COOLDOWN)
+        if self.circuit_opened_at + cooldown > timezone.now():
+            return Integration.CircuitState.OPEN
+        # Executions are let through again, the first result decides
+        return Integration.CircuitState.HALF_OPEN
+
+    def record_failure(self):
+        if self.pk is None:
+            return
+        Integration.objects.filter(pk=self.pk).update(
+            failed_executions=F("failed_executions") + 1
+        )
+        self.refresh_from_db(fields=["failed_executions", "circuit_opened_at"])
+        state = self.circuit_state
+        if state == Integration.CircuitState.HALF_OPEN or (
+            state == Integration.CircuitState.CLOSED
+            and self.failed_executions >= settings.INTEGRATION_CIRCUIT_FAILURES
+        ):
+            self.open_circuit()
+
+    def record_success(self):
+        if self.pk is None:
+            return
+        Integration.objects.filter(
+            Q(failed_executions__gt=0) | Q(circuit_opened_at__isnull=False),
+            pk=self.pk,
+        ).update(failed_executions=0, circuit_opened_at=None)
+        self.failed_executions = 0
+        self.circuit_opened_at = None
+
+    def open_circuit(self):
+        self.circuit_opened_at = timezone.now()
+        Integration.objects.filter(pk=self.pk).update(
+            circuit_opened_at=self.circuit_opened_at
+        )
+        # Held back executions are continued once it has cooled down
+        self._schedule_drain(
+            self.circuit_opened_at
+            + timedelta(seconds=settings.INTEGRATION_CIRCUIT_COOLDOWN)
+        )
+
+    def _schedule_drain(self, next_run):
+        name = f"Draining integration {self.id}"
+        Schedule.objects.filter(name=name).delete()
+        schedule(
+            "admin.integrations.tasks.drain_integration_backlog",
+            self.id,
+            name=name,
+            next_run=next_run,
+            schedule_type=Schedule.ONCE,
+            cluster=lane(INTEGRATIONS),
+        )
+
+    def drain_backlog(self):
+        # Continues held back executions in batches, stops when it fails again
+        executions = IntegrationExecution.objects.filter(
+            integration=self, waiting_for=IntegrationExecution.WaitingFor.RECOVERY
+        ).order_by("id")
+        for execution in executions[: settings.INTEGRATION_CIRCUIT_DRAIN_BATCH]:
+            self.refresh_from_db(fields=["failed_executions", "circuit_opened_at"])
+            if self.circuit_state == Integration.CircuitState.OPEN:
+                # A new drain has been scheduled when it opened again
+                return
+            execution.resume()
+
+        if executions.exists():
+            self._schedule_drain(
+                timezone.now()
+                + timedelta(seconds=settings.INTEGRATION_CIRCUIT_DRAIN_INTERVAL)
+            )
+
+    def _run_execute(self, start, params, retry_on_failure, tried=1):
+        new_hire = self.new_hire
         response = None
         # Run all requests
-        for item in self.manifest["execute"]:
+        for index, item in enumerate(self.manifest["execute"][start:], start=start):
             success, response = self.run_request(item)
 
             # check if we need to poll before continuing
             if polling := item.get("polling", False):
-                success, response = self._polling(item, response)
+                if not self.has_user_context or self.pk is None:
+                    # Nothing to continue with later, wait for it here
+                    success, response = self._polling(item, response)
+                elif self._check_condition(response, item.get("continue_if")):
+                    success = True
+                elif tried < polling.get("amount"):
+                    # Don't keep the worker busy while waiting, check again later
+                    self._schedule_poll(index, tried, params, retry_on_failure)
+                    return None, _("Waiting for the integration to finish")
+                else:
+                    success = False
+                tried = 1
 
             # check if we need to block this integration based on condition
             if continue_if := item.get("continue_if", False):
@@ -702,6 +1158,7 @@ class Integration(models.Model):
 
             # No need to retry or log when we are importing users
             if not success:
+                self.record_failure()
                 if self.has_user_context:
                     response = self.clean_response(response=response)
                     if polling:
@@ -712,19 +1169,11 @@ class Integration(models.Model):
                         created_for=new_hire,
                         description=f"Execute url ({item['url']}): {response}",
                     )
-                if retry_on_failure:
-                    # Retry url in one hour
-                    schedule(
-                        "admin.integrations.tasks.retry_integration",
-                        new_hire.id,
-                        self.id,
-                        params,
-                        name=(
-                            f"Retrying integration {self.id} for new hire {new_hire.id}"
-                        ),
-                        next_run=timezone.now() + timedelta(hours=1),
-                        schedule_type=Schedule.ONCE,
-                    )
+                if (
+                    retry_on_failure
+                    and self.attempt < settings.INTEGRATION_RETRY_MAX_ATTEMPTS
+                ):
+                    self._schedule_retry(params)
                 return False, response
 
             # save if file, so we can reuse later
@@ -760,6 +1209,8 @@ class Integration(models.Model):
                     self.params[new_hire_prop] = value
                 new_hire.save()
 
+        self.record_success()
+
         # Run all post requests (notifications)
         for item in self.manifest.get("post_execute_notification", []):
             if item["type"] == "email":
@@ -812,6 +1263,10 @@ class Integration(models.Model):
 
         return IntegrationConfigForm(instance=self, data=data)
 
+    @property
+    def redactor(self):
+        return get_redactor(self.extra_args)
+
     def clean_response(self, response) -> str:
         if not isinstance(response, str):
             try:
@@ -819,33 +1274,44 @@ class Integration(models.Model):
             except (TypeError, ValueError):
                 response = str(response)
 
-        for name, value in self.extra_args.items():
-            if isinstance(value, dict):
-                for inner_name, inner_value in value.items():
-                    response = response.replace(
-                        str(inner_value),
-                        _("***Secret value for %(name)s***")
-                        % {"name": name + "." + inner_name},
-                    )
-            elif value != "":
-                response = response.replace(
-                    str(value), _("***Secret value for %(name)s***") % {"name": name}
-                )
-
-            if name == "Authorization" and value.startswith("Basic"):
-                response = response.replace(
-                    base64.b64encode(value.split(" ", 1)[1].encode("ascii")).decode(
-                        "ascii"
-                    ),
-                    "BASE64 ENCODED SECRET",
-                )
-
-        return response
+        return self.redactor.redact(response)
 
     objects = IntegrationManager()
     inactive = IntegrationInactiveManager()
 
 
+class IntegrationExecution(models.Model):
+    # Execution of a manifest that is waiting for a polling request to return the
+    # expected value, or for the integration to recover. Everything that is needed
+    # to continue is stored here.
+    class WaitingFor(models.TextChoices):
+        POLLING = "polling", _("Polling")
+        RECOVERY = "recovery", _("Recovery")
+
+    integration = models.ForeignKey(Integration, on_delete=models.CASCADE)
+    new_hire = models.ForeignKey("users.User", on_delete=models.CASCADE)
+    tracker = models.ForeignKey(IntegrationTracker, on_delete=models.CASCADE)
+    # index of the execute item that is being polled
+    step = models.PositiveIntegerField()
+    tried = models.PositiveIntegerField()
+    retry_on_failure = models.BooleanField(default=False)
+    waiting_for = models.CharField(
+        max_length=20, choices=WaitingFor.choices, default=WaitingFor.POLLING
+    )
+    state = EncryptedJSONField(default=dict)
+
+    def resume(self):
+        # State is loaded into the integration, a new execution will be created if
+        # it needs to wait again
+        self.delete()
+        return self.integration.resume_execute(self)
+
+
 @receiver(post_delete, sender=Integration)
 def delete_schedule(sender, instance, **kwargs):
     Schedule.objects.filter(name=instance.schedule_name).delete()
+
+
+@receiver(post_delete, sender=Integration)
+def close_sessions(sender, instance, **kwargs):
+    session_pool.close(instance.id)
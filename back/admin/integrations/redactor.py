@@ -0,0 +1,93 @@
+import base64
+import json
+import re
+from functools import lru_cache
+
+from django.utils.translation import gettext as _
+
+
+class SecretRedactor:
+    """
+    Replaces secrets in a text, or in a JSON structure, in a single pass. All
+    secrets are combined in one regex, longer secrets take precedence over shorter
+    ones that they contain.
+    """
+
+    def __init__(self, replacements):
+        # {secret: replacement}
+        self.replacements = replacements
+        secrets = sorted(replacements, key=len, reverse=True)
+        self.pattern = (
+            re.compile("|".join(re.escape(secret) for secret in secrets))
+            if secrets
+            else None
+        )
+
+    @staticmethod
+    def replacements_for(extra_args):
+        replacements = {}
+        for name, value in extra_args.items():
+            if isinstance(value, dict):
+                for inner_name, inner_value in value.items():
+                    replacements.setdefault(
+                        str(inner_value),
+                        _("***Secret value for %(name)s***")
+                        % {"name": name + "." + inner_name},
+                    )
+            elif value != "":
+                replacements.setdefault(
+                    str(value), _("***Secret value for %(name)s***") % {"name": name}
+                )
+
+            if (
+                name == "Authorization"
+                and isinstance(value, str)
+                and value.startswith("Basic")
+            ):
+                replacements.setdefault(
+                    base64.b64encode(value.split(" ", 1)[1].encode("ascii")).decode(
+                        "ascii"
+                    ),
+                    "BASE64 ENCODED SECRET",
+                )
+
+        # An empty secret would match everywhere
+        replacements.pop("", None)
+        return replacements
+
+    def _replace(self, match):
+        return self.replacements[match.group(0)]
+
+    def redact(self, text):
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(self._replace, text)
+
+    def redact_data(self, data):
+        # Redacts JSON like data without serializing it
+        if isinstance(data, str):
+            return self.redact(data)
+        if isinstance(data, dict):
+            return {
+                self.redact_data(key): self.redact_data(value)
+                for key, value in data.items()
+            }
+        if isinstance(data, (list, tuple)):
+            return [self.redact_data(item) for item in data]
+        if data is None or isinstance(data, bool):
+            return data
+        if isinstance(data, (int, float)):
+            text = json.dumps(data)
+            redacted = self.redact(text)
+            return data if redacted == text else redacted
+        return self.redact(str(data))
+
+
+@lru_cache(maxsize=128)
+def _get_redactor(replacements):
+    return SecretRedactor(dict(replacements))
+
+
+def get_redactor(extra_args):
+    # Compiled once for every set of secrets (and language)
+    return _get_redactor(tuple(SecretRedactor.replacements_for(extra_args).items()))
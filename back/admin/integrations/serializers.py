@@ -187,6 +187,11 @@ class SyncUsersManifestSerializer(ValidateMixin, serializers.Serializer):
     next_page_token_from = serializers.CharField(required=False)
     next_page = serializers.CharField(required=False)
     next_page_from = serializers.CharField(required=False)
+    page_url = serializers.CharField(required=False, allow_blank=True)
+    page_size = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    concurrent_pages = serializers.IntegerField(
+        required=False, allow_null=True, min_value=1
+    )
     schedule = serializers.CharField(required=False, validators=[validate_cron])
     action = serializers.ChoiceField([("create", "create"), ("update", "update")])
     amount_pages_to_fetch = serializers.IntegerField(required=False)
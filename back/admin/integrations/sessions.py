@@ -0,0 +1,67 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class SessionPool:
+    """
+    Keeps a `requests.Session` per integration and host, so requests to the same
+    host reuse their connections (keep-alive) instead of doing the DNS lookup, TCP
+    and TLS handshake again. Sessions are kept for the lifetime of the process, so
+    all tasks that run in the same worker share them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def _new_session(self):
+        session = requests.Session()
+        # Requests for different users go through the same session, never keep
+        # cookies around
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(
+            pool_maxsize=settings.INTEGRATION_HTTP_POOL_SIZE,
+            # Only retry when we couldn't connect. The request never reached the
+            # server then, so it's safe to do it again for any method.
+            max_retries=Retry(
+                total=settings.INTEGRATION_HTTP_RETRIES,
+                connect=settings.INTEGRATION_HTTP_RETRIES,
+                read=0,
+                status=0,
+                other=0,
+                backoff_factor=0.3,
+            ),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get(self, integration_id, url):
+        url = urlsplit(url)
+        key = (integration_id, url.scheme, url.netloc)
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = self._new_session()
+            return self._sessions[key]
+
+    def close(self, integration_id=None):
+        with self._lock:
+            keys = [
+                key
+                for key in self._sessions
+                if integration_id is None or key[0] == integration_id
+            ]
+            for key in keys:
+                self._sessions.pop(key).close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+session_pool = SessionPool()
@@ -1,13 +1,18 @@
 import logging
+from itertools import batched
 
 from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
 
 from admin.integrations.mixins import PaginatedResponse
-from admin.people.serializers import UserImportSerializer
+from admin.people.serializers import BulkUserImportSerializer
 from organization.models import Organization
 
 logger = logging.getLogger(__name__)
 
+# Amount of users that are checked and saved at once
+CHUNK_SIZE = 500
+
 
 class SyncUsers(PaginatedResponse):
     """
@@ -16,29 +21,61 @@ class SyncUsers(PaginatedResponse):
     2. Updating the users with a specific value.
     These two options can be available through the same manifest and can be scheduled.
     Paginated response is supported.
+
+    Users are processed per page and in chunks, so only a small part of them is kept
+    in memory. Progress is saved on the tracker of the integration.
     """
 
     def __init__(self, integration):
         super().__init__(integration)
-        self.users = self.get_data_from_paginated_response()
+        self.counts = {
+            "pages": 0,
+            "users": 0,
+            "created": 0,
+            "updated": 0,
+            "skipped": 0,
+            "failed": 0,
+        }
+
+    @cached_property
+    def users(self):
+        return list(self.iter_users())
+
+    def iter_users(self):
+        for page in self.iter_pages():
+            self.counts["pages"] += 1
+            self.counts["users"] += len(page)
+            yield from page
+
+    def save_progress(self):
+        tracker = getattr(self.integration, "tracker", None)
+        if tracker is None or tracker.pk is None:
+            return
+        tracker.counts = self.counts
+        tracker.save(update_fields=["counts"])
 
     def run(self):
         action = self.integration.manifest.get("action", "create")
-        if action == "create":
-            new_users = self.get_import_user_candidates()
-            self.create_users(new_users)
-
-        elif action == "update":
-            self.update_users()
-
-    def update_users(self, commit=True):
+        seen_emails = set()
+        for users in batched(self.iter_users(), CHUNK_SIZE):
+            if action == "create":
+                self.create_users(
+                    self.filter_import_user_candidates(users, seen_emails)
+                )
+            elif action == "update":
+                self.update_users(users)
+            self.save_progress()
+
+    def update_users(self, users=None, commit=True):
         # Email param is currently hardcoded, no way to change
-        users_dict = {u["email"]: u for u in self.users}
-        emails = list(users_dict.keys())
+        users = self.users if users is None else users
+        users_dict = {u["email"].lower(): u for u in users if u.get("email")}
 
         if not commit:
             return users_dict
-        user_objects = get_user_model().objects.filter(email__in=emails)
+        user_objects = list(
+            get_user_model().objects.filter(email__in=users_dict.keys())
+        )
         for user in user_objects:
             user_info = users_dict.get(user.email)
             # remove user email attr as we already have that on the instance
@@ -46,46 +83,84 @@ class SyncUsers(PaginatedResponse):
             user.extra_fields.update(user_info)
 
         get_user_model().objects.bulk_update(user_objects, ["extra_fields"])
+        self.counts["updated"] += len(user_objects)
+        self.counts["skipped"] += len(users) - len(user_objects)
 
     def create_users(self, new_users, commit=True):
-        serializer = UserImportSerializer(data=new_users, many=True)
+        # Only keep the valid ones
         valid_ones = []
-
-        if serializer.is_valid():
-            if commit:
-                serializer.save(is_active=False)
+        for user_data in new_users:
+            serializer = BulkUserImportSerializer(data=user_data)
+            if serializer.is_valid():
+                valid_ones.append(serializer.validated_data)
             else:
-                return serializer.validated_data
-        else:
-            # if we have errors, then only get the valid ones
-            for idx, error in enumerate(serializer.errors):
-                if not len(error):
-                    valid_ones.append(new_users[idx])
-                else:
-                    logger.info(
-                        f"Couldn't save {new_users[idx]['email']} due to {error}"
-                    )
-            if not commit:
-                return valid_ones
-
-        # push them again through the function to save the users that did pass
-        if len(valid_ones):
-            self.create_users(valid_ones)
+                self.counts["failed"] += 1
+                logger.info(
+                    f"Couldn't save {user_data['email']} due to {serializer.errors}"
+                )
+
+        if not commit:
+            return valid_ones
+
+        user_model = get_user_model()
+        unique_urls = user_model.objects.unique_urls(len(valid_ones))
+        new_user_objects = [
+            user_model(
+                **(user_data | {"email": user_data["email"].lower()}),
+                unique_url=unique_url,
+                is_active=False,
+            )
+            for user_data, unique_url in zip(valid_ones, unique_urls)
+        ]
+        # Users could have been added in the meantime, skip those
+        user_model.objects.bulk_create(new_user_objects, ignore_conflicts=True)
+        # With conflicts ignored, the rows don't tell what was inserted. Every new
+        # user got a fresh unique url, so those that are there are ours.
+        created = user_model.objects.filter(unique_url__in=unique_urls).count()
+        self.counts["created"] += created
+        self.counts["skipped"] += len(new_user_objects) - created
+
+    def filter_import_user_candidates(self, users, seen_emails=None):
+        # Remove users that are already in the system or have been ignored (or that
+        # showed up earlier in the same sync)
+        seen_emails = set() if seen_emails is None else seen_emails
+        users_by_email = {}
+        for user_data in users:
+            email = (user_data.get("email") or "").lower()
+            # also ignore blank emails
+            if email == "" or email in seen_emails or email in users_by_email:
+                self.counts["skipped"] += 1
+                continue
+            users_by_email[email] = user_data
 
-    def get_import_user_candidates(self):
-        # Remove users that are already in the system or have been ignored
-        existing_user_emails = list(
-            get_user_model().objects.all().values_list("email", flat=True)
-        )
-        ignored_user_emails = Organization.objects.get().ignored_user_emails
         excluded_emails = (
-            existing_user_emails + ignored_user_emails + ["", None]
-        )  # also add blank emails to ignore
+            set(
+                get_user_model()
+                .objects.filter(email__in=users_by_email.keys())
+                .values_list("email", flat=True)
+            )
+            | self.ignored_user_emails
+        )
+
+        candidates = []
+        for email, user_data in users_by_email.items():
+            seen_emails.add(email)
+            if email in excluded_emails:
+                self.counts["skipped"] += 1
+            else:
+                candidates.append(user_data)
+        return candidates
+
+    @cached_property
+    def ignored_user_emails(self):
+        return {
+            email.lower() for email in Organization.objects.get().ignored_user_emails
+        }
 
-        user_candidates = [
+    def get_import_user_candidates(self):
+        seen_emails = set()
+        return [
             user_data
-            for user_data in self.users
-            if user_data.get("email", "") not in excluded_emails
+            for users in batched(self.iter_users(), CHUNK_SIZE)
+            for user_data in self.filter_import_user_candidates(users, seen_emails)
         ]
-
-        return user_candidates
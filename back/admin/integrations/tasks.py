@@ -1,17 +1,51 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
-from admin.integrations.models import Integration
+from admin.integrations.models import Integration, IntegrationExecution
 from admin.integrations.sync_userinfo import SyncUsers
+from misc.lanes import BULK, INTEGRATIONS, in_lane
+from misc.task_stats import count_items
 
 
-def retry_integration(new_hire_id, integration_id, params):
+def retry_integration(new_hire_id, integration_id, params, attempt=2):
     integration = Integration.objects.get(id=integration_id)
     new_hire = get_user_model().objects.get(id=new_hire_id)
-    integration.execute(new_hire, params)
+    integration.execute(new_hire, params, retry_on_failure=True, attempt=attempt)
+
+
+def drain_integration_backlog(integration_id):
+    try:
+        integration = Integration.objects.get(id=integration_id)
+    except Integration.DoesNotExist:
+        return
+    integration.drain_backlog()
+
 
+def poll_integration(execution_id):
+    try:
+        execution = IntegrationExecution.objects.get(id=execution_id)
+    except IntegrationExecution.DoesNotExist:
+        # Integration or user has been removed in the meantime
+        return
+    return execution.resume()
 
+
+@in_lane(BULK)
 def sync_user_info(integration_id):
     # Depending on the manifest, we wil either sync specific info with the current
     # users or we will add new users. This is done in the background.
     integration = Integration.objects.get(id=integration_id)
-    SyncUsers(integration).run()
+    sync = SyncUsers(integration)
+    sync.run()
+    count_items(sync.counts["users"])
+
+
+@in_lane(INTEGRATIONS)
+def refresh_oauth_tokens():
+    # Refresh tokens before they expire, so executions don't have to wait for it
+    ahead = timedelta(seconds=settings.INTEGRATION_OAUTH_REFRESH_AHEAD)
+    for integration in Integration.objects.filter(expiring__lt=timezone.now() + ahead):
+        integration.renew_key(ahead=ahead)
@@ -1,24 +1,38 @@
 import base64
 import json
-from datetime import timedelta
+import threading
+from datetime import UTC, datetime, timedelta
+from email.message import Message
 from unittest.mock import Mock, patch
 
 import pytest
 import requests
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django_q.models import Schedule
 from freezegun import freeze_time
+from requests.cookies import extract_cookies_to_jar
 
+from admin.integrations.exceptions import FetchBudgetExceededError
+from admin.integrations.manifest import CompiledRequest, compiled_manifests
 from admin.integrations.models import (
     Integration,
+    IntegrationExecution,
     IntegrationTracker,
     IntegrationTrackerStep,
 )
+from admin.integrations.sessions import session_pool
 from admin.integrations.sync_userinfo import SyncUsers
+from admin.integrations.tasks import (
+    drain_integration_backlog,
+    poll_integration,
+    refresh_oauth_tokens,
+)
 from admin.integrations.utils import get_value_from_notation
-from organization.models import Notification
+from organization.models import Notification, Organization
 from users.factories import IntegrationUserFactory
 from users.models import IntegrationUser
 
@@ -363,7 +377,7 @@ def test_integration_pritunl_missing_credentials(custom_integration_factory):
 @pytest.mark.django_db
 @freeze_time("2021-01-12")
 @patch(
-    "admin.integrations.models.requests.request",
+    "admin.integrations.sessions.requests.Session.request",
     Mock(return_value=Mock(status_code=200, json=lambda: dict({}))),
 )
 @patch(
@@ -454,7 +468,7 @@ def test_integration_user_exists(
 
     # Didn't find user
     with patch(
-        "admin.integrations.models.requests.request",
+        "admin.integrations.sessions.requests.Session.request",
         Mock(return_value=Mock(status_code=200, json=lambda: [{"error": "not_found"}])),
     ):
         exists = integration.user_exists(new_hire)
@@ -463,9 +477,16 @@ def test_integration_user_exists(
         ).exists()
         assert not exists
 
+    # Result is cached until the account changes
+    with patch("admin.integrations.sessions.requests.Session.request") as mock_request:
+        assert integration.user_exists(new_hire) is False
+        mock_request.assert_not_called()
+
+    integration.clear_user_exists_cache(new_hire)
+
     # Found user
     with patch(
-        "admin.integrations.models.requests.request",
+        "admin.integrations.sessions.requests.Session.request",
         Mock(
             return_value=Mock(status_code=200, json=lambda: [{"user": new_hire.email}])
         ),
@@ -478,10 +499,10 @@ def test_integration_user_exists(
 
     # Error went wrong
     with patch(
-        "admin.integrations.models.requests.request",
+        "admin.integrations.sessions.requests.Session.request",
         side_effect=requests.exceptions.Timeout,
     ):
-        exists = integration.user_exists(new_hire)
+        exists = integration.user_exists(new_hire, use_cache=False)
         assert exists is None
 
     manual_integration = manual_user_provision_integration_factory()
@@ -503,6 +524,243 @@ def test_integration_user_exists(
     assert not manual_integration.user_exists(new_hire)
 
 
+@pytest.mark.django_db
+def test_integration_check_user_exists(
+    settings,
+    new_hire_factory,
+    custom_integration_factory,
+    manual_user_provision_integration_factory,
+):
+    new_hire = new_hire_factory()
+
+    def exists_manifest(path):
+        return {
+            "exists": {
+                "url": "http://localhost:8000/" + path,
+                "method": "GET",
+                "expected": "{{ email }}",
+            }
+        }
+
+    found = custom_integration_factory(manifest=exists_manifest("found"))
+    not_found = custom_integration_factory(manifest=exists_manifest("not_found"))
+    timed_out = custom_integration_factory(manifest=exists_manifest("timeout"))
+    no_exists = custom_integration_factory(manifest={})
+    manual_integration = manual_user_provision_integration_factory()
+    IntegrationUserFactory(user=new_hire, integration=manual_integration)
+
+    def request(method, url, **kwargs):
+        assert kwargs["timeout"] == settings.INTEGRATION_CHECK_TIMEOUT
+        if url.endswith("timeout"):
+            raise requests.exceptions.Timeout
+        if url.endswith("not_found"):
+            return Mock(status_code=200, json=lambda: [{"error": "not_found"}])
+        return Mock(status_code=200, json=lambda: [{"user": new_hire.email}])
+
+    with patch(
+        "admin.integrations.sessions.requests.Session.request", side_effect=request
+    ):
+        results = Integration.objects.check_user_exists(
+            new_hire,
+            [found, not_found, timed_out, no_exists, manual_integration],
+        )
+
+    assert results == {
+        found: True,
+        not_found: False,
+        timed_out: None,
+        no_exists: None,
+        manual_integration: True,
+    }
+
+    # One tracker with one step for every integration that got checked
+    assert IntegrationTracker.objects.filter(for_user=new_hire).count() == 3
+    assert (
+        IntegrationTrackerStep.objects.filter(tracker__for_user=new_hire).count() == 3
+    )
+    assert (
+        IntegrationTrackerStep.objects.get(tracker__integration=timed_out).error
+        == "The request timed out"
+    )
+
+    # Only results of integrations that could be checked are saved
+    assert set(
+        IntegrationUser.objects.filter(user=new_hire).values_list(
+            "integration_id", "revoked"
+        )
+    ) == {
+        (found.id, False),
+        (not_found.id, True),
+        (manual_integration.id, False),
+    }
+
+
+@pytest.mark.django_db
+def test_integration_check_user_exists_refreshes_before_threads(
+    settings, new_hire_factory, custom_integration_factory
+):
+    settings.INTEGRATION_CHECK_WORKERS = 4
+    new_hire = new_hire_factory()
+    integrations = [
+        custom_integration_factory(
+            manifest={
+                "oauth": {
+                    "refresh": {"url": f"http://localhost/{i}/refresh", "method": "GET"}
+                },
+                "exists": {
+                    "url": f"http://localhost/{i}/exists",
+                    "method": "GET",
+                    "expected": "{{ email }}",
+                },
+            },
+            extra_args={"oauth": {"access_token": "abc", "expires_in": 500}},
+            expiring=timezone.now() - timedelta(days=1),
+        )
+        for i in range(3)
+    ]
+
+    threads = {}
+
+    def request(method, url, **kwargs):
+        threads[url] = threading.current_thread()
+        if url.endswith("refresh"):
+            return Mock(
+                status_code=200,
+                json=lambda: {"access_token": "xyz", "expires_in": 500},
+            )
+        return Mock(status_code=200, json=lambda: [{"user": new_hire.email}])
+
+    with patch(
+        "admin.integrations.sessions.requests.Session.request", side_effect=request
+    ):
+        results = Integration.objects.check_user_exists(new_hire, integrations)
+
+    assert results == {integration: True for integration in integrations}
+    # Tokens got refreshed in this thread, only the checks ran in the pool
+    assert {thread for url, thread in threads.items() if url.endswith("refresh")} == {
+        threading.current_thread()
+    }
+    assert len(threads) == 6
+    for integration in integrations:
+        integration.refresh_from_db()
+        assert integration.extra_args["oauth"]["access_token"] == "xyz"
+    # The refresh is tracked with the check
+    assert (
+        IntegrationTrackerStep.objects.filter(tracker__for_user=new_hire).count() == 6
+    )
+
+
+@pytest.mark.django_db
+def test_integration_user_exists_cache_invalidation(
+    new_hire_factory, custom_integration_factory
+):
+    integration = custom_integration_factory()
+    new_hire = new_hire_factory()
+
+    found = Mock(
+        return_value=Mock(status_code=200, json=lambda: [{"user": new_hire.email}])
+    )
+    with patch("admin.integrations.sessions.requests.Session.request", found):
+        assert integration.user_exists(new_hire)
+        assert Integration.objects.check_user_exists(new_hire, [integration]) == {
+            integration: True
+        }
+        assert found.call_count == 1
+        assert IntegrationTracker.objects.filter(for_user=new_hire).count() == 1
+
+    # Revoking clears the cached result
+    integration.manifest = integration.manifest | {"revoke": []}
+    with patch("admin.integrations.sessions.requests.Session.request", found):
+        integration.revoke_user(new_hire)
+        integration.user_exists(new_hire)
+        assert found.call_count == 2
+
+    # Executing clears it as well
+    with patch("admin.integrations.sessions.requests.Session.request", found):
+        integration.execute(new_hire)
+        integration.user_exists(new_hire)
+        # two execute requests and one for the check
+        assert found.call_count == 5
+
+
+@pytest.mark.django_db
+def test_integration_user_exists_without_cache(
+    new_hire_factory, custom_integration_factory
+):
+    integration = custom_integration_factory()
+    new_hire = new_hire_factory()
+
+    found = Mock(
+        return_value=Mock(status_code=200, json=lambda: [{"user": new_hire.email}])
+    )
+    with patch("admin.integrations.sessions.requests.Session.request", found):
+        # Not using the cache, doesn't fill it either
+        assert integration.user_exists(new_hire, use_cache=False)
+        assert Integration.objects.check_user_exists(
+            new_hire, [integration], use_cache=False
+        ) == {integration: True}
+        assert cache.get(integration._user_exists_cache_key(new_hire)) is None
+        assert found.call_count == 2
+
+        # Results from the cache are saved as well
+        assert integration.user_exists(new_hire, save_result=False)
+        IntegrationUser.objects.all().delete()
+        assert integration.user_exists(new_hire)
+        assert IntegrationUser.objects.filter(
+            user=new_hire, integration=integration, revoked=False
+        ).exists()
+
+        IntegrationUser.objects.all().delete()
+        assert Integration.objects.check_user_exists(new_hire, [integration]) == {
+            integration: True
+        }
+        assert IntegrationUser.objects.filter(
+            user=new_hire, integration=integration, revoked=False
+        ).exists()
+        assert found.call_count == 3
+
+
+@pytest.mark.django_db
+def test_integration_session_pool(custom_integration_factory, new_hire_factory):
+    integration = custom_integration_factory()
+    other_integration = custom_integration_factory()
+
+    session = session_pool.get(integration.id, "https://example.com/api/users")
+    # Same integration and host share the session (and connections)
+    assert session_pool.get(integration.id, "https://example.com/teams") is session
+    assert session_pool.get(integration.id, "https://other.com/teams") is not session
+    assert (
+        session_pool.get(other_integration.id, "https://example.com/teams")
+        is not session
+    )
+    # Cookies from responses are never stored, so they can't leak to other users
+    headers = Message()
+    headers["Set-Cookie"] = "session=secret"
+    extract_cookies_to_jar(
+        session.cookies,
+        requests.Request("GET", "https://example.com/api/users").prepare(),
+        Mock(_original_response=Mock(msg=headers)),
+    )
+    assert len(session.cookies) == 0
+
+    # Each step records how long the request took
+    new_hire = new_hire_factory()
+    with patch(
+        "admin.integrations.sessions.requests.Session.request",
+        Mock(
+            return_value=Mock(status_code=200, json=lambda: [{"user": new_hire.email}])
+        ),
+    ):
+        integration.user_exists(new_hire)
+    step = IntegrationTrackerStep.objects.get(tracker__integration=integration)
+    assert step.duration is not None
+
+    # Sessions are closed when the integration is removed
+    integration_id = integration.id
+    integration.delete()
+    assert session_pool.get(integration_id, "https://example.com") is not session
+
+
 @pytest.mark.django_db
 def test_integration_needs_user_info(
     new_hire_factory,
@@ -582,7 +840,7 @@ def test_integration_revoke_user(
 
     # Revoke user successfully
     with patch(
-        "admin.integrations.models.requests.request",
+        "admin.integrations.sessions.requests.Session.request",
         Mock(return_value=Mock(status_code=200, json=lambda: [])),
     ):
         success, error = integration.revoke_user(new_hire)
@@ -591,7 +849,7 @@ def test_integration_revoke_user(
 
     # Revoke user unsuccessfully
     with patch(
-        "admin.integrations.models.requests.request",
+        "admin.integrations.sessions.requests.Session.request",
         side_effect=requests.exceptions.Timeout,
     ):
         success, error = integration.revoke_user(new_hire)
@@ -673,6 +931,143 @@ def test_integration_refresh_token(
         )
 
 
+@pytest.mark.django_db
+def test_integration_refresh_oauth_tokens(custom_integration_factory):
+    manifest = {
+        "oauth": {"refresh": {"url": "http://localhost:8000/test", "method": "GET"}},
+        "initial_data_form": [],
+        "execute": [],
+    }
+    expiring_soon = custom_integration_factory(
+        manifest=manifest,
+        extra_args={"oauth": {"expires_in": 500, "access_token": "old"}},
+    )
+    expiring_soon.expiring = timezone.now() + timedelta(minutes=10)
+    expiring_soon.save()
+    not_expiring = custom_integration_factory(
+        manifest=manifest,
+        extra_args={"oauth": {"expires_in": 500, "access_token": "old"}},
+    )
+    not_expiring.expiring = timezone.now() + timedelta(days=1)
+    not_expiring.save()
+    # Loaded before the token got refreshed
+    stale_integration = Integration.objects.get(id=expiring_soon.id)
+    stale_integration.expiring = timezone.now() - timedelta(days=1)
+
+    refresh_request = Mock(
+        return_value=(
+            True,
+            Mock(json=lambda: {"access_token": "new", "expires_in": 1234}),
+        )
+    )
+    with patch("admin.integrations.models.Integration.run_request", refresh_request):
+        refresh_oauth_tokens()
+
+        # Refreshed ahead of expiring
+        assert refresh_request.call_count == 1
+        expiring_soon.refresh_from_db()
+        assert expiring_soon.extra_args["oauth"]["access_token"] == "new"
+        assert expiring_soon.expiring > timezone.now() + timedelta(minutes=20)
+        not_expiring.refresh_from_db()
+        assert not_expiring.extra_args["oauth"]["access_token"] == "old"
+
+        # Picks up the refreshed token instead of refreshing again
+        assert stale_integration.renew_key()
+        assert refresh_request.call_count == 1
+        assert stale_integration.extra_args["oauth"]["access_token"] == "new"
+
+
+@pytest.mark.django_db
+@override_settings(INTEGRATION_CIRCUIT_FAILURES=2, INTEGRATION_RETRY_MAX_ATTEMPTS=3)
+def test_integration_retry_and_circuit_breaker(
+    client, django_user_model, new_hire_factory, custom_integration_factory
+):
+    client.force_login(
+        django_user_model.objects.create(role=get_user_model().Role.ADMIN)
+    )
+    integration = custom_integration_factory()
+    new_hire = new_hire_factory()
+    retry_name = f"Retrying integration {integration.id} for new hire {new_hire.id}"
+
+    with patch(
+        "admin.integrations.models.Integration.run_request",
+        Mock(return_value=(False, "Server error")),
+    ):
+        # Last attempt, no retry anymore
+        integration.execute(new_hire, {}, retry_on_failure=True, attempt=3)
+        assert not Schedule.objects.filter(name__startswith=retry_name).exists()
+
+        # Retried later, with the next attempt
+        integration.execute(new_hire, {}, retry_on_failure=True)
+        retry = Schedule.objects.get(name__startswith=retry_name)
+        assert retry.func == "admin.integrations.tasks.retry_integration"
+        assert retry.args.endswith("2)")
+        assert (
+            timezone.now() + timedelta(minutes=29)
+            < retry.next_run
+            < timezone.now() + timedelta(minutes=61)
+        )
+
+    integration.refresh_from_db()
+    assert integration.failed_executions == 2
+    assert integration.circuit_state == Integration.CircuitState.OPEN
+
+    # Retries with other params don't replace each other, the same ones do
+    Integration.objects.filter(id=integration.id).update(circuit_opened_at=None)
+    integration.refresh_from_db()
+    with (
+        override_settings(INTEGRATION_CIRCUIT_FAILURES=10),
+        patch(
+            "admin.integrations.models.Integration.run_request",
+            Mock(return_value=(False, "Server error")),
+        ),
+    ):
+        integration.execute(new_hire, {"TEAM": "1"}, retry_on_failure=True)
+        integration.execute(new_hire, {"TEAM": "1"}, retry_on_failure=True)
+        integration.execute(new_hire, {"TEAM": "2"}, retry_on_failure=True)
+    assert Schedule.objects.filter(name__startswith=retry_name).count() == 3
+    Integration.objects.filter(id=integration.id).update(
+        failed_executions=2, circuit_opened_at=timezone.now()
+    )
+    integration.refresh_from_db()
+    assert Schedule.objects.filter(
+        name=f"Draining integration {integration.id}"
+    ).exists()
+
+    response = client.get(reverse("settings:integrations"))
+    assert "Failing" in response.content.decode()
+
+    # New executions are held back while it's failing
+    with patch("admin.integrations.models.Integration.run_request") as mock_request:
+        success, _response = integration.execute(new_hire, {}, retry_on_failure=True)
+        assert success is None
+        success, _response = integration.execute(new_hire, {})
+        assert success is False
+        assert mock_request.call_count == 0
+
+    execution = IntegrationExecution.objects.get()
+    assert execution.waiting_for == IntegrationExecution.WaitingFor.RECOVERY
+
+    # Continued once it works again
+    with (
+        freeze_time(timezone.now() + timedelta(minutes=6)),
+        patch(
+            "admin.integrations.models.Integration.run_request",
+            Mock(return_value=(True, Mock(json=lambda: {}))),
+        ) as mock_request,
+    ):
+        assert integration.circuit_state == Integration.CircuitState.HALF_OPEN
+        drain_integration_backlog(integration.id)
+
+        # Both requests of the manifest
+        assert mock_request.call_count == 2
+
+    assert not IntegrationExecution.objects.exists()
+    integration.refresh_from_db()
+    assert integration.failed_executions == 0
+    assert integration.circuit_state == Integration.CircuitState.CLOSED
+
+
 @pytest.mark.django_db
 def test_integration_send_email(
     client, django_user_model, new_hire_factory, mailoutbox, custom_integration_factory
@@ -783,6 +1178,158 @@ def test_integration_clean_error_data(custom_integration_factory):
     )
 
 
+@pytest.mark.django_db
+def test_integration_redact_data(custom_integration_factory):
+    integration = custom_integration_factory(
+        extra_args={
+            "KEY": "123",
+            "LONG_KEY": "12345",
+            "EMPTY": "",
+            "oauth": {"access_token": "token", "refresh_token": ""},
+            "Authorization": "Basic user:pass",
+        }
+    )
+    redactor = integration.redactor
+    # Compiled once for the same secrets
+    assert integration.redactor is redactor
+
+    assert redactor.redact_data(
+        {
+            "users": [{"id": 12345, "key": "a123b"}, {"id": 7, "token": "token"}],
+            "token": None,
+            "ok": True,
+            "auth": "Basic dXNlcjpwYXNz",
+        }
+    ) == {
+        "users": [
+            {
+                "id": "***Secret value for LONG_KEY***",
+                "key": "a***Secret value for KEY***b",
+            },
+            {
+                "id": 7,
+                "***Secret value for oauth.access_token***": (
+                    "***Secret value for oauth.access_token***"
+                ),
+            },
+        ],
+        "***Secret value for oauth.access_token***": None,
+        "ok": True,
+        "auth": "Basic BASE64 ENCODED SECRET",
+    }
+    # Same result as redacting the serialized data
+    assert integration.clean_response({"id": "x12345x"}) == (
+        '{"id": "x***Secret value for LONG_KEY***x"}'
+    )
+
+    # New secrets get picked up
+    integration.extra_args["KEY"] = "abc"
+    assert integration.clean_response("abc 123") == "***Secret value for KEY*** 123"
+
+
+@pytest.mark.django_db
+def test_integration_compiled_manifest(custom_integration_factory, new_hire_factory):
+    compiled_manifests.clear()
+    integration = custom_integration_factory(
+        extra_args={"ORG": "1", "TEAM_ID": "2", "TOKEN": "abc", "USER": "me"}
+    )
+    new_hire = new_hire_factory()
+
+    # Compiled when it runs
+    assert len(compiled_manifests) == 0
+    compiled = integration.compile_manifest()
+    assert len(compiled_manifests) == 1
+    assert compiled.requests[("execute", 0)].data == json.dumps(
+        {"data": {"user": "{{email}}"}}
+    )
+
+    # Same manifest, same compiled version
+    integration = Integration.objects.get(id=integration.id)
+    assert integration.compile_manifest() is compiled
+
+    integration.new_hire = new_hire
+    integration.params = {}
+    assert integration.headers() == {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "Authorization": "Bearer abc",
+    }
+
+    # Basic auth is encoded once when it doesn't contain variables
+    integration.manifest = integration.manifest | {
+        "headers": {"Authorization": "Basic user:pass"}
+    }
+    integration.save()
+    integration.compile_manifest()
+    assert integration.compiled_manifest is not compiled
+    assert integration.compiled_manifest.headers[0].encoded == "Basic dXNlcjpwYXNz"
+    assert integration.headers() == {"Authorization": "Basic dXNlcjpwYXNz"}
+
+    integration.manifest = integration.manifest | {
+        "headers": {"Authorization": "Basic {{USER}}:pass"}
+    }
+    integration.compile_manifest()
+    assert integration.compiled_manifest.headers[0].encoded is None
+    assert integration.headers() == {"Authorization": "Basic bWU6cGFzcw=="}
+
+    # Requests are rendered from the compiled version
+    with patch(
+        "admin.integrations.sessions.requests.Session.request",
+        Mock(return_value=Mock(status_code=200, json=lambda: {})),
+    ) as mock_request:
+        integration.tracker = IntegrationTracker()
+        integration.pending_tracker_steps = []
+        integration.run_request(integration.manifest["execute"][1])
+
+    assert mock_request.call_args[0] == (
+        "POST",
+        "https://example.com/api/1.0/teams/2/addUser",
+    )
+    assert mock_request.call_args[1]["data"] == {"data": {"user": new_hire.email}}
+
+
+@pytest.mark.django_db
+def test_integration_compiled_manifest_kept_on_refresh(
+    custom_integration_factory, new_hire_factory
+):
+    integration = custom_integration_factory(
+        manifest={
+            "oauth": {"refresh": {"url": "http://localhost/refresh", "method": "GET"}},
+            "execute": [
+                {"url": "http://localhost/1", "method": "POST"},
+                {"url": "http://localhost/2", "method": "POST"},
+            ],
+        },
+        extra_args={"oauth": {"access_token": "abc", "expires_in": 500}},
+        expiring=timezone.now() - timedelta(days=1),
+    )
+    new_hire = new_hire_factory()
+
+    with (
+        patch(
+            "admin.integrations.sessions.requests.Session.request",
+            Mock(
+                return_value=Mock(
+                    status_code=200,
+                    json=lambda: {"access_token": "xyz", "expires_in": 500},
+                )
+            ),
+        ) as mock_request,
+        patch(
+            "admin.integrations.models.CompiledRequest", wraps=CompiledRequest
+        ) as mock_compiled_request,
+    ):
+        success, _ = integration.execute(new_hire)
+
+    assert success
+    # Refreshed and executed both requests
+    assert mock_request.call_count == 3
+    integration.refresh_from_db()
+    assert integration.extra_args["oauth"]["access_token"] == "xyz"
+    # Saving the new token didn't drop the compiled version of the manifest
+    mock_compiled_request.assert_not_called()
+
+
 @pytest.mark.django_db
 # Returns text instead of request object
 @patch(
@@ -991,19 +1538,33 @@ def test_polling_not_getting_correct_state(
             )
         ),
     ) as request_mock:
-        success, _response = integration.execute(new_hire, {})
+        with freeze_time("2022-05-13 10:00:00"):
+            success, _response = integration.execute(new_hire, {})
+
+        # The worker is not kept busy while waiting, the next poll is scheduled
+        assert success is None
+        poll = Schedule.objects.get(func="admin.integrations.tasks.poll_integration")
+        assert poll.next_run == datetime(2022, 5, 13, 10, 0, 0, 100000, tzinfo=UTC)
+
+        success, _response = poll_integration(IntegrationExecution.objects.get().id)
+        assert success is None
+
+        success, _response = poll_integration(IntegrationExecution.objects.get().id)
 
     assert request_mock.call_count == 3
     assert success is False
+    assert not IntegrationExecution.objects.exists()
+    # All requests are logged on the same tracker
+    assert IntegrationTracker.objects.filter(for_user=new_hire).count() == 1
 
 
 @pytest.mark.django_db
 @patch(
-    "requests.request",
+    "requests.Session.request",
     Mock(return_value=Mock(status_code=200, content=b"0123456", json=lambda: dict({}))),
 )
 @patch(
-    "requests.request",
+    "requests.Session.request",
     Mock(return_value=Mock(status_code=201, json=lambda: dict({}))),
 )
 def test_receiving_and_sending_file(new_hire_factory, custom_integration_factory):
@@ -1033,11 +1594,11 @@ def test_receiving_and_sending_file(new_hire_factory, custom_integration_factory
 
 @pytest.mark.django_db
 @patch(
-    "requests.request",
+    "requests.Session.request",
     Mock(return_value=Mock(status_code=200, content=b"0123456", json=lambda: dict({}))),
 )
 @patch(
-    "requests.request",
+    "requests.Session.request",
     Mock(return_value=Mock(status_code=201, json=lambda: dict({}))),
 )
 def test_receiving_and_sending_file_invalid_lookup(
@@ -1109,7 +1670,9 @@ def test_polling_getting_correct_state(new_hire_factory, custom_integration_fact
     )
 
     success, _response = integration.execute(new_hire, {})
+    assert success is None
 
+    success, _response = poll_integration(IntegrationExecution.objects.get().id)
     assert success is True
 
 
@@ -1305,6 +1868,206 @@ def test_integration_sync_data_create_users(
     )
 
 
+@pytest.mark.django_db
+def test_integration_sync_users_in_chunks(new_hire_factory, custom_integration_factory):
+    new_hire_factory(email="existing@chiefonboarding.com")
+    org = Organization.object.get()
+    org.ignored_user_emails = ["Ignored@chiefonboarding.com"]
+    org.save()
+
+    def user(email, first_name="test"):
+        return {"email": email, "firstName": first_name, "lastName": "user"}
+
+    pages = [
+        {
+            "users": [
+                user("new1@chiefonboarding.com"),
+                user("EXISTING@chiefonboarding.com"),
+                user("ignored@chiefonboarding.com"),
+            ],
+            "next": "2",
+        },
+        {
+            "users": [
+                user("new2@chiefonboarding.com"),
+                # showed up on the previous page already
+                user("New1@chiefonboarding.com"),
+                # no first name
+                user("invalid@chiefonboarding.com", first_name=""),
+                user(""),
+            ]
+        },
+    ]
+    integration = custom_integration_factory(
+        manifest_type=Integration.ManifestType.SYNC_USERS,
+        manifest={
+            "execute": [{"url": "http://localhost/"}],
+            "data_from": "users",
+            "action": "create",
+            "data_structure": {
+                "first_name": "firstName",
+                "last_name": "lastName",
+                "email": "email",
+            },
+            "next_page_token_from": "next",
+            "next_page": "http://localhost/?page={{ NEXT_PAGE_TOKEN }}",
+        },
+    )
+
+    with (
+        patch("admin.integrations.sync_userinfo.CHUNK_SIZE", 2),
+        patch(
+            "admin.integrations.sessions.requests.Session.request",
+            Mock(
+                side_effect=[
+                    Mock(status_code=200, json=lambda page=page: page) for page in pages
+                ]
+            ),
+        ),
+    ):
+        SyncUsers(integration).run()
+
+    assert set(
+        get_user_model()
+        .objects.filter(is_active=False)
+        .values_list("email", "first_name")
+    ) == {
+        ("new1@chiefonboarding.com", "test"),
+        ("new2@chiefonboarding.com", "test"),
+    }
+    # unique urls are set for users that are created in bulk as well
+    assert not get_user_model().objects.filter(unique_url="").exists()
+
+    tracker = IntegrationTracker.objects.get(integration=integration)
+    assert tracker.counts == {
+        "pages": 2,
+        "users": 7,
+        "created": 2,
+        "updated": 0,
+        "skipped": 4,
+        "failed": 1,
+    }
+
+
+@pytest.mark.django_db
+def test_integration_sync_users_created_in_the_meantime(
+    new_hire_factory, custom_integration_factory
+):
+    integration = custom_integration_factory(
+        manifest_type=Integration.ManifestType.SYNC_USERS,
+    )
+    sync = SyncUsers(integration)
+    # User got added after the candidates were filtered
+    new_hire_factory(email="existing@chiefonboarding.com")
+
+    sync.create_users(
+        [
+            {
+                "email": "existing@chiefonboarding.com",
+                "first_name": "test",
+                "last_name": "user",
+            },
+            {
+                "email": "new@chiefonboarding.com",
+                "first_name": "test",
+                "last_name": "user",
+            },
+        ]
+    )
+
+    assert get_user_model().objects.filter(email="new@chiefonboarding.com").exists()
+    assert sync.counts["created"] == 1
+    assert sync.counts["skipped"] == 1
+
+
+@pytest.mark.django_db
+def test_integration_sync_users_numbered_pages(custom_integration_factory):
+    integration = custom_integration_factory(
+        manifest_type=Integration.ManifestType.SYNC_USERS,
+        manifest={
+            "execute": [{"url": "http://localhost/users?offset=0", "method": "GET"}],
+            "data_from": "users",
+            "action": "create",
+            "data_structure": {"email": "email"},
+            "page_url": "http://localhost/users?offset={{ PAGE_OFFSET }}",
+            "concurrent_pages": 3,
+        },
+    )
+
+    def request(method, url, **kwargs):
+        # 7 pages with 2 users each
+        offset = int(url.split("=")[1])
+        users = [
+            {"email": f"user{number}@chiefonboarding.com"}
+            for number in range(offset, min(offset + 2, 14))
+        ]
+        return Mock(status_code=200, json=lambda: {"users": users})
+
+    with patch(
+        "admin.integrations.sessions.requests.Session.request", side_effect=request
+    ) as request_mock:
+        users = SyncUsers(integration).get_data_from_paginated_response()
+
+    # Order is kept, even though pages are fetched at the same time
+    assert [user["email"] for user in users] == [
+        f"user{number}@chiefonboarding.com" for number in range(14)
+    ]
+    # First page, then three batches of three pages (the last page is empty)
+    assert request_mock.call_count == 10
+    tracker = IntegrationTracker.objects.get(integration=integration)
+    assert tracker.steps.count() == 10
+
+    # Fails when the budget is used, so a partial import doesn't go unnoticed
+    integration.tracker = IntegrationTracker.objects.create(
+        integration=integration, category=IntegrationTracker.Category.EXECUTE
+    )
+    with (
+        patch(
+            "admin.integrations.sessions.requests.Session.request", side_effect=request
+        ),
+        override_settings(INTEGRATION_PAGES_BYTE_BUDGET=-1),
+        pytest.raises(FetchBudgetExceededError),
+    ):
+        SyncUsers(integration).get_data_from_paginated_response()
+    assert integration.tracker.steps.last().error.startswith("Fetched more than")
+    assert Notification.objects.filter(
+        notification_type=Notification.Type.FAILED_INTEGRATION,
+        extra_text=integration.name,
+    ).exists()
+
+    # Pagination through urls or tokens isn't limited by the budget
+    integration.manifest = {
+        "execute": [{"url": "http://localhost/users?offset=0", "method": "GET"}],
+        "data_from": "users",
+        "action": "create",
+        "data_structure": {"email": "email"},
+        "next_page_from": "next",
+        "amount_pages_to_fetch": 3,
+    }
+
+    def request_with_next(method, url, **kwargs):
+        offset = int(url.split("=")[1])
+        return Mock(
+            status_code=200,
+            json=lambda: {
+                "users": [{"email": f"user{offset}@chiefonboarding.com"}],
+                "next": f"http://localhost/users?offset={offset + 1}",
+            },
+        )
+
+    with (
+        patch(
+            "admin.integrations.sessions.requests.Session.request",
+            side_effect=request_with_next,
+        ),
+        override_settings(
+            INTEGRATION_PAGES_BYTE_BUDGET=-1, INTEGRATION_PAGES_TIME_BUDGET=-1
+        ),
+    ):
+        users = SyncUsers(integration).get_data_from_paginated_response()
+    assert len(users) == 3
+
+
 @pytest.mark.django_db
 def test_integration_tracker(
     client, django_user_model, new_hire_factory, custom_integration_factory
@@ -1325,7 +2088,7 @@ def test_integration_tracker(
 
     # Didn't find user
     with patch(
-        "requests.request",
+        "requests.Session.request",
         Mock(
             return_value=Mock(
                 status_code=200,
@@ -1351,3 +2114,21 @@ def test_integration_tracker(
 
     assert integration.name + " for " + new_hire.full_name in response.content.decode()
     assert "not_found" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_integration_invalid_template_in_manifest(custom_integration_factory):
+    compiled_manifests.clear()
+    integration = custom_integration_factory()
+    integration.manifest = integration.manifest | {
+        "exists": {"url": "http://localhost/{% if %}", "expected": "test"}
+    }
+
+    # Saving doesn't render anything
+    integration.save()
+    integration.refresh_from_db()
+    assert integration.manifest["exists"]["url"] == "http://localhost/{% if %}"
+
+    # Invalid templates are skipped when compiling
+    compiled = integration.compile_manifest()
+    assert compiled.requests[("exists",)].url == "http://localhost/{% if %}"
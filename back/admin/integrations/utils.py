@@ -1,10 +1,22 @@
+import random
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+
+
+@lru_cache(maxsize=1024)
+def split_notation(notation):
+    # Notations come from manifests, so there are only a few different ones
+    return tuple(notation.split("."))
+
+
 def get_value_from_notation(notation, value):
     # if we don't need to go into props, then just return the value
     if notation == "":
         return value
 
-    notations = notation.split(".")
-    for notation in notations:
+    for notation in split_notation(notation):
         try:
             value = value[notation]
         except TypeError:
@@ -27,6 +39,16 @@ def get_value_from_notation(notation, value):
     return value
 
 
+def retry_delay(attempt):
+    # Exponential backoff with jitter, so retries don't all hit the integration at
+    # the same time
+    delay = min(
+        settings.INTEGRATION_RETRY_DELAY * 2 ** (attempt - 1),
+        settings.INTEGRATION_RETRY_MAX_DELAY,
+    )
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
 def convert_array_to_object(arr):
     return {item["key"]: item["value"] for item in arr}
 
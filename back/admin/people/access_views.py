@@ -66,12 +66,16 @@ class UserDeleteView(IsAdminOrNewHireManagerMixin, SuccessMessageMixin, DeleteVi
 class UserRevokeAllAccessView(IsAdminOrNewHireManagerMixin, SuccessMessageMixin, View):
     def post(self, request, *args, **kwargs):
         user = get_object_or_404(get_user_model(), id=self.kwargs.get("pk", -1))
-        for integration in Integration.objects.filter(
-            manifest_type=Integration.ManifestType.WEBHOOK,
-            manifest__revoke__isnull=False,
-            manifest__exists__isnull=False,
-        ):
-            if integration.user_exists(user):
+        results = Integration.objects.check_user_exists(
+            user,
+            Integration.objects.filter(
+                manifest_type=Integration.ManifestType.WEBHOOK,
+                manifest__revoke__isnull=False,
+                manifest__exists__isnull=False,
+            ),
+        )
+        for integration, exists in results.items():
+            if exists:
                 # Any failed attempts will show up as it will refetch all items to
                 # check if the accounts have been deleted. So we can safely ignore
                 # response here
@@ -130,6 +134,9 @@ class UserGiveAccessView(IsAdminOrNewHireManagerMixin, DetailView):
 
             if success:
                 messages.success(request, _("Account has been created"))
+            elif success is None:
+                # Polling, the rest runs in the background
+                messages.info(request, _("Account is being created"))
             else:
                 messages.error(request, _("Account could not be created"))
                 messages.error(request, error)
@@ -195,6 +202,7 @@ class UserToggleAccessView(IsAdminOrNewHireManagerMixin, View):
             )
 
         created = False
+        pending = False
         needs_user_info = integration.needs_user_info(user)
         if integration.user_exists(user):
             success, error = integration.revoke_user(user)
@@ -202,7 +210,12 @@ class UserToggleAccessView(IsAdminOrNewHireManagerMixin, View):
                 created = None
         else:
             success, error = integration.execute(user)
-            created = True
+            if success is None:
+                # Polling, the rest runs in the background
+                pending = True
+                error = None
+            else:
+                created = True
 
         return render(
             request,
@@ -211,6 +224,7 @@ class UserToggleAccessView(IsAdminOrNewHireManagerMixin, View):
                 "object": user,
                 "integration": integration,
                 "active": created,
+                "pending": pending,
                 "error": error,
                 "needs_user_info": needs_user_info,
             },
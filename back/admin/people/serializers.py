@@ -6,3 +6,10 @@ class UserImportSerializer(serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ("first_name", "last_name", "email", "role")
+
+
+class BulkUserImportSerializer(UserImportSerializer):
+    # Existing emails are filtered out beforehand (in bulk), so skip checking every
+    # email against the database
+    class Meta(UserImportSerializer.Meta):
+        extra_kwargs = {"email": {"validators": []}}
@@ -1801,6 +1801,28 @@ def test_new_hire_access_per_integration_toggle(
         assert len(mock_user_execute.mock_calls) == 1
         assert len(mock_revoke_user.mock_calls) == 0
 
+    # Still running in the background (polling), not an error
+    with (
+        patch(
+            "admin.integrations.models.Integration.needs_user_info",
+            Mock(return_value=False),
+        ),
+        patch(
+            "admin.integrations.models.Integration.user_exists",
+            Mock(return_value=False),
+        ),
+        patch(
+            "admin.integrations.models.Integration.execute",
+            Mock(return_value=(None, "Waiting for the integration to finish")),
+        ),
+    ):
+        response = client.post(url)
+
+        content = response.content.decode()
+        assert "Account is being created" in content
+        assert "Request failed with error" not in content
+        assert "Activated" not in content
+
     # create a new account with manual
     assert IntegrationUser.objects.all().count() == 0
     url = reverse("people:toggle_access", args=[new_hire1.id, manual_integration.id])
@@ -2021,14 +2043,21 @@ def test_new_hire_access_revoke(
     new_hire1 = new_hire_factory(email="stan@example.com")
     custom_integration_factory(name="Asana")
     custom_integration_factory(name="Asana1")
-    custom_integration_factory(name="Asana2", manifest={"exists": {}, "revoke": []})
-    custom_integration_factory(name="Asana3", manifest={"exists": {}, "revoke": []})
+    custom_integration_factory(
+        name="Asana2",
+        manifest={"exists": {"url": "https://example.com"}, "revoke": []},
+    )
+    custom_integration_factory(
+        name="Asana3",
+        manifest={"exists": {"url": "https://example.com"}, "revoke": []},
+    )
     manual_user_provision_integration_factory()
 
     url = reverse("people:revoke_all_access", args=[new_hire1.id])
     with (
         patch(
-            "admin.integrations.models.Integration.user_exists", Mock(return_value=True)
+            "admin.integrations.models.Integration._request_exists",
+            Mock(return_value=True),
         ) as mock_user_exists,
         patch(
             "admin.integrations.models.Integration.revoke_user",
@@ -341,11 +341,15 @@ class AddOffboardingSequenceView(AdminPermMixin, SuccessMessageMixin, UpdateView
         employee.conditions.all().delete()
 
         # TODO: should become a background worker at some point
-        for integration in Integration.objects.filter(
-            manifest_type=Integration.ManifestType.WEBHOOK,
-            manifest__exists__isnull=False,
-        ):
-            integration.user_exists(employee)
+        Integration.objects.check_user_exists(
+            employee,
+            Integration.objects.filter(
+                manifest_type=Integration.ManifestType.WEBHOOK,
+                manifest__exists__isnull=False,
+            ),
+            # Decides which accounts get revoked, so don't rely on an earlier check
+            use_cache=False,
+        )
 
         sequences = Sequence.offboarding.filter(id__in=sequence_ids)
         employee.add_sequences(sequences)
@@ -27,66 +27,51 @@ def send_sequence_update_message(all_notifications, new_hire):
     subject = _("Here is an update!")
     blocks = []
 
-    notifications = all_notifications.filter(
-        notification_type=Notification.Type.ADDED_TODO
-    )
-    if notifications.exists():
+    # {notification_type: [item_id, ...]}
+    item_ids = {}
+    for notification in all_notifications:
+        item_ids.setdefault(notification.notification_type, []).append(
+            notification.item_id
+        )
+
+    ids = item_ids.get(Notification.Type.ADDED_TODO, [])
+    if len(ids):
         blocks.append(
             {
                 "type": "paragraph",
                 "data": {
-                    "text": (
-                        _("Todo item")
-                        if notifications.count() == 1
-                        else _("Todo items")
-                    )
+                    "text": (_("Todo item") if len(ids) == 1 else _("Todo items"))
                 },
             }
         )
         text = ""
-        for to_do in ToDo.objects.filter(
-            id__in=notifications.values_list("item_id", flat=True)
-        ):
+        for to_do in ToDo.objects.filter(id__in=ids):
             text += f"- {to_do.name} <br />"
         blocks.append({"type": "quote", "data": {"text": text}})
 
-    notifications = all_notifications.filter(
-        notification_type=Notification.Type.ADDED_RESOURCE
-    )
-    if notifications.exists():
+    ids = item_ids.get(Notification.Type.ADDED_RESOURCE, [])
+    if len(ids):
         blocks.append(
             {
                 "type": "paragraph",
-                "data": {
-                    "text": (
-                        _("Resource") if notifications.count() == 1 else _("Resources")
-                    )
-                },
+                "data": {"text": (_("Resource") if len(ids) == 1 else _("Resources"))},
             }
         )
         text = ""
-        for i in Resource.objects.filter(
-            id__in=notifications.values_list("item_id", flat=True)
-        ):
+        for i in Resource.objects.filter(id__in=ids):
             text += f"- {i.name} <br />"
         blocks.append({"type": "quote", "data": {"text": text}})
 
-    notifications = all_notifications.filter(
-        notification_type=Notification.Type.ADDED_BADGE
-    )
-    if notifications.exists():
+    ids = item_ids.get(Notification.Type.ADDED_BADGE, [])
+    if len(ids):
         blocks.append(
             {
                 "type": "paragraph",
-                "data": {
-                    "text": _("Badge") if notifications.count() == 1 else _("Badges")
-                },
+                "data": {"text": _("Badge") if len(ids) == 1 else _("Badges")},
             }
         )
         text = ""
-        for i in Badge.objects.filter(
-            id__in=notifications.values_list("item_id", flat=True)
-        ):
+        for i in Badge.objects.filter(id__in=ids):
             text += f"- {i.name} <br />"
         blocks.append({"type": "quote", "data": {"text": text}})
 
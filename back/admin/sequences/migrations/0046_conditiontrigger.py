@@ -0,0 +1,125 @@
+# Generated by Django 5.2.17 on 2026-10-18 04:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from admin.sequences.triggers import (
+    offboarding_trigger_date,
+    onboarding_trigger_date,
+    trigger_datetime,
+)
+
+# Condition.Type values
+AFTER = 0
+BEFORE = 2
+# User.Role.NEWHIRE
+NEWHIRE = 0
+
+
+def schedule_condition_triggers(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    Organization = apps.get_model("organization", "Organization")
+    ConditionTrigger = apps.get_model("sequences", "ConditionTrigger")
+
+    org = Organization._default_manager.first()
+    if org is None:
+        return
+
+    triggers = []
+    users = User.objects.filter(
+        conditions__condition_type__in=[AFTER, BEFORE]
+    ).distinct()
+    for user in users:
+        timezone_name = user.timezone if user.timezone != "" else org.timezone
+        for condition in user.conditions.filter(condition_type__in=[AFTER, BEFORE]):
+            if user.termination_date is not None:
+                if condition.condition_type != BEFORE:
+                    continue
+                trigger_date = offboarding_trigger_date(
+                    user.termination_date, condition.days
+                )
+            elif user.role == NEWHIRE and user.start_day is not None:
+                trigger_date = onboarding_trigger_date(
+                    user.start_day,
+                    condition.days,
+                    before=condition.condition_type == BEFORE,
+                )
+            else:
+                continue
+
+            if trigger_date is None:
+                continue
+
+            triggers.append(
+                ConditionTrigger(
+                    user=user,
+                    condition=condition,
+                    fire_at=trigger_datetime(
+                        trigger_date, condition.time, timezone_name
+                    ),
+                )
+            )
+
+    ConditionTrigger.objects.bulk_create(triggers)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sequences", "0045_alter_condition_condition_type"),
+        ("users", "0042_remove_user_requires_otp_remove_user_totp_secret_and_more"),
+        ("organization", "0044_remove_organization_credentials_login_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConditionTrigger",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fire_at", models.DateTimeField()),
+                ("fired", models.BooleanField(default=False)),
+                (
+                    "condition",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="triggers",
+                        to="sequences.condition",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="condition_triggers",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("fired", False)),
+                        fields=["fire_at"],
+                        name="condition_trigger_pending",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "condition"), name="unique_condition_trigger"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(
+            schedule_condition_triggers, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -16,11 +16,13 @@ from admin.preboarding.models import Preboarding
 from admin.resources.models import Resource
 from admin.sequences.emails import send_sequence_message
 from admin.sequences.querysets import ConditionQuerySet
+from admin.sequences.workdays import get_workday_calendar
 from admin.to_do.models import ToDo
 from misc.fields import ContentJSONField, EncryptedJSONField
 from misc.mixins import ContentMixin
 from organization.models import Notification
 from slack_bot.models import SlackChannel
+from slack_bot.outbox import SlackOutbox
 from slack_bot.utils import Slack
 
 
@@ -82,181 +84,175 @@ class Sequence(models.Model):
         return self
 
     def assign_to_user(self, user):
-        # adding conditions
-        for sequence_condition in self.conditions.all():
-            user_condition = None
-
-            # Check what kind of condition it is
-            if sequence_condition.condition_type in [
-                Condition.Type.BEFORE,
-                Condition.Type.AFTER,
-            ]:
-                # Get the timed based condition or return None if not exist
-                user_condition = user.conditions.filter(
-                    condition_type=sequence_condition.condition_type,
-                    days=sequence_condition.days,
-                    time=sequence_condition.time,
-                ).first()
-
-            elif sequence_condition.condition_type == Condition.Type.TODO:
-                # For to_do items, filter all condition items to find if one matches
-                # Both the amount and the todos itself need to match exactly
-                conditions = user.conditions.filter(condition_type=Condition.Type.TODO)
-                original_condition_to_do_ids = (
-                    sequence_condition.condition_to_do.all().values_list(
-                        "id", flat=True
-                    )
-                )
-
-                for condition in conditions:
-                    # Quickly check if the amount of items match - if not match, drop
-                    if condition.condition_to_do.all().count() != len(
-                        original_condition_to_do_ids
-                    ):
-                        continue
-
-                    found_to_do_items = condition.condition_to_do.filter(
-                        id__in=original_condition_to_do_ids
-                    ).count()
-
-                    if found_to_do_items == len(original_condition_to_do_ids):
-                        # We found our match. Amount matches AND the todos match
-                        user_condition = condition
-                        break
-
-            elif sequence_condition.condition_type == Condition.Type.ADMIN_TASK:
-                # For admin to do items, filter all condition items to find if one
-                # matches. Both the amount and the admin to do itself need to match
-                # exactly
-                conditions = user.conditions.filter(
-                    condition_type=Condition.Type.ADMIN_TASK
-                )
-                original_condition_admin_tasks_ids = (
-                    sequence_condition.condition_admin_tasks.all().values_list(
-                        "id", flat=True
-                    )
-                )
-
-                for condition in conditions:
-                    # Quickly check if the amount of items match - if not match, drop
-                    if condition.condition_admin_tasks.all().count() != len(  # noqa
-                        original_condition_admin_tasks_ids
-                    ):
-                        continue
-
-                    found_admin_tasks = condition.condition_admin_tasks.filter(
-                        id__in=original_condition_admin_tasks_ids
-                    ).count()
+        self.assign_to_users([user])
+
+    def assign_to_users(self, users):
+        """
+        Adds the conditions of this sequence to all users at once. Conditions that
+        match an existing condition of a user get merged into that condition, the
+        others get copied to the user. Conditions without a trigger get processed
+        directly.
+        The amount of queries does not depend on the amount of users or conditions,
+        except for items that get executed for every user (admin tasks, messages,
+        integrations and hardware).
+        """
+        from users.models import User
+
+        users = list(users)
+        sequence_conditions = list(self.conditions.all())
+        if not len(users) or not len(sequence_conditions):
+            return
 
-                    if found_admin_tasks == len(original_condition_admin_tasks_ids):
-                        # We found our match. Amount matches AND the admin_tasks match
-                        user_condition = condition
-                        break
+        # {field_name: {condition_id: [item_id, ...]}}
+        sequence_items = Condition.objects.item_ids(
+            [condition.id for condition in sequence_conditions]
+        )
 
-            elif (
-                sequence_condition.condition_type == Condition.Type.INTEGRATIONS_REVOKED
+        # Run the conditions without trigger right away
+        for sequence_condition in sequence_conditions:
+            if sequence_condition.condition_type != Condition.Type.WITHOUT:
+                continue
+            # Skip when there is nothing to process
+            if not any(
+                sequence_items[field].get(sequence_condition.id)
+                for field in Condition.ASSIGNABLE_FIELDS
             ):
-                user_condition = user.conditions.filter(
-                    condition_type=Condition.Type.INTEGRATIONS_REVOKED
-                ).first()
-
-            else:
-                # Condition (always just one) that will be assigned directly (type == 3)
-                # Just run the condition with the new hire
-                sequence_condition.process_condition(user)
                 continue
+            # Slack messages to all users are sent at once afterwards
+            with SlackOutbox():
+                sequence_condition.process_condition_for_users(users)
+
+        # Get the existing conditions of the users to find conditions that match
+        user_conditions = list(
+            User.conditions.through.objects.filter(user__in=users)
+            .exclude(condition__condition_type=Condition.Type.WITHOUT)
+            .select_related("condition")
+            .order_by("condition_id")
+        )
+        trigger_items = Condition.objects.item_ids(
+            [user_condition.condition_id for user_condition in user_conditions],
+            fields=Condition.TRIGGER_FIELDS,
+        )
 
-            # Let's add the condition to the new hire. Either through adding it to the
-            # exising one or creating a new one
-            if user_condition is not None:
-                # adding items to existing condition
-                user_condition.include_other_condition(sequence_condition)
-            else:
-                # duplicating condition and adding to user
-                # Force getting it, as we are about to duplicate it and set the pk to
-                # None
-                old_condition = Condition.objects.get(id=sequence_condition.id)
-
-                sequence_condition.pk = None
-                sequence_condition.sequence = None
-                sequence_condition.save()
-
-                # Add condition to_dos
-                sequence_condition.condition_to_do.set(
-                    old_condition.condition_to_do.all()
+        # {user_id: {condition_key: condition}}
+        matchable_conditions = {user.id: {} for user in users}
+        for user_condition in user_conditions:
+            condition = user_condition.condition
+            key = condition.matching_key(
+                trigger_items["condition_to_do"].get(condition.id, []),
+                trigger_items["condition_admin_tasks"].get(condition.id, []),
+            )
+            matchable_conditions[user_condition.user_id].setdefault(key, condition)
+
+        new_conditions = []
+        # (user condition, sequence condition), items will be copied over to the user
+        # condition
+        merged_conditions = []
+        for user in users:
+            for sequence_condition in sequence_conditions:
+                if sequence_condition.condition_type == Condition.Type.WITHOUT:
+                    continue
+
+                key = sequence_condition.matching_key(
+                    sequence_items["condition_to_do"].get(sequence_condition.id, []),
+                    sequence_items["condition_admin_tasks"].get(
+                        sequence_condition.id, []
+                    ),
                 )
+                user_condition = matchable_conditions[user.id].get(key)
+                if user_condition is None:
+                    # duplicating condition and adding to user
+                    user_condition = Condition(
+                        condition_type=sequence_condition.condition_type,
+                        days=sequence_condition.days,
+                        time=sequence_condition.time,
+                    )
+                    new_conditions.append((user, user_condition, sequence_condition))
+                    # Other conditions of this sequence could be merged into this one
+                    matchable_conditions[user.id][key] = user_condition
+                else:
+                    merged_conditions.append((user_condition, sequence_condition))
 
-                for condition_admin_task in old_condition.condition_admin_tasks.all():
-                    sequence_condition.condition_admin_tasks.add(condition_admin_task)
-                # Add all the things that get triggered
-                sequence_condition.include_other_condition(old_condition)
+        Condition.objects.bulk_create(
+            [user_condition for user, user_condition, seq_condition in new_conditions]
+        )
 
-                # Add newly created condition back to user
-                user.conditions.add(sequence_condition)
+        # New conditions also need the items they get triggered by
+        items_to_add = {field.name: set() for field in Condition._meta.many_to_many}
+        for user, user_condition, sequence_condition in new_conditions:
+            for field in Condition.TRIGGER_FIELDS:
+                for item_id in sequence_items[field].get(sequence_condition.id, []):
+                    items_to_add[field].add((user_condition.id, item_id))
+
+        # Add all the things that get triggered
+        for user_condition, sequence_condition in merged_conditions + [
+            (user_condition, sequence_condition)
+            for user, user_condition, sequence_condition in new_conditions
+        ]:
+            for field in Condition.ASSIGNABLE_FIELDS:
+                for item_id in sequence_items[field].get(sequence_condition.id, []):
+                    items_to_add[field].add((user_condition.id, item_id))
+
+        Condition.objects.add_item_ids(items_to_add)
+
+        # Add newly created conditions back to the users
+        User.conditions.through.objects.bulk_create(
+            [
+                User.conditions.through(user=user, condition=user_condition)
+                for user, user_condition, seq_condition in new_conditions
+            ]
+        )
 
     def remove_from_user(self, new_hire):
-        from admin.admin_tasks.models import AdminTask
+        from users.models import User
 
-        # get all items from all conditions
-        to_dos = ToDo.objects.none()
-        badges = Badge.objects.none()
-        resources = Resource.objects.none()
-        admin_tasks = AdminTask.objects.none()
-        external_messages = ExternalMessage.objects.none()
-        introductions = Introduction.objects.none()
-        preboarding = Preboarding.objects.none()
-        appointments = Appointment.objects.none()
-        integration_configs = IntegrationConfig.objects.none()
-        hardware = Hardware.objects.none()
-
-        # TODO: this is going to make a lot of queries, should be optimized
-        for condition in self.conditions.all():
-            to_dos |= condition.to_do.all()
-            badges |= condition.badges.all()
-            resources |= condition.resources.all()
-            admin_tasks |= condition.admin_tasks.all()
-            external_messages |= condition.external_messages.all()
-            introductions |= condition.introductions.all()
-            preboarding |= condition.preboarding.all()
-            appointments |= condition.appointments.all()
-            integration_configs |= condition.integration_configs.all()
-            hardware |= condition.hardware.all()
-
-        # Cycle through new hire's item and remove the ones that aren't supposed to
-        # be there
-        new_hire.to_do.remove(*to_dos)
-        new_hire.badges.remove(*badges)
-        new_hire.appointments.remove(*appointments)
-        new_hire.preboarding.remove(*preboarding)
-        new_hire.introductions.remove(*introductions)
-        new_hire.hardware.remove(*hardware)
-
-        # Do the same with the conditions
-        conditions_to_be_deleted = []
-        items = {
-            "to_do": to_dos,
-            "resources": resources,
-            "badges": badges,
-            "admin_tasks": admin_tasks,
-            "external_messages": external_messages,
-            "introductions": introductions,
-            "preboarding": preboarding,
-            "appointments": appointments,
-            "integration_configs": integration_configs,
-            "hardware": hardware,
-        }
-        for condition in new_hire.conditions.all():
-            for field in condition._meta.many_to_many:
-                # We only want to remove assigned items, not triggers
-                if field.name in ("condition_to_do", "condition_admin_tasks"):
-                    continue
-                getattr(condition, field.name).remove(*items[field.name])
+        sequence_condition_ids = self.conditions.values("id")
+        user_condition_ids = new_hire.conditions.values("id")
 
-            if condition.is_empty:
-                conditions_to_be_deleted.append(condition.id)
+        def sequence_item_ids(field_name):
+            # Subquery with all items of this type that are part of the sequence
+            field = Condition._meta.get_field(field_name)
+            return field.remote_field.through.objects.filter(
+                **{field.m2m_field_name() + "_id__in": sequence_condition_ids}
+            ).values(field.m2m_reverse_field_name() + "_id")
+
+        # Remove the items that were already assigned to the new hire
+        for field_name in [
+            "to_do",
+            "badges",
+            "appointments",
+            "preboarding",
+            "introductions",
+            "hardware",
+        ]:
+            field = User._meta.get_field(field_name)
+            field.remote_field.through.objects.filter(
+                **{
+                    field.m2m_field_name() + "_id": new_hire.id,
+                    field.m2m_reverse_field_name() + "_id__in": sequence_item_ids(
+                        field_name
+                    ),
+                }
+            ).delete()
+
+        # Do the same with the conditions. We only want to remove assigned items, not
+        # triggers
+        for field_name in Condition.ASSIGNABLE_FIELDS:
+            field = Condition._meta.get_field(field_name)
+            field.remote_field.through.objects.filter(
+                **{
+                    field.m2m_field_name() + "_id__in": user_condition_ids,
+                    field.m2m_reverse_field_name() + "_id__in": sequence_item_ids(
+                        field_name
+                    ),
+                }
+            ).delete()
 
         # Remove all empty conditions
-        Condition.objects.filter(id__in=conditions_to_be_deleted).delete()
+        empty_condition_ids = list(
+            new_hire.conditions.empty().values_list("id", flat=True)
+        )
+        Condition.objects.filter(id__in=empty_condition_ids).delete()
         # Delete sequence
         Notification.objects.order_by("-created").filter(
             notification_type=Notification.Type.ADDED_SEQUENCE
@@ -398,7 +394,11 @@ class ExternalMessage(ContentMixin, models.Model):
             else:
                 channel = self.get_user(user).slack_user_id
 
-            Slack().send_message(blocks=blocks, channel=channel)
+            outbox = SlackOutbox.current()
+            if outbox is None:
+                Slack().send_message(blocks=blocks, channel=channel)
+            else:
+                outbox.send_message(blocks=blocks, channel=channel)
         else:  # text message
             send_to = self.get_user(user)
             if send_to is None or send_to.phone == "":
@@ -673,6 +673,51 @@ class IntegrationConfig(models.Model):
 
 
 class ConditionPrefetchManager(models.Manager):
+    def item_ids(self, condition_ids, fields=None):
+        # Returns the ids of the items that are linked to the conditions, one query
+        # per field: {field_name: {condition_id: [item_id, ...]}}
+        if fields is None:
+            fields = [field.name for field in self.model._meta.many_to_many]
+
+        items = {}
+        for field_name in fields:
+            field = self.model._meta.get_field(field_name)
+            items[field_name] = {}
+            if not len(condition_ids):
+                continue
+
+            condition_column = field.m2m_field_name() + "_id"
+            item_column = field.m2m_reverse_field_name() + "_id"
+            rows = (
+                field.remote_field.through.objects.filter(
+                    **{condition_column + "__in": condition_ids}
+                )
+                .order_by("id")
+                .values_list(condition_column, item_column)
+            )
+            for condition_id, item_id in rows:
+                items[field_name].setdefault(condition_id, []).append(item_id)
+        return items
+
+    def add_item_ids(self, items):
+        # Links items to conditions, one query per field. Expects:
+        # {field_name: [(condition_id, item_id), ...]}. Existing links are ignored.
+        for field_name, rows in items.items():
+            if not len(rows):
+                continue
+
+            field = self.model._meta.get_field(field_name)
+            through = field.remote_field.through
+            condition_column = field.m2m_field_name() + "_id"
+            item_column = field.m2m_reverse_field_name() + "_id"
+            through.objects.bulk_create(
+                [
+                    through(**{condition_column: condition_id, item_column: item_id})
+                    for condition_id, item_id in rows
+                ],
+                ignore_conflicts=True,
+            )
+
     def prefetched(self):
         return (
             self.get_queryset()
@@ -753,6 +798,22 @@ class Condition(models.Model):
     integration_configs = models.ManyToManyField(IntegrationConfig)
     hardware = models.ManyToManyField(Hardware)
 
+    # Items that trigger the condition
+    TRIGGER_FIELDS = ["condition_to_do", "condition_admin_tasks"]
+    # Items that get assigned to the user when the condition is triggered
+    ASSIGNABLE_FIELDS = [
+        "to_do",
+        "badges",
+        "resources",
+        "admin_tasks",
+        "external_messages",
+        "introductions",
+        "preboarding",
+        "appointments",
+        "integration_configs",
+        "hardware",
+    ]
+
     objects = ConditionPrefetchManager.from_queryset(ConditionQuerySet)()
 
     @property
@@ -782,6 +843,19 @@ class Condition(models.Model):
     def based_on_time(self):
         return self.condition_type in [Condition.Type.AFTER, Condition.Type.BEFORE]
 
+    def matching_key(self, condition_to_do_ids, condition_admin_task_ids):
+        # Conditions of a user with the same key get merged into one
+        if self.based_on_time:
+            return (self.condition_type, self.days, self.time)
+        if self.based_on_to_do:
+            # Both the amount and the todos itself need to match exactly
+            return (self.condition_type, frozenset(condition_to_do_ids))
+        if self.based_on_admin_task:
+            # Both the amount and the admin tasks itself need to match exactly
+            return (self.condition_type, frozenset(condition_admin_task_ids))
+        # Integrations revoked, there is only one per user
+        return (self.condition_type,)
+
     def remove_item(self, model_item):
         # If any of the external messages, then get the root one
         if type(model_item)._meta.model_name in [
@@ -879,8 +953,17 @@ class Condition(models.Model):
         return self, admin_tasks
 
     def process_condition(self, user, skip_notification=False):
-        # Loop over all m2m fields and add the ones that can be easily added
-        for field in [
+        # Returns the created notifications
+        return self.process_condition_for_users([user], skip_notification)
+
+    def process_condition_for_users(self, users, skip_notification=False):
+        # Loop over all m2m fields and add the ones that can be easily added. Items
+        # are added in bulk per field for all users at once. Returns the created
+        # notifications.
+        from users.models import User
+
+        notifications = []
+        for field_name in [
             "to_do",
             "resources",
             "badges",
@@ -888,10 +971,35 @@ class Condition(models.Model):
             "introductions",
             "preboarding",
         ]:
-            for item in getattr(self, field).all():
-                getattr(user, field).add(item)
+            items = list(getattr(self, field_name).all())
+            if not len(items):
+                continue
 
-                Notification.objects.create(
+            field = User._meta.get_field(field_name)
+            through = field.remote_field.through
+            user_column = field.m2m_field_name() + "_id"
+            item_column = field.m2m_reverse_field_name() + "_id"
+            # Items that are already assigned won't be added again
+            assigned = set(
+                through.objects.filter(
+                    **{
+                        user_column + "__in": [user.id for user in users],
+                        item_column + "__in": [item.id for item in items],
+                    }
+                ).values_list(user_column, item_column)
+            )
+            new_rows = []
+            for user in users:
+                for item in items:
+                    if (user.id, item.id) not in assigned:
+                        assigned.add((user.id, item.id))
+                        new_rows.append(
+                            through(**{user_column: user.id, item_column: item.id})
+                        )
+            through.objects.bulk_create(new_rows)
+
+            notifications += [
+                Notification(
                     notification_type=item.notification_add_type,
                     extra_text=item.name,
                     created_for=user,
@@ -899,14 +1007,120 @@ class Condition(models.Model):
                     notified_user=skip_notification,
                     public_to_new_hire=True,
                 )
+                for user in users
+                for item in items
+            ]
+
+        notifications = Notification.objects.bulk_create(notifications)
 
         # For the ones that aren't a quick copy/paste, follow back to their model and
         # execute them. It will also add an item to the notification model there.
-        for field in [
-            "admin_tasks",
-            "external_messages",
-            "integration_configs",
-            "hardware",
-        ]:
-            for item in getattr(self, field).all():
+        execute_items = [
+            item
+            for field in [
+                "admin_tasks",
+                "external_messages",
+                "integration_configs",
+                "hardware",
+            ]
+            for item in getattr(self, field).all()
+        ]
+        for user in users:
+            for item in execute_items:
                 item.execute(user)
+
+        return notifications
+
+
+class ConditionTriggerManager(models.Manager):
+    def due(self, start, end):
+        # Timed triggers that should fire between start (exclusive) and end (inclusive).
+        # Only new hires and people that are being offboarded get triggered.
+        from users.models import User
+
+        return (
+            self.get_queryset()
+            .filter(fired=False, fire_at__gt=start, fire_at__lte=end)
+            .filter(
+                models.Q(
+                    user__role=User.Role.NEWHIRE, user__termination_date__isnull=True
+                )
+                | models.Q(user__termination_date__isnull=False)
+            )
+        )
+
+    def schedule(self, users):
+        # Calculates when the timed conditions of the users should trigger, so we
+        # don't have to calculate that for every user every time we check for triggers
+        from organization.models import Organization
+        from users.models import User
+
+        users = list(users)
+        organization = Organization.object.get()
+        organization_timezone = organization.timezone
+        # Same holidays for everyone
+        calendar = get_workday_calendar(organization.holidays)
+        for user in users:
+            user.workday_calendar = calendar
+        users_by_id = {user.id: user for user in users}
+
+        user_conditions = User.conditions.through.objects.filter(
+            user__in=users,
+            condition__condition_type__in=[
+                Condition.Type.BEFORE,
+                Condition.Type.AFTER,
+            ],
+        ).select_related("condition")
+
+        triggers = []
+        for user_condition in user_conditions:
+            user = users_by_id[user_condition.user_id]
+            fire_at = user.get_condition_trigger_datetime(
+                user_condition.condition,
+                user.timezone if user.timezone != "" else organization_timezone,
+            )
+            if fire_at is not None:
+                triggers.append(
+                    self.model(
+                        user=user, condition=user_condition.condition, fire_at=fire_at
+                    )
+                )
+
+        self.filter(user__in=users).delete()
+        self.bulk_create(triggers)
+
+
+class ConditionTrigger(models.Model):
+    """
+    The moment (in UTC) on which a timed condition of a user triggers. These get
+    calculated upfront when a sequence is assigned or when the start date,
+    termination date or timezone of a user changes, so checking which conditions
+    need to be triggered is just one query.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="condition_triggers",
+    )
+    condition = models.ForeignKey(
+        Condition, on_delete=models.CASCADE, related_name="triggers"
+    )
+    fire_at = models.DateTimeField()
+    fired = models.BooleanField(default=False)
+
+    objects = ConditionTriggerManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "condition"], name="unique_condition_trigger"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["fire_at"],
+                condition=models.Q(fired=False),
+                name="condition_trigger_pending",
+            ),
+        ]
@@ -1,5 +1,5 @@
 from django.db import models
-from django.db.models import Case, F, When
+from django.db.models import Case, Exists, F, OuterRef, When
 
 
 class ConditionQuerySet(models.QuerySet):
@@ -14,3 +14,18 @@ class ConditionQuerySet(models.QuerySet):
                 default=F("days"),
             )
         )
+
+    def empty(self):
+        # Conditions that don't have any items left that could be assigned. Done in
+        # a single query, regardless of the amount of conditions.
+        from admin.sequences.models import Condition
+
+        lookups = models.Q()
+        for field_name in Condition.ASSIGNABLE_FIELDS:
+            field = Condition._meta.get_field(field_name)
+            lookups &= ~Exists(
+                field.remote_field.through.objects.filter(
+                    **{field.m2m_field_name() + "_id": OuterRef("pk")}
+                )
+            )
+        return self.filter(lookups)
@@ -1,5 +1,3 @@
-from datetime import timedelta
-
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.utils.translation import gettext as _
@@ -8,7 +6,8 @@ from django_q.tasks import async_task
 from admin.badges.models import Badge
 from admin.introductions.models import Introduction
 from admin.sequences.emails import send_sequence_update_message
-from admin.sequences.models import Condition
+from admin.sequences.models import Condition, ConditionTrigger
+from misc.task_stats import count_items
 from organization.models import Notification, Organization
 from slack_bot.slack_intro import SlackIntro
 from slack_bot.slack_resource import SlackResource
@@ -28,63 +27,77 @@ def process_condition(condition_id, user_id, send_email=True):
 
     condition = Condition.objects.get(id=condition_id)
     user = get_user_model().objects.get(id=user_id)
-    condition.process_condition(user)
-
-    # Send notifications to user
-    notifications = Notification.objects.filter(
-        notification_type__in=[
-            Notification.Type.ADDED_TODO,
-            Notification.Type.ADDED_RESOURCE,
-            Notification.Type.ADDED_BADGE,
-            Notification.Type.ADDED_INTRODUCTION,
-        ],
-        created_for=user,
-        notified_user=False,
+    count_items(len(condition.process_condition(user)))
+
+    # Send notifications to user. This includes the ones that are still pending from
+    # before (e.g. items that were added when the sequence was assigned).
+    notifications = list(
+        Notification.objects.filter(
+            notification_type__in=[
+                Notification.Type.ADDED_TODO,
+                Notification.Type.ADDED_RESOURCE,
+                Notification.Type.ADDED_BADGE,
+                Notification.Type.ADDED_INTRODUCTION,
+            ],
+            created_for=user,
+            notified_user=False,
+        )
     )
 
-    if not notifications.exists():
+    if not len(notifications):
         return
 
     if user.has_slack_account:
-        to_do_blocks = [
-            SlackToDo(
-                ToDoUser.objects.get(to_do__id=notif.item_id, user=user), user
-            ).get_block()
-            for notif in notifications.filter(
-                notification_type=Notification.Type.ADDED_TODO
+        # {notification_type: [item_id, ...]}
+        item_ids = {}
+        for notification in notifications:
+            item_ids.setdefault(notification.notification_type, []).append(
+                notification.item_id
             )
+
+        # Load all items in one query per type
+        to_do_users = {
+            to_do_user.to_do_id: to_do_user
+            for to_do_user in ToDoUser.objects.filter(
+                user=user, to_do__id__in=item_ids.get(Notification.Type.ADDED_TODO, [])
+            ).select_related("to_do")
+        }
+        resource_users = {
+            resource_user.resource_id: resource_user
+            for resource_user in ResourceUser.objects.filter(
+                user=user,
+                resource__id__in=item_ids.get(Notification.Type.ADDED_RESOURCE, []),
+            ).select_related("resource")
+        }
+        badges = Badge.objects.in_bulk(item_ids.get(Notification.Type.ADDED_BADGE, []))
+        intros = Introduction.objects.select_related(
+            "intro_person", "intro_person__profile_image"
+        ).in_bulk(item_ids.get(Notification.Type.ADDED_INTRODUCTION, []))
+
+        to_do_blocks = [
+            SlackToDo(to_do_users[item_id], user).get_block()
+            for item_id in item_ids.get(Notification.Type.ADDED_TODO, [])
         ]
 
         resource_blocks = [
-            SlackResource(
-                ResourceUser.objects.get(user=user, resource__id=notif.item_id), user
-            ).get_block()
-            for notif in notifications.filter(
-                notification_type=Notification.Type.ADDED_RESOURCE
-            )
+            SlackResource(resource_users[item_id], user).get_block()
+            for item_id in item_ids.get(Notification.Type.ADDED_RESOURCE, [])
         ]
 
         badge_blocks = []
-        for notif in notifications.filter(
-            notification_type=Notification.Type.ADDED_BADGE
-        ):
+        for item_id in item_ids.get(Notification.Type.ADDED_BADGE, []):
+            badge = badges[item_id]
             badge_blocks.append(
                 paragraph(
                     _("*Congrats, you unlocked: %(item_name)s *")
-                    % {
-                        "item_name": user.personalize(
-                            Badge.objects.get(id=notif.item_id).name
-                        ),
-                    },
+                    % {"item_name": user.personalize(badge.name)},
                 ),
             )
-            badge_blocks += Badge.objects.get(id=notif.item_id).to_slack_block(user)
+            badge_blocks += badge.to_slack_block(user)
 
         intro_blocks = [
-            SlackIntro(Introduction.objects.get(id=notif.item_id), user).format_block()
-            for notif in notifications.filter(
-                notification_type=Notification.Type.ADDED_INTRODUCTION
-            )
+            SlackIntro(intros[item_id], user).format_block()
+            for item_id in item_ids.get(Notification.Type.ADDED_INTRODUCTION, [])
         ]
 
         if len(to_do_blocks):
@@ -124,7 +137,9 @@ def process_condition(condition_id, user_id, send_email=True):
         send_sequence_update_message(notifications, user)
 
     # Update notifications to not notify user again
-    notifications.update(notified_user=True)
+    Notification.objects.filter(
+        id__in=[notification.id for notification in notifications]
+    ).update(notified_user=True)
 
     # Update user amount completed
     user.update_progress()
@@ -133,14 +148,18 @@ def process_condition(condition_id, user_id, send_email=True):
 def timed_triggers():
     """
     This gets triggered every 5 minutes to trigger conditions within sequences.
-    These conditions are already assigned to new hires.
+    These conditions are already assigned to new hires. The moments on which they
+    should trigger are calculated upfront (see `User.update_condition_triggers`).
     """
-    org = Organization.object.get()
-    if org is None:
+    # Read and updated directly, this changes too often to go through the cached
+    # organization
+    last_updated = Organization.objects.values_list(
+        "timed_triggers_last_check", flat=True
+    ).first()
+    if last_updated is None:
         return
 
     current_datetime = timezone.now()
-    last_updated = org.timed_triggers_last_check
 
     # Round downwards (based on 5 minutes) - check if we might not be on 5/0 anymore.
     # A time of 16 minutes becomes 15
@@ -155,72 +174,52 @@ def timed_triggers():
         minute=last_updated.minute - off_by_minutes, second=0, microsecond=0
     )
 
-    # Generally this loop will only go through once. In the case of an outage, it will
-    # walk through all the 5 minutes that it needs to catch up on based on the last
-    # updated variable
-    while current_datetime > last_updated:
-        last_updated += timedelta(minutes=5)
-        org.timed_triggers_last_check = last_updated
-        org.save()
-
-        for user in get_user_model().new_hires.all():
-            amount_days = user.workday
-            amount_days_before = user.days_before_starting
-            current_time = user.get_local_time(last_updated).time()
-
-            # Get conditions before/after they started
-            # Generally, this should be only one, but just in case, we can handle more
-            conditions = Condition.objects.none()
-            if amount_days == 0:
-                # Before starting
-                conditions = user.conditions.filter(
-                    condition_type=Condition.Type.BEFORE,
-                    days=amount_days_before,
-                    time=current_time,
-                )
-            elif user.get_local_time(last_updated).weekday() < 5:
-                # On workday x
-                conditions = user.conditions.filter(
-                    condition_type=Condition.Type.AFTER,
-                    days=amount_days,
-                    time=current_time,
-                )
+    if current_datetime <= last_updated:
+        return
 
-            # Schedule conditions to be executed with new scheduled task, we do this to
-            # avoid long standing tasks. I.e. sending lots of emails might take more
-            # time.
-            for i in conditions:
-                async_task(
-                    process_condition,
-                    i.id,
-                    user.id,
-                    task_name=f"Process condition: {i.id} for {user.full_name}",
-                )
+    # Generally this will only be the triggers of the last 5 minutes. In the case of an
+    # outage, it will also get all the triggers that it needs to catch up on based on
+    # the last updated variable
+    triggers = list(
+        ConditionTrigger.objects.due(last_updated, current_datetime).select_related(
+            "user"
+        )
+    )
 
-        for user in get_user_model().offboarding.all():
-            amount_days_before = user.days_before_termination_date
-
-            if (
-                amount_days_before == -1
-                or user.get_local_time(last_updated).weekday() > 4  # 5 or 6 is weekend
-            ):
-                # we are past the termination date or in a weekend, move to the next
-                continue
-
-            current_time = user.get_local_time(last_updated).time()
-            conditions = user.conditions.filter(
-                condition_type=Condition.Type.BEFORE,
-                days=amount_days_before,
-                time=current_time,
-            )
+    Organization.objects.update(timed_triggers_last_check=current_datetime)
+    count_items(len(triggers))
 
-            # Schedule conditions to be executed with new scheduled task, we do this to
-            # avoid long standing tasks. I.e. sending lots of emails might take more
-            # time.
-            for i in conditions:
-                async_task(
-                    process_condition,
-                    i.id,
-                    user.id,
-                    task_name=f"Process condition: {i.id} for {user.full_name}",
-                )
+    ConditionTrigger.objects.filter(id__in=[trigger.id for trigger in triggers]).update(
+        fired=True
+    )
+
+    # Schedule conditions to be executed with new scheduled task, we do this to avoid
+    # long standing tasks. I.e. sending lots of emails might take more time.
+    for trigger in triggers:
+        async_task(
+            process_condition,
+            trigger.condition_id,
+            trigger.user_id,
+            task_name=(
+                f"Process condition: {trigger.condition_id} for "
+                f"{trigger.user.full_name}"
+            ),
+        )
+
+
+def update_condition_triggers(all_users=False):
+    """
+    Recalculates when the timed conditions trigger for all users that rely on the
+    timezone of the organization. Triggered when that timezone changes. When the
+    holidays change, it's recalculated for everyone.
+    """
+    users = get_user_model().objects.filter(
+        conditions__condition_type__in=[
+            Condition.Type.BEFORE,
+            Condition.Type.AFTER,
+        ],
+    )
+    if not all_users:
+        users = users.filter(timezone="")
+    users = users.distinct()
+    ConditionTrigger.objects.schedule(users)
@@ -3,7 +3,10 @@ from datetime import timedelta
 from unittest.mock import Mock, patch
 
 import pytest
+from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from freezegun import freeze_time
@@ -38,6 +41,7 @@ from admin.sequences.forms import (
 )
 from admin.sequences.models import (
     Condition,
+    ConditionTrigger,
     ExternalMessage,
     IntegrationConfig,
     PendingAdminTask,
@@ -47,6 +51,7 @@ from admin.sequences.models import (
     Sequence,
 )
 from admin.sequences.tasks import process_condition, timed_triggers
+from admin.sequences.triggers import offboarding_trigger_date, onboarding_trigger_date
 from admin.to_do.factories import ToDoFactory
 from admin.to_do.forms import ToDoForm
 from admin.to_do.models import ToDo
@@ -1289,6 +1294,153 @@ def test_sequence_trigger_two_people_same_time(
     assert new_hire2.to_do.all().count() == 1
 
 
+@pytest.mark.django_db
+@freeze_time("2022-05-13 06:00")
+def test_condition_triggers_get_scheduled(
+    sequence_factory, new_hire_factory, condition_timed_factory
+):
+    # Monday
+    new_hire = new_hire_factory(
+        start_day=datetime.date(2022, 5, 16), timezone="Europe/Amsterdam"
+    )
+
+    seq = sequence_factory()
+    # Third workday, so on Wednesday
+    after_condition = condition_timed_factory(days=3, time="09:00")
+    # Two days before starting, so on Saturday
+    before_condition = condition_timed_factory(
+        days=2, time="10:00", condition_type=Condition.Type.BEFORE
+    )
+    seq.conditions.add(after_condition, before_condition)
+
+    new_hire.add_sequences([seq])
+
+    triggers = ConditionTrigger.objects.filter(user=new_hire).order_by("fire_at")
+    assert triggers.count() == 2
+    # Amsterdam is two hours ahead of UTC
+    assert triggers[0].fire_at == datetime.datetime(
+        2022, 5, 14, 8, 0, tzinfo=datetime.timezone.utc
+    )
+    assert triggers[1].fire_at == datetime.datetime(
+        2022, 5, 18, 7, 0, tzinfo=datetime.timezone.utc
+    )
+
+    # Changing the start day reschedules the triggers
+    new_hire.start_day = datetime.date(2022, 5, 23)
+    new_hire.save()
+
+    triggers = ConditionTrigger.objects.filter(user=new_hire).order_by("fire_at")
+    assert triggers[0].fire_at == datetime.datetime(
+        2022, 5, 21, 8, 0, tzinfo=datetime.timezone.utc
+    )
+    assert triggers[1].fire_at == datetime.datetime(
+        2022, 5, 25, 7, 0, tzinfo=datetime.timezone.utc
+    )
+
+    # Changing the timezone of the organization reschedules users without timezone
+    new_hire.timezone = ""
+    new_hire.save()
+
+    org = Organization.object.get()
+    org.timezone = "America/New_York"
+    org.save()
+
+    triggers = ConditionTrigger.objects.filter(user=new_hire).order_by("fire_at")
+    # New York is four hours behind UTC
+    assert triggers[0].fire_at == datetime.datetime(
+        2022, 5, 21, 14, 0, tzinfo=datetime.timezone.utc
+    )
+    assert triggers[1].fire_at == datetime.datetime(
+        2022, 5, 25, 13, 0, tzinfo=datetime.timezone.utc
+    )
+
+    # Triggers are removed when someone is not a new hire anymore
+    new_hire.role = new_hire.Role.OTHER
+    new_hire.save()
+
+    assert not ConditionTrigger.objects.filter(user=new_hire).exists()
+
+
+@pytest.mark.django_db
+def test_condition_trigger_dates():
+    # Starting on a Monday
+    start_day = datetime.date(2022, 5, 16)
+    assert onboarding_trigger_date(start_day, 1, before=False) == start_day
+    # Skips the weekend
+    assert onboarding_trigger_date(start_day, 6, before=False) == datetime.date(
+        2022, 5, 23
+    )
+    assert onboarding_trigger_date(start_day, 0, before=False) is None
+    # Does not skip the weekend before starting
+    assert onboarding_trigger_date(start_day, 2, before=True) == datetime.date(
+        2022, 5, 14
+    )
+    assert onboarding_trigger_date(start_day, 0, before=True) is None
+    # Starting on a Saturday never triggers the first day
+    assert onboarding_trigger_date(datetime.date(2022, 5, 14), 1, False) is None
+
+    # Last day is a Monday
+    termination_date = datetime.date(2022, 5, 16)
+    assert offboarding_trigger_date(termination_date, 0) == termination_date
+    assert offboarding_trigger_date(termination_date, 1) == datetime.date(2022, 5, 13)
+    # Last day is a Sunday, so the last workday is Friday
+    termination_date = datetime.date(2022, 5, 15)
+    assert offboarding_trigger_date(termination_date, 0) == datetime.date(2022, 5, 13)
+    assert offboarding_trigger_date(termination_date, 1) == datetime.date(2022, 5, 12)
+
+
+@pytest.mark.django_db
+@freeze_time("2022-05-13 12:00")
+def test_timed_triggers_catch_up_after_outage(
+    sequence_factory,
+    new_hire_factory,
+    condition_timed_factory,
+    to_do_factory,
+    django_assert_max_num_queries,
+):
+    org = Organization.object.get()
+    # Last check was three hours ago
+    org.timed_triggers_last_check = timezone.now() - timedelta(hours=3)
+    org.save()
+
+    to_do1 = to_do_factory()
+    to_do2 = to_do_factory()
+    seq = sequence_factory()
+    # Missed during the outage
+    missed_condition = condition_timed_factory(days=1, time="10:00")
+    missed_condition.add_item(to_do1)
+    # Should have been triggered before the outage, so should be ignored
+    old_condition = condition_timed_factory(days=1, time="08:00")
+    old_condition.add_item(to_do2)
+    seq.conditions.add(missed_condition, old_condition)
+
+    new_hires = [new_hire_factory() for i in range(5)]
+    for new_hire in new_hires:
+        new_hire.add_sequences([seq])
+
+    # Not related to the amount of new hires
+    with patch("admin.sequences.tasks.async_task") as mock_async_task:
+        with django_assert_max_num_queries(4):
+            timed_triggers()
+
+    assert mock_async_task.call_count == 5
+
+    timed_triggers()
+    # No new triggers
+    assert ConditionTrigger.objects.filter(fired=True).count() == 5
+
+    for new_hire in new_hires:
+        assert new_hire.to_do.all().count() == 0
+
+    org.timed_triggers_last_check = timezone.now() - timedelta(hours=3)
+    org.save()
+    ConditionTrigger.objects.update(fired=False)
+
+    timed_triggers()
+    for new_hire in new_hires:
+        assert list(new_hire.to_do.all()) == [to_do1]
+
+
 # MODEL TESTS
 
 
@@ -1624,6 +1776,149 @@ def test_sequence_assign_to_user_merge_integrations_revoked_condition(
     assert new_hire.conditions.all().first().to_do.count() == 3
 
 
+@pytest.mark.django_db
+@freeze_time("2022-05-13")
+def test_sequence_assign_to_users_in_bulk(
+    sequence_factory,
+    new_hire_factory,
+    condition_to_do_factory,
+    condition_timed_factory,
+    condition_admin_task_factory,
+    to_do_factory,
+    resource_factory,
+    pending_admin_task_factory,
+    django_assert_max_num_queries,
+):
+    sequence = sequence_factory()
+    timed_condition = condition_timed_factory(sequence=sequence, days=1)
+    # Will be merged into the other timed condition
+    timed_condition2 = condition_timed_factory(sequence=sequence, days=1)
+    to_do_condition = condition_to_do_factory(sequence=sequence)
+    admin_task_condition = condition_admin_task_factory(sequence=sequence)
+    admin_task_condition.condition_admin_tasks.set([pending_admin_task_factory()])
+    for condition in [
+        timed_condition,
+        timed_condition2,
+        to_do_condition,
+        admin_task_condition,
+    ]:
+        condition.to_do.add(to_do_factory(), to_do_factory())
+        condition.resources.add(resource_factory())
+        condition.admin_tasks.add(pending_admin_task_factory())
+
+    new_hires = [new_hire_factory() for i in range(20)]
+    # One of the new hires already has a matching condition
+    new_hires[0].add_sequences([sequence])
+    user_condition = new_hires[0].conditions.get(condition_type=Condition.Type.TODO)
+    user_condition.to_do.clear()
+
+    # The amount of queries is not related to the amount of new hires
+    with django_assert_max_num_queries(30):
+        get_user_model().objects.add_sequences(new_hires, [sequence])
+
+    for new_hire in new_hires:
+        assert new_hire.conditions.count() == 3
+        timed = new_hire.conditions.get(condition_type=Condition.Type.AFTER)
+        assert timed.to_do.count() == 4
+        assert timed.resources.count() == 2
+        assert timed.admin_tasks.count() == 2
+        to_do = new_hire.conditions.get(condition_type=Condition.Type.TODO)
+        assert set(to_do.condition_to_do.all()) == set(
+            to_do_condition.condition_to_do.all()
+        )
+        assert to_do.to_do.count() == 2
+        admin_task = new_hire.conditions.get(condition_type=Condition.Type.ADMIN_TASK)
+        assert set(admin_task.condition_admin_tasks.all()) == set(
+            admin_task_condition.condition_admin_tasks.all()
+        )
+        assert ConditionTrigger.objects.filter(user=new_hire).count() == 1
+
+    # Existing condition got merged and not duplicated
+    assert user_condition.to_do.count() == 2
+    assert (
+        Notification.objects.filter(
+            notification_type=Notification.Type.ADDED_SEQUENCE
+        ).count()
+        == 21
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("amount", [2, 10])
+def test_sequence_assign_to_users_without_condition_query_count(
+    amount,
+    sequence_factory,
+    new_hire_factory,
+    to_do_factory,
+    resource_factory,
+    badge_factory,
+    django_assert_num_queries,
+):
+    sequence = sequence_factory()
+    condition = sequence.conditions.get(condition_type=Condition.Type.WITHOUT)
+    to_dos = [to_do_factory(), to_do_factory()]
+    condition.to_do.add(*to_dos)
+    condition.resources.add(resource_factory())
+    condition.badges.add(badge_factory())
+
+    new_hires = [new_hire_factory() for i in range(amount)]
+    # Already assigned items aren't added twice
+    new_hires[0].to_do.add(to_dos[0])
+
+    # The amount of queries is not related to the amount of new hires
+    with django_assert_num_queries(31):
+        sequence.assign_to_users(new_hires)
+
+    for new_hire in new_hires:
+        assert new_hire.to_do.count() == 2
+        assert new_hire.resources.count() == 1
+        assert new_hire.badges.count() == 1
+    assert (
+        Notification.objects.filter(
+            notification_type=Notification.Type.ADDED_TODO
+        ).count()
+        == amount * 2
+    )
+
+
+@pytest.mark.django_db
+def test_sequence_remove_from_user_query_count(
+    sequence_factory,
+    new_hire_factory,
+    condition_timed_factory,
+    to_do_factory,
+    resource_factory,
+    django_assert_max_num_queries,
+):
+    new_hire = new_hire_factory()
+    sequence1 = sequence_factory()
+    sequence2 = sequence_factory()
+    to_do_to_keep = to_do_factory()
+    condition = condition_timed_factory(sequence=sequence1, days=1)
+    condition.to_do.add(to_do_to_keep)
+
+    to_dos = []
+    for day in range(1, 11):
+        condition = condition_timed_factory(sequence=sequence2, days=day)
+        to_do = to_do_factory()
+        to_dos.append(to_do)
+        condition.to_do.add(to_do)
+        condition.resources.add(resource_factory())
+
+    new_hire.add_sequences([sequence1, sequence2])
+    new_hire.to_do.add(to_dos[0], to_do_to_keep)
+
+    assert new_hire.conditions.count() == 10
+
+    # Amount of queries doesn't depend on the amount of conditions/items
+    with django_assert_max_num_queries(40):
+        new_hire.remove_sequence(sequence2)
+
+    assert new_hire.conditions.count() == 1
+    assert list(new_hire.conditions.first().to_do.all()) == [to_do_to_keep]
+    assert list(new_hire.to_do.all()) == [to_do_to_keep]
+
+
 @pytest.mark.django_db
 def test_sequence_add_unconditional_item(
     sequence_factory,
@@ -2059,6 +2354,43 @@ def test_condition_is_empty(condition_to_do_factory, to_do_factory):
     assert not condition.is_empty
 
 
+@pytest.mark.django_db
+def test_condition_process_condition_in_bulk(
+    condition_to_do_factory,
+    new_hire_factory,
+    to_do_factory,
+    resource_factory,
+    badge_factory,
+    django_assert_max_num_queries,
+):
+    condition = condition_to_do_factory()
+    new_hire = new_hire_factory()
+    to_dos = to_do_factory.create_batch(10)
+    condition.to_do.add(*to_dos)
+    condition.resources.add(*resource_factory.create_batch(10))
+    condition.badges.add(badge_factory())
+    # Already assigned items don't get added twice
+    new_hire.to_do.add(to_dos[0])
+
+    # Amount of queries doesn't depend on the amount of items
+    with django_assert_max_num_queries(20):
+        notifications = condition.process_condition(new_hire)
+
+    assert len(notifications) == 21
+    assert all(notification.id is not None for notification in notifications)
+    assert new_hire.to_do.count() == 10
+    assert new_hire.resources.count() == 10
+    assert new_hire.badges.count() == 1
+    assert (
+        Notification.objects.filter(
+            created_for=new_hire,
+            notification_type=Notification.Type.ADDED_TODO,
+            notified_user=False,
+        ).count()
+        == 10
+    )
+
+
 # TASKS
 
 
@@ -2146,3 +2478,64 @@ def test_send_slack_message_after_process_condition(
             },
         },
     ]
+
+
+@pytest.mark.django_db
+def test_process_condition_slack_digest_query_count(
+    condition_to_do_factory,
+    new_hire_factory,
+    to_do_factory,
+    resource_factory,
+    badge_factory,
+    introduction_factory,
+    django_assert_max_num_queries,
+):
+    new_hire = new_hire_factory(slack_user_id="test")
+
+    def create_condition(amount):
+        condition = condition_to_do_factory()
+        condition.to_do.add(*to_do_factory.create_batch(amount))
+        condition.resources.add(*resource_factory.create_batch(amount))
+        condition.badges.add(*badge_factory.create_batch(amount))
+        condition.introductions.add(*introduction_factory.create_batch(amount))
+        return condition
+
+    condition = create_condition(1)
+    with CaptureQueriesContext(connection) as queries:
+        process_condition(condition.id, new_hire.id)
+
+    # Building the digest for more items doesn't need more queries
+    condition = create_condition(5)
+    with django_assert_max_num_queries(len(queries)):
+        process_condition(condition.id, new_hire.id)
+
+    # Second message contains the intros, badges and resources
+    assert len(cache.get("slack_blocks")) == 25
+
+
+@pytest.mark.django_db
+def test_process_condition_sends_pending_notifications(
+    condition_to_do_factory, new_hire_factory, to_do_factory, to_do_user_factory
+):
+    new_hire = new_hire_factory(slack_user_id="test")
+    # Added before (e.g. when the sequence was assigned), not sent yet
+    pending_to_do_user = to_do_user_factory(user=new_hire)
+    pending = Notification.objects.create(
+        notification_type=Notification.Type.ADDED_TODO,
+        item_id=pending_to_do_user.to_do.id,
+        created_for=new_hire,
+    )
+
+    condition = condition_to_do_factory()
+    condition.to_do.add(to_do_factory())
+
+    process_condition(condition.id, new_hire.id)
+
+    block_ids = [block.get("block_id") for block in cache.get("slack_blocks")]
+    assert str(pending_to_do_user.id) in block_ids
+    assert len(block_ids) == 3
+    pending.refresh_from_db()
+    assert pending.notified_user
+    assert not Notification.objects.filter(
+        created_for=new_hire, notified_user=False
+    ).exists()
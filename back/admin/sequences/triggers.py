@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from admin.sequences.workdays import WorkdayCalendar
+
+# Only skips weekends
+WEEKDAYS = WorkdayCalendar()
+
+
+def is_workday(date, calendar=None):
+    return (calendar or WEEKDAYS).is_workday(date)
+
+
+def onboarding_trigger_date(start_day, days, before, calendar=None):
+    """
+    Returns the (local) date on which a timed condition triggers for a new hire or
+    None if it will never trigger.
+
+    :param start_day date: the first working day of the new hire
+    :param days int: the amount of days before/after set on the condition
+    :param before bool: True if the condition triggers before the new hire started
+    :param calendar WorkdayCalendar: the days that count as workdays
+    """
+    if before:
+        # Not counting workdays here. The new hire hasn't started yet, so the day of
+        # starting itself never triggers.
+        if days < 1:
+            return None
+        return start_day - timedelta(days=days)
+
+    # Workdays start counting at 1 (the start day)
+    if days < 1:
+        return None
+
+    calendar = calendar or WEEKDAYS
+    if days == 1:
+        # Won't trigger when the new hire starts on a day off
+        return start_day if calendar.is_workday(start_day) else None
+
+    return calendar.add(start_day, days - 1)
+
+
+def offboarding_trigger_date(termination_date, days, calendar=None):
+    """
+    Returns the (local) date on which a timed condition triggers for someone that is
+    being offboarded or None if it will never trigger. This will skip any weekends
+    (and holidays).
+
+    :param termination_date date: the last day of the employee
+    :param days int: the amount of workdays before the termination date
+    :param calendar WorkdayCalendar: the days that count as workdays
+    """
+    if days < 0:
+        return None
+
+    # The termination date itself counts as well (if it's a workday)
+    return (calendar or WEEKDAYS).add(termination_date + timedelta(days=1), -(days + 1))
+
+
+def trigger_datetime(trigger_date, time, timezone_name):
+    """
+    Converts the local date and time on which a condition triggers to UTC
+
+    :param trigger_date date: the local date
+    :param time time: the local time
+    :param timezone_name str: the timezone of the user
+    """
+    local_tz = pytz.timezone(timezone_name)
+    local = local_tz.localize(datetime.combine(trigger_date, time))
+    return local.astimezone(pytz.utc)
@@ -0,0 +1,80 @@
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from functools import lru_cache
+
+WEEKEND = (5, 6)
+
+
+def _weekdays_before(day):
+    # Amount of weekdays before `day`. Counting starts at 0001-01-01, a Monday.
+    weeks, days = divmod(day.toordinal() - 1, 7)
+    return weeks * 5 + min(days, 5)
+
+
+def _weekday_from_index(index):
+    # The weekday that has `index` weekdays before it
+    weeks, days = divmod(index, 5)
+    return date.fromordinal(weeks * 7 + days + 1)
+
+
+class WorkdayCalendar:
+    """
+    Workday arithmetic that skips weekends and holidays. Weekends are calculated
+    (instead of walking day by day), so the cost only depends on the amount of
+    holidays in between.
+    """
+
+    def __init__(self, holidays=()):
+        # Holidays in the weekend don't change anything
+        self.holidays = sorted(
+            {day for day in holidays if day.weekday() not in WEEKEND}
+        )
+
+    def is_workday(self, day):
+        if day.weekday() in WEEKEND:
+            return False
+        index = bisect_left(self.holidays, day)
+        return index == len(self.holidays) or self.holidays[index] != day
+
+    def index(self, day):
+        # Amount of workdays before `day`
+        return _weekdays_before(day) - bisect_left(self.holidays, day)
+
+    def from_index(self, index):
+        # The workday that has `index` workdays before it. Every holiday up to that
+        # day pushes it one weekday further.
+        day = _weekday_from_index(index)
+        while True:
+            next_day = _weekday_from_index(index + bisect_right(self.holidays, day))
+            if next_day == day:
+                return day
+            day = next_day
+
+    def count(self, start, end):
+        # Amount of workdays from `start` up to (not including) `end`
+        return self.index(end) - self.index(start)
+
+    def add(self, day, workdays):
+        # The workday that is `workdays` workdays after (or before, when negative)
+        # `day`. `day` itself is never counted.
+        if workdays >= 0:
+            return self.from_index(self.index(day + timedelta(days=1)) + workdays - 1)
+        return self.from_index(self.index(day) + workdays)
+
+
+@lru_cache(maxsize=16)
+def _get_workday_calendar(holidays):
+    return WorkdayCalendar(holidays)
+
+
+def get_workday_calendar(holidays=None):
+    """
+    Returns the calendar with the holidays of the organization (or the given ones).
+    Calendars are shared for the same holidays.
+    """
+    if holidays is None:
+        from organization.models import Organization
+
+        org = Organization.object.get()
+        holidays = [] if org is None else org.holidays
+    return _get_workday_calendar(tuple(sorted(holidays)))
@@ -8,6 +8,7 @@ from django.utils.translation import gettext_lazy as _
 from django_q.models import Schedule
 
 from admin.templates.forms import UploadField
+from misc.lanes import BULK, lane
 from organization.models import Organization, WelcomeMessage
 
 
@@ -52,6 +53,7 @@ class OrganizationGeneralForm(forms.ModelForm):
                     Field("base_color"),
                     Field("accent_color"),
                     Field("custom_email_template"),
+                    Field("holidays"),
                     css_class="col-6",
                 ),
                 css_class="row",
@@ -73,6 +75,7 @@ class OrganizationGeneralForm(forms.ModelForm):
             "new_hire_email_reminders",
             "new_hire_email_overdue_reminders",
             "custom_email_template",
+            "holidays",
         ]
 
 
@@ -123,6 +126,7 @@ class SlackSettingsForm(forms.ModelForm):
                 func="slack_bot.tasks.birthday_reminder",
                 name="birthday_reminder",
                 schedule_type=Schedule.DAILY,
+                cluster=lane(BULK),
             )
 
         # Remove birthday schedule if channel got set to None
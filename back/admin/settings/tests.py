@@ -4,11 +4,15 @@ import pytest
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.template import Context
 from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from django_q.models import Schedule
 
 from admin.integrations.models import Integration
+from misc.models import TaskRun
+from misc.template_cache import template_cache
 from organization.models import Notification, WelcomeMessage
 from slack_bot.models import SlackChannel
 
@@ -571,3 +575,35 @@ def test_manually_add_slack_channels(client, admin_factory):
     assert "test2_channel" in response.content.decode()
     # general is created by default
     assert SlackChannel.objects.all().count() == 3
+
+
+@pytest.mark.django_db
+def test_task_stats_view(client, admin_factory):
+    admin_user = admin_factory()
+    client.force_login(admin_user)
+    TaskRun.objects.bulk_create(
+        [
+            TaskRun(
+                func="admin.sequences.tasks.timed_triggers",
+                started=timezone.now(),
+                duration=duration,
+                queries=10,
+                items=2,
+            )
+            for duration in [1, 2, 3]
+        ]
+    )
+
+    response = client.get(reverse("settings:tasks"))
+
+    assert "admin.sequences.tasks.timed_triggers" in response.content.decode()
+    assert response.context["tasks"][0]["duration_p50"] == 2
+
+    # Template cache stats of this process
+    template_cache.clear()
+    template_cache.render("{{ first_name }}", Context({}))
+    template_cache.render("{{ first_name }}", Context({}))
+    response = client.get(reverse("settings:tasks"))
+    assert response.context["template_cache"]["hits"] == 1
+    assert response.context["template_cache"]["misses"] == 1
+    assert "50%" in response.content.decode()
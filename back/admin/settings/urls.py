@@ -89,6 +89,7 @@ urlpatterns = [
     path(
         "administrators/", views.AdministratorListView.as_view(), name="administrators"
     ),
+    path("tasks/", views.TaskStatsView.as_view(), name="tasks"),
     path(
         "administrators/<int:pk>/update/",
         views.AdministratorUpdateView.as_view(),
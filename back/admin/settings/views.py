@@ -18,6 +18,8 @@ from twilio.rest import Client
 
 from admin.integrations.models import Integration
 from admin.settings.decorators import requires_credentials_login
+from misc.models import TaskRun
+from misc.template_cache import template_cache
 from organization.models import Notification, Organization, WelcomeMessage
 from slack_bot.models import SlackChannel
 from slack_bot.utils import Slack, actions, button, paragraph
@@ -405,3 +407,17 @@ class SlackChannelsCreateView(AdminPermMixin, CreateView):
         context["button_text"] = _("Enable")
         context["channels"] = SlackChannel.objects.all()
         return context
+
+
+class TaskStatsView(AdminPermMixin, TemplateView):
+    template_name = "settings_tasks.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["title"] = _("Background tasks")
+        context["subtitle"] = _("settings")
+        context["tasks"] = TaskRun.objects.summary()
+        context["task_stats_enabled"] = settings.TASK_STATS
+        context["retention"] = settings.TASK_STATS_RETENTION
+        context["template_cache"] = template_cache.stats()
+        return context
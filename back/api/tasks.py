@@ -3,11 +3,15 @@ from admin.sequences.models import Sequence
 
 
 def assign_offboarding_sequences(user, sequence_ids):
-    for integration in Integration.objects.filter(
-        manifest_type=Integration.ManifestType.WEBHOOK,
-        manifest__exists__isnull=False,
-    ):
-        integration.user_exists(user)
+    Integration.objects.check_user_exists(
+        user,
+        Integration.objects.filter(
+            manifest_type=Integration.ManifestType.WEBHOOK,
+            manifest__exists__isnull=False,
+        ),
+        # Decides which accounts get revoked, so don't rely on an earlier check
+        use_cache=False,
+    )
 
     sequences = Sequence.offboarding.filter(id__in=sequence_ids)
     user.add_sequences(sequences)
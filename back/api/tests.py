@@ -1,12 +1,15 @@
+from unittest.mock import Mock, patch
+
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import override_settings
 from django.urls import reverse
 from freezegun.api import freeze_time
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
-from users.models import User
+from users.models import IntegrationUser, User
 
 
 @pytest.fixture
@@ -154,6 +157,42 @@ def test_offboard_user_endpoint(
     assert user.termination_date is not None
 
 
+@pytest.mark.django_db
+def test_offboard_user_endpoint_checks_accounts_again(
+    setup_rest,
+    new_hire_factory,
+    offboarding_sequence_factory,
+    custom_integration_factory,
+):
+    client = setup_rest
+
+    user = new_hire_factory()
+    seq1 = offboarding_sequence_factory()
+    integration = custom_integration_factory()
+    # Account didn't exist when it was checked earlier
+    cache.set(integration._user_exists_cache_key(user), False)
+
+    with patch(
+        "admin.integrations.sessions.requests.Session.request",
+        Mock(return_value=Mock(status_code=200, json=lambda: [{"user": user.email}])),
+    ):
+        response = client.post(
+            reverse("api:offboarding"),
+            data={
+                "user": user.id,
+                "termination_date": "2030-04-04",
+                "sequences": [seq1.id],
+            },
+            format="json",
+        )
+
+    assert response.status_code == 200
+    # Account has been created since, so it will be revoked
+    assert IntegrationUser.objects.filter(
+        user=user, integration=integration, revoked=False
+    ).exists()
+
+
 @pytest.mark.django_db
 def test_offboard_user_endpoint_past_termination_date(
     setup_rest, new_hire_factory, offboarding_sequence_factory
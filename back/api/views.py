@@ -6,6 +6,7 @@ from rest_framework.views import APIView
 
 from admin.sequences.models import Sequence
 from api.tasks import assign_offboarding_sequences
+from misc.lanes import INTEGRATIONS, lane
 from organization.models import Notification, Organization
 from slack_bot.tasks import link_slack_users
 from users.emails import email_new_admin_cred
@@ -110,6 +111,7 @@ class UserOffboardingView(APIView):
             assign_offboarding_sequences,
             user,
             sequence_ids,
+            cluster=lane(INTEGRATIONS),
         )
         return Response(status=status.HTTP_200_OK)
 
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 import sys
+import tempfile
 from ast import literal_eval
 
 import environ
@@ -181,6 +182,33 @@ SLACK_BOT_TOKEN = env("SLACK_BOT_TOKEN", default="")
 SLACK_DISABLE_AUTO_UPDATE_CHANNELS = env.bool(
     "SLACK_DISABLE_AUTO_UPDATE_CHANNELS", default=False
 )
+SLACK_OUTBOX_WORKERS = env.int("SLACK_OUTBOX_WORKERS", default=4)
+SLACK_RATE_LIMIT_RETRIES = env.int("SLACK_RATE_LIMIT_RETRIES", default=3)
+
+# Integrations
+INTEGRATION_CHECK_WORKERS = env.int("INTEGRATION_CHECK_WORKERS", default=8)
+INTEGRATION_CHECK_TIMEOUT = env.int("INTEGRATION_CHECK_TIMEOUT", default=30)
+INTEGRATION_EXISTS_CACHE_TIMEOUT = env.int(
+    "INTEGRATION_EXISTS_CACHE_TIMEOUT", default=300
+)
+INTEGRATION_HTTP_POOL_SIZE = env.int("INTEGRATION_HTTP_POOL_SIZE", default=10)
+INTEGRATION_HTTP_RETRIES = env.int("INTEGRATION_HTTP_RETRIES", default=2)
+INTEGRATION_PAGES_TIME_BUDGET = env.int("INTEGRATION_PAGES_TIME_BUDGET", default=25)
+INTEGRATION_PAGES_BYTE_BUDGET = env.int(
+    "INTEGRATION_PAGES_BYTE_BUDGET", default=50 * 1024 * 1024
+)
+INTEGRATION_OAUTH_REFRESH_AHEAD = env.int(
+    "INTEGRATION_OAUTH_REFRESH_AHEAD", default=900
+)
+INTEGRATION_RETRY_MAX_ATTEMPTS = env.int("INTEGRATION_RETRY_MAX_ATTEMPTS", default=5)
+INTEGRATION_RETRY_DELAY = env.int("INTEGRATION_RETRY_DELAY", default=3600)
+INTEGRATION_RETRY_MAX_DELAY = env.int("INTEGRATION_RETRY_MAX_DELAY", default=43200)
+INTEGRATION_CIRCUIT_FAILURES = env.int("INTEGRATION_CIRCUIT_FAILURES", default=5)
+INTEGRATION_CIRCUIT_COOLDOWN = env.int("INTEGRATION_CIRCUIT_COOLDOWN", default=300)
+INTEGRATION_CIRCUIT_DRAIN_BATCH = env.int("INTEGRATION_CIRCUIT_DRAIN_BATCH", default=10)
+INTEGRATION_CIRCUIT_DRAIN_INTERVAL = env.int(
+    "INTEGRATION_CIRCUIT_DRAIN_INTERVAL", default=60
+)
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
@@ -348,27 +376,84 @@ DEFAULT_FROM_EMAIL = env("DEFAULT_FROM_EMAIL", default="example@example.com")
 OLD_PASSWORD_FIELD_ENABLED = True
 
 # Caching
+# Cache tiers, fastest first. Only the last one has to be shared between all
+# processes/servers. Items are kept in the others for a short time.
+CACHE_TIERS = env.list("CACHE_TIERS", default=["local", "database"])
+CACHE_LOCAL_TIMEOUT = env.int("CACHE_LOCAL_TIMEOUT", default=5)
+CACHE_FILE_TIMEOUT = env.int("CACHE_FILE_TIMEOUT", default=60)
+CACHE_FILE_LOCATION = env.str(
+    "CACHE_FILE_LOCATION",
+    default=os.path.join(tempfile.gettempdir(), "chiefonboarding_cache"),
+)
 CACHES = {
     "default": {
+        "BACKEND": "misc.cache.TieredCache",
+        "OPTIONS": {
+            "TIERS": CACHE_TIERS,
+            "TIER_TIMEOUTS": {
+                "local": CACHE_LOCAL_TIMEOUT,
+                "file": CACHE_FILE_TIMEOUT,
+            },
+        },
+    },
+    "local": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "chiefonboarding",
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_FILE_LOCATION,
+    },
+    "database": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "cached_items",
-    }
+    },
 }
 
+# Background tasks
+# The default cluster handles everything that should be picked up right away (like
+# processing conditions). Lanes in `TASK_LANES` get their own cluster, which can be
+# started with `Q_CLUSTER_NAME=<lane> python manage.py qcluster`. Tasks of lanes
+# that are not enabled run on the default cluster.
+TASK_LANES = env.list("TASK_LANES", default=[])
+TASK_REALTIME_TIMEOUT = env.int("TASK_REALTIME_TIMEOUT", default=90)
+TASK_BULK_TIMEOUT = env.int("TASK_BULK_TIMEOUT", default=1800)
+TASK_INTEGRATIONS_TIMEOUT = env.int("TASK_INTEGRATIONS_TIMEOUT", default=300)
 Q_CLUSTER = {
     "name": "DjangORM",
-    "workers": 1,
-    "timeout": 90,
-    "retry": 1800,
+    "workers": env.int("TASK_REALTIME_WORKERS", default=1),
+    "timeout": TASK_REALTIME_TIMEOUT,
+    # Tasks are retried when they haven't finished after this, so it has to be
+    # longer than the timeout
+    "retry": max(1800, TASK_REALTIME_TIMEOUT * 2),
     "queue_limit": 50,
     "bulk": 10,
     "orm": "default",
     "catch_up": False,
     "max_attempts": 2,
+    "ALT_CLUSTERS": {
+        "bulk": {
+            "workers": env.int("TASK_BULK_WORKERS", default=1),
+            "timeout": TASK_BULK_TIMEOUT,
+            "retry": max(1800, TASK_BULK_TIMEOUT * 2),
+        },
+        "integrations": {
+            "workers": env.int("TASK_INTEGRATIONS_WORKERS", default=2),
+            "timeout": TASK_INTEGRATIONS_TIMEOUT,
+            "retry": max(1800, TASK_INTEGRATIONS_TIMEOUT * 2),
+        },
+    },
 }
 
+# Record the time, queries and requests of every task run, shown in the settings
+TASK_STATS = env.bool("TASK_STATS", default=True)
+# Days that task runs are kept
+TASK_STATS_RETENTION = env.int("TASK_STATS_RETENTION", default=7)
+
 if DEBUG and RUNNING_TESTS:
     Q_CLUSTER["sync"] = True
+    # Tasks run inline, recording them would add queries to every request
+    TASK_STATS = False
 
 # AWS
 AWS_S3_ENDPOINT_URL = env(
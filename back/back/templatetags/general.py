@@ -23,7 +23,7 @@ def parse_to_json(content):
 def full_download_url(id):
     if id == "":
         return ""
-    return File.objects.get(id=id).get_url()
+    return File.objects.url(id)
 
 
 @register.filter(name="next_still_form")
@@ -1,6 +1,7 @@
 import os
 
 import pytest
+from django.core.cache import cache
 from pytest_factoryboy import register
 
 from admin.admin_tasks.factories import AdminTaskFactory
@@ -56,6 +57,12 @@ from users.factories import (
 )
 
 
+@pytest.fixture(autouse=True)
+def clear_front_cache_tiers():
+    # The database tier is rolled back after every test, the others are not
+    cache.clear_front_tiers()
+
+
 @pytest.fixture(autouse=True)
 def run_around_tests(request, settings):
     if request.node.get_closest_marker("no_run_around_tests"):
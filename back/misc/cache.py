@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+_missing = object()
+
+
+class LocalCache:
+    """
+    Small, thread safe, in process LRU cache with an optional timeout (in seconds)
+    per item. Items are only shared within the same process.
+    """
+
+    def __init__(self, maxsize=1000, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+
+            value, expires = item
+            if expires is not None and expires <= time.monotonic():
+                del self._items[key]
+                return default
+
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class TieredCache(BaseCache):
+    """
+    Cache backend that combines other caches (tiers), fastest first. Reads go
+    through the tiers in order and fill the faster tiers on a hit. Writes and
+    deletes go to all tiers.
+
+    Only the last tier needs to be shared between all processes. The others are
+    usually not (an in process cache, or files on one server), so items are only
+    kept there for a short time (see `TIER_TIMEOUTS`), which limits how long they
+    can be outdated.
+
+        "default": {
+            "BACKEND": "misc.cache.TieredCache",
+            "OPTIONS": {
+                "TIERS": ["local", "database"],
+                "TIER_TIMEOUTS": {"local": 5},
+            },
+        }
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.tier_aliases = list(options["TIERS"])
+        self.tier_timeouts = options.get("TIER_TIMEOUTS", {})
+
+    @cached_property
+    def tiers(self):
+        return [(alias, caches[alias]) for alias in self.tier_aliases]
+
+    @property
+    def front_tiers(self):
+        return self.tiers[:-1]
+
+    @property
+    def shared_tier(self):
+        return self.tiers[-1][1]
+
+    def tier_timeout(self, alias, timeout=DEFAULT_TIMEOUT):
+        # The shared tier keeps items as long as they are valid
+        max_timeout = self.tier_timeouts.get(alias)
+        if max_timeout is None or alias == self.tier_aliases[-1]:
+            return timeout
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return max_timeout
+        return min(timeout, max_timeout)
+
+    def get(self, key, default=None, version=None):
+        missed = []
+        for alias, tier in self.tiers:
+            value = tier.get(key, _missing, version=version)
+            if value is not _missing:
+                for missed_alias, missed_tier in missed:
+                    missed_tier.set(
+                        key, value, self.tier_timeout(missed_alias), version=version
+                    )
+                return value
+            missed.append((alias, tier))
+        return default
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = list(keys)
+        missed = []
+        for alias, tier in self.tiers:
+            if not missing:
+                break
+            values = tier.get_many(missing, version=version)
+            for missed_alias, missed_tier in missed:
+                if values:
+                    missed_tier.set_many(
+                        values, self.tier_timeout(missed_alias), version=version
+                    )
+            found |= values
+            missing = [key for key in missing if key not in values]
+            missed.append((alias, tier))
+        return found
+
+    def has_key(self, key, version=None):
+        return any(tier.has_key(key, version=version) for _alias, tier in self.tiers)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        for alias, tier in self.tiers:
+            tier.set(key, value, self.tier_timeout(alias, timeout), version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = []
+        for alias, tier in self.tiers:
+            failed = tier.set_many(
+                data, self.tier_timeout(alias, timeout), version=version
+            )
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Only the shared tier knows if it has been added already
+        added = self.shared_tier.add(key, value, timeout, version=version)
+        for alias, tier in self.front_tiers:
+            if added:
+                tier.set(key, value, self.tier_timeout(alias, timeout), version=version)
+            else:
+                tier.delete(key, version=version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        for alias, tier in self.front_tiers:
+            tier.touch(key, self.tier_timeout(alias, timeout), version=version)
+        return self.shared_tier.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared_tier.incr(key, delta, version=version)
+        for _alias, tier in self.front_tiers:
+            tier.delete(key, version=version)
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def delete(self, key, version=None):
+        for _alias, tier in self.front_tiers:
+            tier.delete(key, version=version)
+        return self.shared_tier.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for _alias, tier in self.tiers:
+            tier.delete_many(keys, version=version)
+
+    def clear(self):
+        for _alias, tier in self.tiers:
+            tier.clear()
+
+    def clear_front_tiers(self):
+        # Drops anything that could be outdated, the shared tier is kept
+        for _alias, tier in self.front_tiers:
+            tier.clear()
@@ -2,6 +2,8 @@ import json
 
 from django.db import models
 from django.db.models import JSONField
+from django.db.models.fields.json import KeyTransform
+from django.db.models.query_utils import DeferredAttribute
 from django.utils.encoding import force_bytes
 
 from misc.fernet_fields import EncryptedField
@@ -9,29 +11,71 @@ from misc.fernet_fields import EncryptedField
 from .models import File
 
 
+class RawContent(str):
+    # JSON from the database that hasn't been decoded yet, see ContentJSONField
+    pass
+
+
+class ContentDescriptor(DeferredAttribute):
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, RawContent):
+            value = self.field.decode(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Makes this a data descriptor, so __get__ is also used when the (raw) value
+        # is already set on the instance
+        instance.__dict__[self.field.attname] = value
+
+
 class ContentJSONField(JSONField):
     """
     Custom JSONField renderer. It will update the signed url of the files before
     pushing it to the frontend. Signed urls expire. We will always want to fetch a new
-    one, so users don't bump into files that can't be fetched in the editor
+    one, so users don't bump into files that can't be fetched in the editor.
+
+    Content is only decoded (and urls signed) when it's used for the first time, so
+    loading items without touching the content doesn't cost anything extra. Note
+    that `.values()`/`.values_list()` return the raw JSON for this field.
     """
 
+    descriptor_class = ContentDescriptor
+
     def from_db_value(self, value, expression, connection):
-        value = super().from_db_value(value, expression, connection)
+        if not isinstance(value, str) or isinstance(expression, KeyTransform):
+            return super().from_db_value(value, expression, connection)
+        return RawContent(value)
+
+    def decode(self, value):
+        value = super().from_db_value(str(value), None, None)
         if "blocks" not in value:
             return value
 
-        for block in value["blocks"]:
-            if block["type"] in ["attaches", "image"]:
-                if "id" in block["data"]["file"]:
-                    block["data"]["file"]["url"] = File.objects.get(
-                        id=block["data"]["file"]["id"]
-                    ).get_url()
-                else:
-                    block["data"]["title"] = (
-                        "File is invalid. Please remove and try again:"
-                        + block["data"]["title"]
-                    )
+        file_blocks = [
+            block for block in value["blocks"] if block["type"] in ["attaches", "image"]
+        ]
+        # Get the urls of all files in one go
+        urls = File.objects.urls(
+            [
+                block["data"]["file"]["id"]
+                for block in file_blocks
+                if "id" in block["data"]["file"]
+            ]
+        )
+        for block in file_blocks:
+            if "id" in block["data"]["file"]:
+                file_id = int(block["data"]["file"]["id"])
+                if file_id in urls:
+                    block["data"]["file"]["url"] = urls[file_id]
+            else:
+                block["data"]["title"] = (
+                    "File is invalid. Please remove and try again:"
+                    + block["data"]["title"]
+                )
         return value
 
 
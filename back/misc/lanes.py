@@ -0,0 +1,71 @@
+from functools import wraps
+
+from django.conf import settings
+from django.dispatch import receiver
+from django_q.conf import Conf
+from django_q.signals import post_spawn
+from django_q.tasks import async_task
+
+# Lanes that background tasks can run in. Tasks that are not in a lane (like
+# processing conditions and replying to Slack) run on the default cluster, so they
+# never have to wait for these.
+# Syncing users, reminders and other tasks that go through everyone
+BULK = "bulk"
+# Tasks that call integrations
+INTEGRATIONS = "integrations"
+
+
+def lane(name):
+    """
+    Returns the cluster of the lane or None (the default cluster) if the lane
+    doesn't have its own cluster. Pass this as `cluster` to `async_task` and
+    `schedule`.
+    """
+    return name if name in settings.TASK_LANES else None
+
+
+def in_lane(name):
+    """
+    Runs the task in the lane, even if it got picked up by another cluster. That
+    happens for schedules that don't have a cluster (the ones created in
+    migrations). Only use this for functions that are called as a task.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cluster = lane(name)
+            if cluster is not None and Conf.CLUSTER_NAME != cluster:
+                async_task(
+                    f"{func.__module__}.{func.__name__}",
+                    *args,
+                    cluster=cluster,
+                    **kwargs,
+                )
+                return None
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def release_disabled_lanes():
+    """
+    Hands schedules of lanes that have been disabled back to the default cluster,
+    nothing picks them up otherwise.
+    """
+    from django_q.models import Schedule
+
+    return (
+        Schedule.objects.filter(cluster__in=[BULK, INTEGRATIONS])
+        .exclude(cluster__in=settings.TASK_LANES)
+        .update(cluster=None)
+    )
+
+
+@receiver(post_spawn)
+def release_disabled_lanes_on_start(sender, **kwargs):
+    # Done by the workers of the default cluster when they start
+    if Conf.CLUSTER_NAME == Conf.PREFIX:
+        release_disabled_lanes()
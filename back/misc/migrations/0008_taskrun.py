@@ -0,0 +1,35 @@
+# Generated by Django 5.2.17 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("misc", "0007_alter_file_ext"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskRun",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("func", models.CharField(max_length=255)),
+                ("started", models.DateTimeField(db_index=True)),
+                ("success", models.BooleanField(default=True)),
+                ("duration", models.FloatField()),
+                ("queries", models.PositiveIntegerField(default=0)),
+                ("query_time", models.FloatField(default=0)),
+                ("requests", models.PositiveIntegerField(default=0)),
+                ("request_time", models.FloatField(default=0)),
+                ("items", models.PositiveIntegerField(null=True)),
+            ],
+        ),
+    ]
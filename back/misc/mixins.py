@@ -137,7 +137,7 @@ class ContentMixin:
             elif item["type"] == "attaches":
                 files_text = (
                     "<"
-                    + File.objects.get(id=item["data"]["file"]["id"]).get_url()
+                    + File.objects.url(item["data"]["file"]["id"])
                     + "|"
                     + item["data"]["file"]["title"]
                     + ">"
@@ -145,17 +145,13 @@ class ContentMixin:
                 slack_block["text"]["text"] = files_text
             elif item["type"] == "video":
                 files_text = (
-                    "<"
-                    + File.objects.get(id=item["data"]["file"]["id"]).get_url()
-                    + "|Watch video>"
+                    "<" + File.objects.url(item["data"]["file"]["id"]) + "|Watch video>"
                 )
                 slack_block["text"]["text"] = files_text
             elif item["type"] == "image":
                 slack_block = {
                     "type": "image",
-                    "image_url": File.objects.get(
-                        id=item["data"]["file"]["id"]
-                    ).get_url(),
+                    "image_url": File.objects.url(item["data"]["file"]["id"]),
                     "alt_text": "image",
                 }
             elif item["type"] == "question":
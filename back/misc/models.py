@@ -1,11 +1,56 @@
+import logging
 import uuid
+from datetime import timedelta
 
-from django.db import models
-from django.db.models.signals import pre_delete
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, models
+from django.db.models import Count, Q
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
+from django_q.signals import post_execute_in_worker, pre_execute
+from django_q.utils import get_func_repr
 
+from . import task_stats
+from .cache import LocalCache
 from .s3 import S3
 
+logger = logging.getLogger(__name__)
+
+# {file_id: key}, so files don't have to be fetched every time a url is needed
+file_keys = LocalCache(maxsize=10000)
+
+
+class FileManager(models.Manager):
+    def urls(self, ids):
+        # Returns {file_id: url} for the given files. Only fetches the files that
+        # haven't been seen before, in one query.
+        keys = {}
+        missing_ids = []
+        for id in {int(id) for id in ids}:
+            key = file_keys.get(id)
+            if key is None:
+                missing_ids.append(id)
+            else:
+                keys[id] = key
+
+        if len(missing_ids):
+            for id, key in self.filter(id__in=missing_ids).values_list("id", "key"):
+                keys[id] = key
+                # Key gets filled in after the file is created
+                if key != "":
+                    file_keys.set(id, key)
+
+        if not len(keys):
+            return {}
+
+        s3 = S3()
+        return {id: s3.get_file(key) for id, key in keys.items()}
+
+    def url(self, id):
+        return self.urls([id]).get(int(id), "")
+
 
 class File(models.Model):
     name = models.CharField(max_length=100)
@@ -13,6 +58,8 @@ class File(models.Model):
     ext = models.CharField(max_length=10, blank=True)
     uuid = models.UUIDField(default=uuid.uuid4, editable=False)
 
+    objects = FileManager()
+
     def get_url(self):
         return S3().get_file(self.key)
 
@@ -22,9 +69,105 @@ class File(models.Model):
 
 @receiver(pre_delete, sender=File)
 def remove_file(sender, instance, **kwargs):
+    file_keys.delete(instance.id)
     S3().delete_file(instance.key)
 
 
+@receiver(post_save, sender=File)
+def update_file_key(sender, instance, **kwargs):
+    file_keys.delete(instance.id)
+
+
+class Percentile(models.Aggregate):
+    # Continuous percentile (PostgreSQL), `fraction` is between 0 and 1
+    function = "PERCENTILE_CONT"
+    template = "%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = models.FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+class TaskRunManager(models.Manager):
+    METRICS = ["duration", "queries", "query_time", "requests", "request_time"]
+
+    def summary(self, since=None):
+        # p50 and p95 of every metric per task function, slowest tasks first
+        runs = self.all() if since is None else self.filter(started__gte=since)
+        aggregates = {
+            "runs": Count("id"),
+            "failed": Count("id", filter=Q(success=False)),
+            "items_p50": Percentile("items", 0.5),
+            "items_p95": Percentile("items", 0.95),
+        }
+        for metric in self.METRICS:
+            aggregates[f"{metric}_p50"] = Percentile(metric, 0.5)
+            aggregates[f"{metric}_p95"] = Percentile(metric, 0.95)
+        return runs.values("func").annotate(**aggregates).order_by("-duration_p95")
+
+    def prune(self):
+        # Only the runs of the last days are kept. Checked once an hour at most.
+        if cache.add("task_runs_pruned", True, 3600):
+            self.filter(
+                started__lt=timezone.now()
+                - timedelta(days=settings.TASK_STATS_RETENTION)
+            ).delete()
+
+
+class TaskRun(models.Model):
+    """
+    Performance of a single run of a background task. Times are in seconds.
+    """
+
+    func = models.CharField(max_length=255)
+    started = models.DateTimeField(db_index=True)
+    success = models.BooleanField(default=True)
+    duration = models.FloatField()
+    queries = models.PositiveIntegerField(default=0)
+    query_time = models.FloatField(default=0)
+    requests = models.PositiveIntegerField(default=0)
+    request_time = models.FloatField(default=0)
+    # Users, triggers, ... that were processed, if the task counts them
+    items = models.PositiveIntegerField(null=True)
+
+    objects = TaskRunManager()
+
+    def __str__(self):
+        return self.func
+
+
+@receiver(pre_execute)
+def start_task_run(sender, func, task, **kwargs):
+    if settings.TASK_STATS:
+        task_stats.start_run(get_func_repr(func) or str(task["func"]))
+
+
+@receiver(post_execute_in_worker)
+def record_task_run(sender, func, task, **kwargs):
+    if not settings.TASK_STATS:
+        return
+    run = task_stats.stop_run()
+    if run is None:
+        return
+    try:
+        TaskRun.objects.create(
+            func=run.func[:255],
+            started=timezone.now() - timedelta(seconds=run.duration),
+            # Not set when the task raised in sync mode
+            success=task.get("success", False),
+            duration=run.duration,
+            queries=run.queries,
+            query_time=run.query_time,
+            requests=run.requests,
+            request_time=run.request_time,
+            items=run.items,
+        )
+        TaskRun.objects.prune()
+    except DatabaseError:
+        # Never let the stats get in the way of the task itself
+        logger.exception("Couldn't save the stats of task %s", run.func)
+
+
 # This needs to stay here, not connected to anything.
 # If we remove this model, then migrations will not be able to run.
 # This model used to be connected to multiple models.
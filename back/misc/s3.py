@@ -1,15 +1,35 @@
+from functools import lru_cache
+
 import boto3
 from botocore.config import Config
 from django.conf import settings
 
+from misc.cache import LocalCache
+
+# Presigned urls for files are valid for (almost) 7 days. They are cached for less
+# than that, so a url that comes from the cache is still valid for at least a day.
+FILE_URL_EXPIRY = 604799
+FILE_URL_CACHE_TIMEOUT = FILE_URL_EXPIRY - 24 * 60 * 60
+
+# {(bucket, key): url}
+file_urls = LocalCache(maxsize=10000, timeout=FILE_URL_CACHE_TIMEOUT)
+
+
+@lru_cache(maxsize=None)
+def get_client(region, endpoint_url):
+    # Clients are thread safe and expensive to create, so share them
+    return boto3.client(
+        "s3",
+        region,
+        endpoint_url=endpoint_url,
+        config=Config(signature_version="s3v4"),
+    )
+
 
 class S3:
     def __init__(self):
-        self.client = boto3.client(
-            "s3",
-            settings.AWS_DEFAULT_REGION,
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-            config=Config(signature_version="s3v4"),
+        self.client = get_client(
+            settings.AWS_DEFAULT_REGION, settings.AWS_S3_ENDPOINT_URL
         )
 
     def get_presigned_url(self, key, time=3600):
@@ -19,23 +39,37 @@ class S3:
             Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": key},
         )
 
-    def get_file(self, key, time=604799):
+    def get_file(self, key, time=FILE_URL_EXPIRY):
         # If a user uploads some files and then removes the keys, this would error
         # Therefore the quick check here
         if settings.AWS_STORAGE_BUCKET_NAME == "":
             return ""
 
+        cache_key = (settings.AWS_STORAGE_BUCKET_NAME, key)
+        if time == FILE_URL_EXPIRY:
+            url = file_urls.get(cache_key)
+            if url is not None:
+                return url
+
         try:
-            return self.client.generate_presigned_url(
+            url = self.client.generate_presigned_url(
                 ClientMethod="get_object",
                 ExpiresIn=time,
                 Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": key},
             )
         except Exception:
             print("Credentials are not set or incorrect")
+            # Credentials are picked up when the client is created, try again with a
+            # new one next time
+            get_client.cache_clear()
             return ""
 
+        if time == FILE_URL_EXPIRY:
+            file_urls.set(cache_key, url)
+        return url
+
     def delete_file(self, key):
+        file_urls.delete((settings.AWS_STORAGE_BUCKET_NAME, key))
         return self.client.delete_object(
             Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key
         )
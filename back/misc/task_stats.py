@@ -0,0 +1,111 @@
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db import connection
+
+# Runs of the tasks that are executing in this context. Tasks can run inside each
+# other (in sync mode), everything counts towards all of them.
+_runs = ContextVar("task_runs", default=())
+
+
+class TaskRunStats:
+    """
+    Collects the database queries, outbound requests and processed items of a single
+    run of a background task.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.started = time.perf_counter()
+        self.duration = None
+        self.queries = 0
+        self.query_time = 0.0
+        self.requests = 0
+        self.request_time = 0.0
+        self.items = None
+        # Threads that got started by the task count towards it as well
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self._lock:
+                self.queries += 1
+                self.query_time += time.perf_counter() - start
+
+    def add_request(self, duration):
+        with self._lock:
+            self.requests += 1
+            self.request_time += duration
+
+    def add_items(self, amount):
+        with self._lock:
+            self.items = (self.items or 0) + amount
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+
+
+def start_run(func):
+    run = TaskRunStats(func)
+    _runs.set(_runs.get() + (run,))
+    connection.execute_wrappers.append(run)
+    return run
+
+
+def stop_run():
+    runs = _runs.get()
+    if not runs:
+        return None
+    run = runs[-1]
+    _runs.set(runs[:-1])
+    if run in connection.execute_wrappers:
+        connection.execute_wrappers.remove(run)
+    run.stop()
+    return run
+
+
+@contextmanager
+def outbound_request():
+    # Times a call to an external service
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        for run in _runs.get():
+            run.add_request(duration)
+
+
+def count_items(amount):
+    # The amount of things (users, triggers, ...) the current task went through
+    runs = _runs.get()
+    if runs:
+        runs[-1].add_items(amount)
+
+
+def in_current_task(func):
+    """
+    Counts the queries and requests of `func` towards the task that is running now,
+    when `func` is called in another thread.
+    """
+    runs = _runs.get()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _runs.set(runs)
+        try:
+            with ExitStack() as stack:
+                for run in runs:
+                    stack.enter_context(connection.execute_wrapper(run))
+                return func(*args, **kwargs)
+        finally:
+            _runs.reset(token)
+
+    return wrapper
@@ -0,0 +1,75 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.template import Template
+
+
+class TemplateCache:
+    """
+    Process wide LRU cache of compiled templates, keyed by a hash of the text.
+    Compiled templates are safe to render multiple times (and from multiple threads)
+    with different contexts.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Text without any template tags/variables, never compiled
+        self.skipped = 0
+
+    @staticmethod
+    def needs_rendering(text):
+        return "{{" in text or "{%" in text or "{#" in text
+
+    def get(self, text):
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+
+        template = Template(text)
+        with self._lock:
+            self.misses += 1
+            self._templates[key] = template
+            if len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        return template
+
+    def render(self, text, context):
+        # Context can be a callable, it's then only created when the text actually
+        # needs to be rendered
+        if not self.needs_rendering(text):
+            with self._lock:
+                self.skipped += 1
+            return text
+        if callable(context):
+            context = context()
+        return self.get(text).render(context)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._templates),
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self.hits = 0
+            self.misses = 0
+            self.skipped = 0
+
+
+template_cache = TemplateCache()
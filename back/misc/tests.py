@@ -1,4 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest.mock import patch
+
 import pytest
+from django.core.cache import cache, caches
+from django.test import override_settings
+from django.utils import timezone
+from django_q.models import Schedule
+from django_q.tasks import async_task
+from freezegun import freeze_time
+
+from admin.integrations.tasks import sync_user_info
+from admin.to_do.models import ToDo
+from misc.cache import TieredCache
+from misc.fields import RawContent
+from misc.lanes import BULK, INTEGRATIONS, in_lane, lane, release_disabled_lanes
+from misc.models import File, TaskRun, file_keys
+from misc.s3 import file_urls, get_client
+from misc.task_stats import count_items, outbound_request, start_run, stop_run
+from misc.threads import in_thread
 
 
 @pytest.mark.django_db
@@ -20,3 +40,260 @@ def test_to_slack_block_questions(new_hire_factory, to_do_factory):
 
     assert to_do.to_slack_block(new_hire) == [{'type': 'input', 'block_id': 'item-0', 'element': {'type': 'radio_buttons', 'options': [{'text': {'type': 'plain_text', 'text': 'test', 'emoji': True}, 'value': 'temp-54be'}, {'text': {'type': 'plain_text', 'text': 'tesstt', 'emoji': True}, 'value': 'temp-4eb2'}, {'text': {'type': 'plain_text', 'text': 'testttttt', 'emoji': True}, 'value': 'temp-7300'}, {'text': {'type': 'plain_text', 'text': 'test2', 'emoji': True}, 'value': 'temp-215a'}], 'action_id': 'item-0'}, 'label': {'type': 'plain_text', 'text': 'TEst', 'emoji': True}}, {'type': 'input', 'block_id': 'item-1', 'element': {'type': 'radio_buttons', 'options': [{'text': {'type': 'plain_text', 'text': 'option1', 'emoji': True}, 'value': 'temp-6272'}, {'text': {'type': 'plain_text', 'text': 'option2', 'emoji': True}, 'value': 'temp-6e14'}], 'action_id': 'item-1'}, 'label': {'type': 'plain_text', 'text': 'Another question', 'emoji': True}}]  # noqa: E231, E501
     # fmt: on
+
+
+@pytest.mark.django_db
+def test_file_urls_are_cached(
+    settings, monkeypatch, file_factory, to_do_factory, django_assert_num_queries
+):
+    settings.AWS_ACCESS_KEY_ID = "xxx"
+    settings.AWS_STORAGE_BUCKET_NAME = "xxx"
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    get_client.cache_clear()
+    file_keys.clear()
+    file_urls.clear()
+
+    file1 = file_factory()
+    file2 = file_factory()
+    to_do = to_do_factory(
+        content={
+            "blocks": [
+                {"type": "image", "data": {"file": {"id": file1.id}}},
+                {"type": "attaches", "data": {"file": {"id": file2.id}}},
+            ]
+        }
+    )
+
+    # One query for both files
+    with django_assert_num_queries(1):
+        urls = File.objects.urls([file1.id, file2.id])
+    assert file1.key in urls[file1.id]
+    assert file2.key in urls[file2.id]
+
+    # Files and urls are cached, so only the to do item itself is fetched
+    with django_assert_num_queries(1):
+        to_do = ToDo.objects.get(id=to_do.id)
+    assert to_do.content["blocks"][0]["data"]["file"]["url"] == urls[file1.id]
+    assert to_do.content["blocks"][1]["data"]["file"]["url"] == urls[file2.id]
+
+    # Removed files are removed from the cache as well
+    file1_id = file1.id
+    with patch("misc.s3.S3.delete_file"):
+        file1.delete()
+    assert File.objects.urls([file1_id, file2.id]) == {file2.id: urls[file2.id]}
+
+
+@pytest.mark.django_db
+def test_content_is_decoded_lazily(
+    file_factory, to_do_factory, django_assert_num_queries
+):
+    file_keys.clear()
+    file = file_factory()
+    to_do_factory(
+        content={
+            "blocks": [
+                {"type": "image", "data": {"file": {"id": file.id}}},
+                {"type": "form", "data": {"type": "check", "text": "done?"}},
+            ]
+        }
+    )
+
+    # Files don't get fetched when the content isn't used
+    with django_assert_num_queries(1):
+        to_do = ToDo.objects.get()
+    assert isinstance(to_do.__dict__["content"], RawContent)
+
+    with django_assert_num_queries(1):
+        assert not to_do.inline_slack_form
+    assert to_do.content["blocks"][0]["data"]["file"]["id"] == file.id
+    assert isinstance(to_do.__dict__["content"], dict)
+
+    # Saving keeps the content as is
+    to_do.save()
+    to_do.refresh_from_db()
+    assert to_do.content["blocks"][1]["data"]["type"] == "check"
+
+
+@pytest.mark.django_db
+def test_tiered_cache(django_assert_num_queries):
+    local = caches["local"]
+    database = caches["database"]
+
+    cache.set("tiered", "value", 300)
+    assert local.get("tiered") == "value"
+    assert database.get("tiered") == "value"
+
+    # Served from the local tier
+    with django_assert_num_queries(0):
+        assert cache.get("tiered") == "value"
+        assert cache.get_many(["tiered"]) == {"tiered": "value"}
+
+    # Filled again from the database tier
+    local.clear()
+    assert cache.get("tiered") == "value"
+    assert local.get("tiered") == "value"
+
+    # Items are only kept for a short time in the local tier
+    with freeze_time(timezone.now() + timedelta(seconds=10)):
+        assert local.get("tiered") is None
+        assert database.get("tiered") == "value"
+
+    # Only added when it's not in the shared tier
+    database.set("added", "other")
+    assert not cache.add("added", "value")
+    assert cache.get("added") == "other"
+    assert cache.add("new", "value")
+
+    cache.delete("tiered")
+    assert local.get("tiered") is None
+    assert cache.get("tiered") is None
+
+
+@pytest.mark.django_db
+def test_task_lanes(custom_user_import_integration_factory):
+    # Lanes without their own cluster run on the default cluster
+    assert lane(BULK) is None
+    integration = custom_user_import_integration_factory()
+    integration.manifest = integration.manifest | {"schedule": "* * * * *"}
+    integration.save()
+    assert Schedule.objects.get(name=integration.schedule_name).cluster is None
+
+    with override_settings(TASK_LANES=[BULK]):
+        assert lane(BULK) == BULK
+        assert lane(INTEGRATIONS) is None
+
+        # Schedules created before the lane existed hand the sync over to the lane
+        with patch("misc.lanes.async_task") as mock_async_task:
+            sync_user_info(integration.id)
+        mock_async_task.assert_called_once_with(
+            "admin.integrations.tasks.sync_user_info", integration.id, cluster=BULK
+        )
+
+        # Existing schedules move to the lane
+        integration.save()
+        assert Schedule.objects.get(name=integration.schedule_name).cluster == BULK
+
+        @in_lane(BULK)
+        def task(value):
+            return value
+
+        # Handed over to the lane when picked up by another cluster
+        with patch("misc.lanes.async_task") as mock_async_task:
+            assert task("value") is None
+        mock_async_task.assert_called_once_with(
+            f"{task.__module__}.task", "value", cluster=BULK
+        )
+
+        # Runs when it's in the lane
+        with patch("misc.lanes.Conf.CLUSTER_NAME", BULK):
+            assert task("value") == "value"
+
+    # Runs right away without the lane
+    assert task("value") == "value"
+
+
+def task_with_stats(items):
+    list(ToDo.objects.all())
+    with outbound_request():
+        pass
+    count_items(items)
+    if items > 5:
+        raise ValueError("Too many items")
+
+
+@pytest.mark.django_db
+def test_task_stats():
+    # Off in tests by default
+    async_task("misc.tests.task_with_stats", 1)
+    assert not TaskRun.objects.exists()
+
+    with override_settings(TASK_STATS=True):
+        for items in [1, 2, 3]:
+            async_task("misc.tests.task_with_stats", items)
+        with pytest.raises(ValueError):
+            async_task("misc.tests.task_with_stats", 10)
+
+    runs = TaskRun.objects.order_by("id")
+    assert [run.items for run in runs] == [1, 2, 3, 10]
+    assert [run.success for run in runs] == [True, True, True, False]
+    for run in runs:
+        assert run.func == "misc.tests.task_with_stats"
+        assert run.queries == 1
+        assert run.requests == 1
+        assert run.duration >= run.query_time + run.request_time
+
+    summary = TaskRun.objects.summary().get()
+    assert summary["runs"] == 4
+    assert summary["failed"] == 1
+    assert summary["items_p50"] == 2.5
+    assert summary["queries_p95"] == 1
+
+    # Old runs get removed
+    TaskRun.objects.update(started=timezone.now() - timedelta(days=8))
+    cache.delete("task_runs_pruned")
+    with override_settings(TASK_STATS=True):
+        async_task("misc.tests.task_with_stats", 1)
+    assert TaskRun.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_in_thread():
+    def request(number):
+        with outbound_request():
+            return number * 2
+
+    run = start_run("misc.tests.request")
+    try:
+        with (
+            patch("misc.threads.connections") as mock_connections,
+            ThreadPoolExecutor(max_workers=2) as executor,
+        ):
+            results = list(executor.map(in_thread(request), [1, 2, 3]))
+    finally:
+        stop_run()
+
+    assert results == [2, 4, 6]
+    # Requests in the threads count towards the task
+    assert run.requests == 3
+    # Connections of the threads are closed
+    assert mock_connections.close_all.call_count == 3
+
+
+@pytest.mark.django_db
+def test_tiered_cache_shared_tier_keeps_items():
+    # Single server setup, the file tier is shared
+    tiered = TieredCache(
+        None,
+        {
+            "OPTIONS": {
+                "TIERS": ["local", "file"],
+                "TIER_TIMEOUTS": {"local": 5, "file": 60},
+            }
+        },
+    )
+    file = caches["file"]
+    tiered.set("version", 1, None)
+    tiered.set("item", "value", 300)
+
+    with freeze_time(timezone.now() + timedelta(seconds=120)):
+        assert tiered.get("version") == 1
+        assert tiered.get("item") == "value"
+        assert caches["local"].get("item") == "value"
+
+    file.delete_many(["version", "item"])
+
+
+@pytest.mark.django_db
+def test_release_disabled_lanes():
+    bulk = Schedule.objects.create(func="bulk", cluster=BULK)
+    integrations = Schedule.objects.create(func="integrations", cluster=INTEGRATIONS)
+
+    # Lane got disabled, its schedules go back to the default cluster
+    with override_settings(TASK_LANES=[INTEGRATIONS]):
+        assert release_disabled_lanes() == 1
+
+    bulk.refresh_from_db()
+    integrations.refresh_from_db()
+    assert bulk.cluster is None
+    assert integrations.cluster == INTEGRATIONS
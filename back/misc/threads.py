@@ -0,0 +1,24 @@
+from functools import wraps
+
+from django.db import connections
+
+from misc.task_stats import in_current_task
+
+
+def in_thread(func):
+    """
+    Prepares `func` to be called in another thread, like the ones of a thread pool.
+    Its queries and requests count towards the task that is running now and the
+    database connections of the thread are closed when it's done.
+    """
+    func = in_current_task(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Threads get their own database connection, don't leave them open
+            connections.close_all()
+
+    return wrapper
@@ -1,7 +1,7 @@
 from django.http import HttpResponse
 from django.shortcuts import redirect
 
-from organization.models import Organization
+from organization.models import Organization, organization_scope
 
 
 # Credits: https://stackoverflow.com/a/64623669
@@ -20,7 +20,8 @@ class SetupOrgMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
-        org = Organization.object.get()
-        if org is None and request.path != "/setup/":
-            return redirect("setup")
-        return self.get_response(request)
+        with organization_scope():
+            org = Organization.object.get()
+            if org is None and request.path != "/setup/":
+                return redirect("setup")
+            return self.get_response(request)
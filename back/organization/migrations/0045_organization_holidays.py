@@ -0,0 +1,25 @@
+# Generated by Django 5.2.17 on 2026-10-18 06:48
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("organization", "0044_remove_organization_credentials_login_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="organization",
+            name="holidays",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.DateField(),
+                blank=True,
+                default=list,
+                help_text="Days that are skipped when counting workdays, like weekends. Comma separated, for example: 2025-12-25,2025-12-26",
+                size=None,
+                verbose_name="Holidays",
+            ),
+        ),
+    ]
@@ -1,3 +1,7 @@
+import copy
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
 
 import pytz
@@ -6,20 +10,87 @@ from django.contrib.postgres.fields import ArrayField
 from django.core.cache import cache
 from django.db import models
 from django.db.models import CheckConstraint, Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.template import Context, Template
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
+from django_q.signals import post_execute_in_worker, pre_execute
+from django_q.tasks import async_task
 
+from misc.lanes import BULK, lane
 from misc.mixins import ContentMixin
 from misc.models import File
 
+ORGANIZATION_VERSION_KEY = "organization_version"
+
+# (version, organization) of the last organization that was read in this process
+_cached_organization = (None, None)
+# Organization of the current request or task, see `organization_scope`
+_scoped_organization = ContextVar("scoped_organization", default=None)
+
+
+@contextmanager
+def organization_scope():
+    # The organization is read at most once within this block
+    token = _scoped_organization.set({})
+    try:
+        yield
+    finally:
+        _scoped_organization.reset(token)
+
+
+def clear_organization_cache():
+    global _cached_organization
+    # Other processes will notice the new version and read it again
+    cache.set(ORGANIZATION_VERSION_KEY, uuid.uuid4().hex, None)
+    _cached_organization = (None, None)
+    scope = _scoped_organization.get()
+    if scope is not None:
+        scope.clear()
+
 
 class ObjectManager(models.Manager):
+    """
+    The organization is needed on nearly every request and in most tasks. It's
+    cached per process and only read again when its version changes (when it's
+    saved). Within a request or task it's not even checked again.
+
+    A copy is returned, so changes to it don't end up in the cache.
+    """
+
     def get(self):
-        return self.get_queryset().first()
+        scope = _scoped_organization.get()
+        if scope is not None and "org" in scope:
+            return copy.deepcopy(scope["org"])
+
+        org = self._get_cached()
+        if org is None:
+            # Not set up yet
+            return None
+        if scope is not None:
+            scope["org"] = org
+        return copy.deepcopy(org)
+
+    def _get_cached(self):
+        global _cached_organization
+        version = cache.get(ORGANIZATION_VERSION_KEY)
+        if version is None:
+            # Never use an organization that was read before the version was lost
+            cache.add(ORGANIZATION_VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(ORGANIZATION_VERSION_KEY)
+
+        cached_version, org = _cached_organization
+        if version is not None and cached_version == version:
+            return org
+
+        org = self.get_queryset().first()
+        if org is not None:
+            _cached_organization = (version, org)
+        return org
 
 
 class Organization(models.Model):
@@ -128,7 +199,8 @@ class Organization(models.Model):
         on_delete=models.SET_NULL,
         related_name="+",
     )
-    # Field to determine if there has been an outage and tasks need to be caught up
+    # Field to determine if there has been an outage and tasks need to be caught up.
+    # Updated without saving, don't rely on it in the cached organization.
     timed_triggers_last_check = models.DateTimeField(auto_now_add=True)
     custom_email_template = models.TextField(
         default="",
@@ -143,6 +215,16 @@ class Organization(models.Model):
         default=list,
         help_text="Emails which get ignored by the importer",
     )
+    holidays = ArrayField(
+        models.DateField(),
+        default=list,
+        blank=True,
+        verbose_name=_("Holidays"),
+        help_text=_(
+            "Days that are skipped when counting workdays, like weekends. "
+            "Comma separated, for example: 2025-12-25,2025-12-26"
+        ),
+    )
 
     object = ObjectManager()
     objects = models.Manager()
@@ -156,6 +238,48 @@ class Organization(models.Model):
             ),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_timezone = instance.__dict__.get("timezone")
+        # Copied, so changing the list in place is noticed as well
+        holidays = instance.__dict__.get("holidays")
+        instance._loaded_holidays = None if holidays is None else list(holidays)
+        return instance
+
+    def save(self, *args, **kwargs):
+        timezone_changed = self.pk is not None and self.timezone != getattr(
+            self, "_loaded_timezone", self.timezone
+        )
+        # None when the holidays weren't loaded
+        loaded_holidays = getattr(self, "_loaded_holidays", self.holidays)
+        holidays_changed = (
+            self.pk is not None
+            and loaded_holidays is not None
+            and sorted(self.holidays) != sorted(loaded_holidays)
+        )
+        super().save(*args, **kwargs)
+        self._loaded_timezone = self.timezone
+        self._loaded_holidays = list(self.holidays)
+        clear_organization_cache()
+
+        if holidays_changed:
+            # Timed conditions count workdays, so everyone's need to be rescheduled
+            async_task(
+                "admin.sequences.tasks.update_condition_triggers",
+                all_users=True,
+                task_name="Reschedule timed conditions after holidays change",
+                cluster=lane(BULK),
+            )
+        elif timezone_changed:
+            # Timed conditions of users without a timezone trigger based on the
+            # timezone of the organization, so these need to be rescheduled
+            async_task(
+                "admin.sequences.tasks.update_condition_triggers",
+                task_name="Reschedule timed conditions after timezone change",
+                cluster=lane(BULK),
+            )
+
     @property
     def base_color_rgb(self):
         base_color = self.base_color.strip("#")
@@ -195,6 +319,21 @@ class Organization(models.Model):
         return cache.get("logo_url")
 
 
+@receiver(post_delete, sender=Organization)
+def organization_deleted(sender, instance, **kwargs):
+    clear_organization_cache()
+
+
+@receiver(pre_execute)
+def start_task_organization_scope(sender, **kwargs):
+    _scoped_organization.set({})
+
+
+@receiver(post_execute_in_worker)
+def end_task_organization_scope(sender, **kwargs):
+    _scoped_organization.set(None)
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=500)
 
@@ -1,5 +1,6 @@
 import json
-from datetime import timedelta
+from datetime import date, timedelta
+from unittest.mock import patch
 
 import pytest
 from django.contrib.auth import get_user_model
@@ -10,7 +11,7 @@ from django.utils import timezone
 
 from misc.models import File
 
-from .models import Notification, Organization
+from .models import Notification, Organization, organization_scope
 
 
 @pytest.mark.django_db
@@ -98,6 +99,35 @@ def test_use_custom_email_template(new_hire_factory):
     assert f"hi {new_hire.first_name}!" in email
 
 
+@pytest.mark.django_db
+def test_organization_cache(django_assert_num_queries):
+    cache.clear_front_tiers()
+    # Version and organization
+    with django_assert_num_queries(2):
+        org = Organization.object.get()
+    # Only the version, which comes from the local cache tier now
+    with django_assert_num_queries(0):
+        assert Organization.object.get().name == org.name
+
+    # Changes that are not saved don't end up in the cache
+    org.name = "Changed"
+    assert Organization.object.get().name != "Changed"
+
+    # Saving invalidates it
+    org.save()
+    assert Organization.object.get().name == "Changed"
+
+    # Read once within a request/task
+    with organization_scope():
+        Organization.object.get()
+        with django_assert_num_queries(0):
+            assert Organization.object.get().name == "Changed"
+
+        org.name = "Changed again"
+        org.save()
+        assert Organization.object.get().name == "Changed again"
+
+
 @pytest.mark.django_db
 def test_cache_logo_url(settings, file_factory, monkeypatch):
     settings.AWS_ACCESS_KEY_ID = "xxx"
@@ -344,3 +374,27 @@ def test_search(
     assert employee1.full_name in response.content.decode()
     # doesn't have the "test" query in it
     assert employee2.full_name not in response.content.decode()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("change", ["assign", "append"])
+def test_organization_first_holiday_reschedules_triggers(change):
+    org = Organization.object.get()
+    assert org.holidays == []
+
+    with patch("organization.models.async_task") as mock_async_task:
+        if change == "assign":
+            org.holidays = [date(2021, 1, 14)]
+        else:
+            org.holidays.append(date(2021, 1, 14))
+        org.save()
+
+        # Saving again without changes doesn't reschedule again
+        org.save()
+
+    mock_async_task.assert_called_once()
+    assert (
+        mock_async_task.call_args.args[0]
+        == "admin.sequences.tasks.update_condition_triggers"
+    )
+    assert mock_async_task.call_args.kwargs["all_users"]
@@ -1,6 +1,10 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
-from .utils import Slack
+from admin.integrations.models import Integration
+
+from .utils import Slack, slack_clients
 
 
 class SlackChannelManager(models.Manager):
@@ -21,3 +25,10 @@ class SlackChannel(models.Model):
 
     def __str__(self):
         return self.name
+
+
+@receiver(post_save, sender=Integration)
+@receiver(post_delete, sender=Integration)
+def invalidate_slack_client(sender, instance, **kwargs):
+    if instance.integration == Integration.Type.SLACK_BOT:
+        slack_clients.invalidate()
@@ -0,0 +1,179 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from misc.threads import in_thread
+
+# Slack allows up to 50 blocks in a single message
+MAX_BLOCKS = 50
+
+# (requests per minute, burst) per Slack API method, based on the rate limit tiers
+# https://api.slack.com/docs/rate-limits
+METHOD_LIMITS = {
+    "chat.postMessage": (600, 20),
+    "chat.postEphemeral": (100, 10),
+    "chat.update": (50, 10),
+    "views.open": (100, 10),
+    "views.update": (100, 10),
+}
+# Slack allows roughly one message per second per channel
+CHANNEL_LIMIT = (60, 3)
+
+# The outbox of the block that is running, see `SlackOutbox.current`
+_current_outbox = ContextVar("slack_outbox", default=None)
+
+
+class TokenBucket:
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Blocks until a token is available
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SlackRateLimiter:
+    """
+    Process wide token buckets per Slack API method (and per channel for messages),
+    so a burst of calls gets spread out instead of running into 429 responses.
+    Anything that still gets rate limited is retried by the client based on the
+    Retry-After header.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, key, limit):
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(*limit)
+            return self._buckets[key]
+
+    def acquire(self, method, channel=None):
+        if method in METHOD_LIMITS:
+            self._bucket(method, METHOD_LIMITS[method]).acquire()
+        if channel:
+            self._bucket(("channel", channel), CHANNEL_LIMIT).acquire()
+
+
+rate_limiter = SlackRateLimiter()
+
+
+class SlackOutbox:
+    """
+    Collects outgoing Slack messages and sends them when the block exits. Messages
+    to different channels are sent concurrently, messages to the same channel are
+    sent in order. Messages to the same channel that are marked with `coalesce` are
+    merged into a single message (as long as that stays within Slack's block limit).
+
+    Use this for fan-outs where the response of Slack is not needed:
+
+        with SlackOutbox() as outbox:
+            for user in users:
+                outbox.send_message(blocks=blocks, channel=user.slack_user_id)
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = (
+            settings.SLACK_OUTBOX_WORKERS if max_workers is None else max_workers
+        )
+        self.messages = []
+
+    @staticmethod
+    def current():
+        # Code that sends messages for many users (like items of a sequence) can
+        # queue them here when it runs inside an outbox
+        return _current_outbox.get()
+
+    def __enter__(self):
+        self._token = _current_outbox.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_outbox.reset(self._token)
+        # Send anything that got queued before something went wrong as well
+        self.flush()
+        return False
+
+    def send_message(self, blocks=None, channel="", text="", coalesce=False):
+        self.messages.append(
+            {
+                "blocks": [] if blocks is None else list(blocks),
+                "channel": channel,
+                "text": text,
+                "coalesce": coalesce,
+            }
+        )
+
+    def _coalesced_messages(self):
+        messages = []
+        # {channel: message that others can be merged in}
+        open_messages = {}
+        for message in self.messages:
+            if not message["coalesce"]:
+                messages.append(message)
+                continue
+
+            previous = open_messages.get(message["channel"])
+            if (
+                previous is not None
+                and len(previous["blocks"]) + len(message["blocks"]) <= MAX_BLOCKS
+            ):
+                previous["blocks"] += message["blocks"]
+                previous["text"] = "\n".join(
+                    text for text in [previous["text"], message["text"]] if text
+                )
+                continue
+
+            open_messages[message["channel"]] = message
+            messages.append(message)
+        return messages
+
+    def _send(self, messages):
+        from slack_bot.utils import Slack
+
+        slack = Slack()
+        for message in messages:
+            slack.send_message(
+                blocks=message["blocks"],
+                channel=message["channel"],
+                text=message["text"],
+            )
+
+    def flush(self):
+        messages = self._coalesced_messages()
+        self.messages = []
+
+        # Keep the order of messages per channel
+        per_channel = {}
+        for message in messages:
+            per_channel.setdefault(message["channel"], []).append(message)
+
+        # The fake Slack API (tests) writes to the cache, keep that in this thread
+        if self.max_workers <= 1 or len(per_channel) <= 1 or settings.FAKE_SLACK_API:
+            for channel_messages in per_channel.values():
+                self._send(channel_messages)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Consume the results to surface exceptions
+            list(executor.map(in_thread(self._send), per_channel.values()))
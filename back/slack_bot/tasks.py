@@ -5,7 +5,10 @@ from django.utils.formats import localize
 from django.utils.translation import gettext as _
 
 from admin.integrations.models import Integration
+from misc.lanes import BULK, in_lane
+from misc.task_stats import count_items
 from organization.models import Organization, WelcomeMessage
+from slack_bot.outbox import SlackOutbox
 from slack_bot.slack_intro import SlackIntro
 from slack_bot.slack_misc import get_new_hire_first_message_buttons
 from slack_bot.slack_resource import SlackResource
@@ -28,6 +31,7 @@ def link_slack_users(users=[]):
     if len(users) == 0:
         users = get_user_model().new_hires.without_slack()
 
+    count_items(len(users))
     for user in users:
         response = slack.find_by_email(email=user.email.lower())
         if response:
@@ -80,6 +84,7 @@ def link_slack_users(users=[]):
                 )
 
 
+@in_lane(BULK)
 def update_new_hire():
     if (
         not Integration.objects.filter(integration=Integration.Type.SLACK_BOT).exists()
@@ -87,60 +92,67 @@ def update_new_hire():
     ):
         return
 
-    for user in get_user_model().new_hires.with_slack():
-        local_datetime = user.get_local_time()
+    # Messages are sent concurrently once all of them are ready
+    with SlackOutbox() as outbox:
+        for user in get_user_model().new_hires.with_slack():
+            count_items(1)
+            local_datetime = user.get_local_time()
 
-        if not (
-            local_datetime.hour == 8
-            and local_datetime.weekday() < 5
-            and local_datetime.date() >= user.start_day
-        ):
-            continue
+            if not (
+                local_datetime.hour == 8
+                and local_datetime.weekday() < 5
+                and local_datetime.date() >= user.start_day
+            ):
+                continue
 
-        translation.activate(user.language)
+            translation.activate(user.language)
 
-        overdue_items = ToDoUser.objects.overdue(user)
-        tasks = ToDoUser.objects.due_today(user) | overdue_items
+            overdue_items = ToDoUser.objects.overdue(user)
+            tasks = ToDoUser.objects.due_today(user) | overdue_items
 
-        courses_due = ResourceUser.objects.filter(
-            user=user, resource__on_day__lte=user.workday
-        )
-        # Filter out completed courses
-        course_blocks = [
-            SlackResource(course, user).get_block()
-            for course in courses_due
-            if course.is_course
-        ]
-
-        if len(course_blocks):
-            course_blocks.insert(
-                0, paragraph(_("Here are some courses that you need to complete"))
-            )
-            Slack().send_message(
-                blocks=course_blocks,
-                text=_("Here are some courses that you need to complete"),
-                channel=user.slack_user_id,
+            courses_due = ResourceUser.objects.filter(
+                user=user, resource__on_day__lte=user.workday
             )
+            # Filter out completed courses
+            course_blocks = [
+                SlackResource(course, user).get_block()
+                for course in courses_due
+                if course.is_course
+            ]
 
-        # If any overdue tasks exist, then notify the user
-        if tasks.exists():
-            if overdue_items.exists():
-                text = _(
-                    "Good morning! These are the tasks you need to complete. Some to "
-                    "do items are overdue. Please complete those as soon as possible!"
+            if len(course_blocks):
+                course_blocks.insert(
+                    0, paragraph(_("Here are some courses that you need to complete"))
                 )
-            else:
-                text = _(
-                    "Good morning! These are the tasks you need to complete today:"
+                outbox.send_message(
+                    blocks=course_blocks,
+                    text=_("Here are some courses that you need to complete"),
+                    channel=user.slack_user_id,
                 )
 
-            blocks = SlackToDoManager(user).get_blocks(
-                tasks.values_list("id", flat=True),
-                text=text,
-            )
-            Slack().send_message(blocks=blocks, text=text, channel=user.slack_user_id)
+            # If any overdue tasks exist, then notify the user
+            if tasks.exists():
+                if overdue_items.exists():
+                    text = _(
+                        "Good morning! These are the tasks you need to complete. "
+                        "Some to do items are overdue. Please complete those as soon "
+                        "as possible!"
+                    )
+                else:
+                    text = _(
+                        "Good morning! These are the tasks you need to complete today:"
+                    )
+
+                blocks = SlackToDoManager(user).get_blocks(
+                    tasks.values_list("id", flat=True),
+                    text=text,
+                )
+                outbox.send_message(
+                    blocks=blocks, text=text, channel=user.slack_user_id
+                )
 
 
+@in_lane(BULK)
 def first_day_reminder():
     org = Organization.object.get()
     # If Slack doesn't exist or setting is disabled, then drop
@@ -175,6 +187,7 @@ def first_day_reminder():
         Slack().send_message(text=text, channel="#" + send_to)
 
 
+@in_lane(BULK)
 def birthday_reminder():
     org = Organization.object.get()
     # If Slack doesn't exist or setting is disabled, then drop
@@ -198,6 +211,7 @@ def birthday_reminder():
         Slack().send_message(text=text, channel="#" + send_to)
 
 
+@in_lane(BULK)
 def introduce_new_people():
     org = Organization.object.get()
     # If Slack doesn't exist or setting is disabled, then drop
@@ -216,7 +230,6 @@ def introduce_new_people():
 
     translation.activate(org.language)
 
-    blocks = []
     if new_hires.count() > 1:
         text = _(
             "We got some new hires coming in soon! Make sure to leave a welcome "
@@ -228,9 +241,10 @@ def introduce_new_people():
             "%(first_name)s!"
         ) % {"first_name": new_hires.first().first_name}
 
-    blocks.append(paragraph(text))
-
+    # Blocks per new hire, merged into as few messages as Slack allows
+    intros = []
     for new_hire in new_hires:
+        blocks = []
         message = f"*{new_hire.full_name}*"
 
         # Add new hire introduction message
@@ -278,13 +292,19 @@ def introduce_new_people():
                 ]
             )
         )
+        intros.append(blocks)
 
     send_to = (
         org.slack_default_channel.name
         if org.slack_default_channel is not None
         else "general"
     )
-    Slack().send_message(channel="#" + send_to, text=text, blocks=blocks)
+    with SlackOutbox() as outbox:
+        outbox.send_message(
+            channel="#" + send_to, text=text, blocks=[paragraph(text)], coalesce=True
+        )
+        for blocks in intros:
+            outbox.send_message(channel="#" + send_to, blocks=blocks, coalesce=True)
 
     # Make sure they aren't introduced again
     new_hires.update(is_introduced_to_colleagues=True)
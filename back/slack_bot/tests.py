@@ -1,4 +1,5 @@
 import json
+import time
 from datetime import datetime, timedelta
 from unittest.mock import Mock, patch
 
@@ -9,8 +10,10 @@ from django.utils.formats import localize
 from freezegun import freeze_time
 
 from admin.integrations.models import Integration
+from admin.sequences.models import ExternalMessage
 from organization.models import Organization, WelcomeMessage
 from slack_bot.models import SlackChannel
+from slack_bot.outbox import SlackOutbox, TokenBucket
 from slack_bot.tasks import (
     birthday_reminder,
     first_day_reminder,
@@ -18,6 +21,7 @@ from slack_bot.tasks import (
     link_slack_users,
     update_new_hire,
 )
+from slack_bot.utils import slack_clients
 from slack_bot.views import (
     slack_add_sequences_to_new_hire,
     slack_catch_all_message_search_resources,
@@ -2414,3 +2418,116 @@ def test_introduce_new_hire(new_hire_factory, integration_factory):
             ],
         },
     ]
+
+
+@pytest.mark.django_db
+def test_slack_client_gets_reused(integration_factory, django_assert_num_queries):
+    integration = integration_factory(
+        integration=Integration.Type.SLACK_BOT, token="xoxb-1"
+    )
+    client = slack_clients.get_client()
+    assert client.token == "xoxb-1"
+
+    # Only checks the version stamp (from the local cache tier), no need to fetch
+    # the token again
+    with django_assert_num_queries(0):
+        assert slack_clients.get_client() is client
+
+    # New token, new client
+    integration.token = "xoxb-2"
+    integration.save()
+
+    assert slack_clients.get_client().token == "xoxb-2"
+
+
+@pytest.mark.django_db
+def test_slack_outbox_coalesces_and_keeps_order(settings):
+    settings.FAKE_SLACK_API = False
+    slack = Mock()
+
+    with patch("slack_bot.utils.Slack", Mock(return_value=slack)):
+        with SlackOutbox(max_workers=4) as outbox:
+            outbox.send_message(blocks=[1], channel="a", text="1", coalesce=True)
+            outbox.send_message(blocks=[2], channel="b", text="2")
+            outbox.send_message(blocks=[3], channel="a", text="3", coalesce=True)
+            outbox.send_message(blocks=[4], channel="a", text="4")
+            # Nothing is sent until the block exits
+            assert slack.send_message.call_count == 0
+
+    calls = [call.kwargs for call in slack.send_message.call_args_list]
+    assert len(calls) == 3
+    assert [call for call in calls if call["channel"] == "a"] == [
+        {"blocks": [1, 3], "channel": "a", "text": "1\n3"},
+        {"blocks": [4], "channel": "a", "text": "4"},
+    ]
+    assert {"blocks": [2], "channel": "b", "text": "2"} in calls
+
+
+@pytest.mark.django_db
+def test_token_bucket_spreads_out_calls():
+    bucket = TokenBucket(per_minute=600, burst=2)
+
+    start = time.monotonic()
+    # Burst is available right away
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    # After that, it's 10 per second
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.django_db
+@freeze_time("2022-05-13 08:00:00")
+def test_introduce_many_new_hires_is_split_over_messages(
+    settings, new_hire_factory, integration_factory
+):
+    settings.FAKE_SLACK_API = False
+    org = Organization.object.get()
+    org.ask_colleague_welcome_message = True
+    org.save()
+    integration_factory(integration=Integration.Type.SLACK_BOT)
+    # Three blocks per new hire, more than Slack allows in a single message
+    new_hire_factory.create_batch(20, start_day=datetime.now().date())
+    slack = Mock()
+
+    with patch("slack_bot.utils.Slack", Mock(return_value=slack)):
+        introduce_new_people()
+
+    calls = [call.kwargs for call in slack.send_message.call_args_list]
+    assert [len(call["blocks"]) for call in calls] == [49, 12]
+    assert all(call["channel"] == "#general" for call in calls)
+    assert calls[0]["text"].startswith("We got some new hires coming in soon!")
+
+
+@pytest.mark.django_db
+def test_sequence_slack_messages_go_through_outbox(
+    settings,
+    sequence_factory,
+    pending_slack_message_factory,
+    new_hire_factory,
+):
+    settings.FAKE_SLACK_API = False
+    new_hires = new_hire_factory.create_batch(3, slack_user_id="slackx")
+    sequence = sequence_factory()
+    condition = sequence.conditions.first()
+    condition.external_messages.add(
+        pending_slack_message_factory(
+            person_type=ExternalMessage.PersonType.NEWHIRE,
+            content_json={"blocks": []},
+        )
+    )
+    slack = Mock()
+
+    with (
+        patch("slack_bot.utils.Slack", Mock(return_value=slack)),
+        patch("admin.sequences.models.Slack", Mock(return_value=slack)),
+        patch.object(
+            SlackOutbox, "flush", autospec=True, side_effect=SlackOutbox.flush
+        ) as mock_flush,
+    ):
+        sequence.assign_to_users(new_hires)
+
+    # Queued and sent together
+    assert mock_flush.call_count == 1
+    assert slack.send_message.call_count == 3
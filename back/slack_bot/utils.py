@@ -1,4 +1,6 @@
 import json
+import ssl
+import threading
 
 import slack_sdk
 from django.conf import settings
@@ -6,26 +8,102 @@ from django.core.cache import cache
 from django.db.models import Q
 from slack_bolt import App as SlackBoltApp
 from slack_bolt.adapter.socket_mode import SocketModeHandler
+from slack_sdk.http_retry.builtin_handlers import (
+    ConnectionErrorRetryHandler,
+    RateLimitErrorRetryHandler,
+)
 
 from admin.integrations.models import Integration
+from misc.task_stats import outbound_request
 from organization.models import Notification
 
+from .outbox import rate_limiter
+
+
+class TrackedWebClient(slack_sdk.WebClient):
+    # Calls count towards the stats of the task that makes them
+    def api_call(self, *args, **kwargs):
+        with outbound_request():
+            return super().api_call(*args, **kwargs)
+
+
+class SlackClientRegistry:
+    """
+    Process wide Slack clients. Looking up (and decrypting) the token and setting up a
+    new client (or socket connection) for every message is slow, so this creates them
+    once per process and reuses them.
+    """
+
+    # Shared between processes, bumped when the Slack bot integration changes
+    VERSION_KEY = "slack_bot_token_version"
 
-class Slack:
     def __init__(self):
-        if not settings.FAKE_SLACK_API:
-            if not settings.SLACK_USE_SOCKET:
+        self._lock = threading.Lock()
+        self._client = None
+        self._version = None
+        self._socket_client = None
+        self._ssl_context = None
+
+    def _retry_handlers(self):
+        # Waits for the time in the Retry-After header when Slack rate limits a call
+        return [
+            ConnectionErrorRetryHandler(),
+            RateLimitErrorRetryHandler(
+                max_retry_count=settings.SLACK_RATE_LIMIT_RETRIES
+            ),
+        ]
+
+    def get_client(self):
+        if settings.SLACK_USE_SOCKET:
+            return self._get_socket_client()
+
+        version = cache.get(self.VERSION_KEY, 0)
+        with self._lock:
+            if self._client is None or self._version != version:
+                if self._ssl_context is None:
+                    self._ssl_context = ssl.create_default_context()
                 team = Integration.objects.get(integration=Integration.Type.SLACK_BOT)
-                self.client = slack_sdk.WebClient(token=team.token)
-            else:
-                if settings.SLACK_BOT_TOKEN != "":
-                    app = SlackBoltApp(token=settings.SLACK_BOT_TOKEN)
-                    handler = SocketModeHandler(app, settings.SLACK_APP_TOKEN)
-                    handler.connect()
-                    self.client = app.client
-                    return
+                self._client = TrackedWebClient(
+                    token=team.token,
+                    ssl=self._ssl_context,
+                    retry_handlers=self._retry_handlers(),
+                )
+                self._version = version
+            return self._client
+
+    def _get_socket_client(self):
+        with self._lock:
+            if self._socket_client is None:
+                if settings.SLACK_BOT_TOKEN == "":
+                    raise Exception("Access token not available")
+
+                # One socket connection per process
+                app = SlackBoltApp(
+                    client=TrackedWebClient(token=settings.SLACK_BOT_TOKEN)
+                )
+                handler = SocketModeHandler(app, settings.SLACK_APP_TOKEN)
+                handler.connect()
+                app.client.retry_handlers = self._retry_handlers()
+                self._socket_client = app.client
+            return self._socket_client
+
+    def invalidate(self):
+        # Token changed, all processes should create a new client
+        try:
+            cache.incr(self.VERSION_KEY)
+        except ValueError:
+            cache.set(self.VERSION_KEY, 1, None)
+        with self._lock:
+            self._client = None
+
+
+slack_clients = SlackClientRegistry()
 
-                raise Exception("Access token not available")
+
+class Slack:
+    def __init__(self):
+        if not settings.FAKE_SLACK_API:
+            self.client = slack_clients.get_client()
 
     def get_channels(self):
         try:
@@ -98,6 +176,7 @@ class Slack:
             cache.set("slack_text", text)
             return
 
+        rate_limiter.acquire("chat.update")
         try:
             return self.client.chat_update(
                 channel=channel,
@@ -125,6 +204,7 @@ class Slack:
             cache.set("slack_text", text)
             return {"channel": "slacky"}
 
+        rate_limiter.acquire("chat.postEphemeral")
         return self.client.chat_postEphemeral(
             channel=channel, user=user, text=text, blocks=blocks
         )
@@ -151,6 +231,7 @@ class Slack:
         users = User.objects.filter(
             Q(slack_user_id=channel) | Q(slack_channel_id=channel)
         )
+        rate_limiter.acquire("chat.postMessage", channel)
         try:
             response = self.client.chat_postMessage(
                 channel=channel, text=text, blocks=blocks
@@ -181,6 +262,7 @@ class Slack:
             cache.set("slack_view", view)
             return
 
+        rate_limiter.acquire("views.open")
         return self.client.views_open(trigger_id=trigger_id, view=view)
 
     def update_modal(self, view_id, hash, view):
@@ -189,6 +271,7 @@ class Slack:
             cache.set("slack_view", view)
             return
 
+        rate_limiter.acquire("views.update")
         return self.client.views_update(view_id=view_id, hash=hash, view=view)
 
 
@@ -6,7 +6,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.db import models
 from django.db.models import CheckConstraint, Q
-from django.template import Context, Template
+from django.template import Context
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.crypto import get_random_string
@@ -21,9 +21,16 @@ from admin.integrations.models import Integration
 from admin.introductions.models import Introduction
 from admin.preboarding.models import Preboarding
 from admin.resources.models import CourseAnswer, Resource
-from admin.sequences.models import Condition
+from admin.sequences.models import Condition, ConditionTrigger
+from admin.sequences.triggers import (
+    offboarding_trigger_date,
+    onboarding_trigger_date,
+    trigger_datetime,
+)
+from admin.sequences.workdays import get_workday_calendar
 from admin.to_do.models import ToDo
 from misc.models import File
+from misc.template_cache import template_cache
 from organization.models import Notification
 from slack_bot.utils import Slack, paragraph
 
@@ -59,6 +66,40 @@ class CustomUserManager(BaseUserManager):
         """
         return get_random_string(length, allowed_chars)
 
+    def unique_urls(self, amount):
+        # Same urls as `User.save` creates, checked against existing ones in one query
+        urls = set()
+        while len(urls) < amount:
+            new_urls = {get_random_string(length=8) for _ in range(amount - len(urls))}
+            new_urls -= set(
+                self.filter(unique_url__in=new_urls).values_list(
+                    "unique_url", flat=True
+                )
+            )
+            urls |= new_urls
+        return list(urls)
+
+    def add_sequences(self, users, sequences):
+        # Assign multiple sequences to multiple users at once
+        users = list(users)
+        sequences = list(sequences)
+        for sequence in sequences:
+            sequence.assign_to_users(users)
+
+        Notification.objects.bulk_create(
+            [
+                Notification(
+                    notification_type=Notification.Type.ADDED_SEQUENCE,
+                    item_id=sequence.id,
+                    created_for=user,
+                    extra_text=sequence.name,
+                )
+                for user in users
+                for sequence in sequences
+            ]
+        )
+        ConditionTrigger.objects.schedule(users)
+
 
 class ManagerSlackManager(models.Manager):
     def get_queryset(self):
@@ -410,6 +451,20 @@ class User(AbstractBaseUser):
     def has_module_perms(self, app_label):
         return self.is_superuser
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._condition_trigger_state = instance.condition_trigger_state
+        return instance
+
+    @property
+    def condition_trigger_state(self):
+        # Fields that influence when the timed conditions of this user trigger
+        return tuple(
+            self.__dict__.get(field)
+            for field in ["role", "start_day", "termination_date", "timezone"]
+        )
+
     def save(self, *args, **kwargs):
         self.email = self.email.lower()
         if not self.pk:
@@ -418,21 +473,25 @@ class User(AbstractBaseUser):
                 if not User.objects.filter(unique_url=unique_string).exists():
                     break
             self.unique_url = unique_string
+        reschedule_triggers = self.pk is not None and self.condition_trigger_state != (
+            getattr(self, "_condition_trigger_state", None)
+        )
         super(User, self).save(*args, **kwargs)
 
+        self._condition_trigger_state = self.condition_trigger_state
+        if reschedule_triggers:
+            self.update_condition_triggers()
+
     def add_sequences(self, sequences):
-        for sequence in sequences:
-            sequence.assign_to_user(self)
-            Notification.objects.create(
-                notification_type=Notification.Type.ADDED_SEQUENCE,
-                item_id=sequence.id,
-                created_for=self,
-                extra_text=sequence.name,
-            )
+        User.objects.add_sequences([self], sequences)
 
     def remove_sequence(self, sequence):
         sequence.remove_from_user(self)
 
+    @cached_property
+    def workday_calendar(self):
+        return get_workday_calendar()
+
     @cached_property
     def workday(self):
         start_day = self.start_day
@@ -441,42 +500,29 @@ class User(AbstractBaseUser):
         if start_day > local_day:
             return 0
 
-        amount_of_workdays = 1
-        while local_day != start_day:
-            start_day += timedelta(days=1)
-            if start_day.weekday() not in [5, 6]:
-                amount_of_workdays += 1
-
-        return amount_of_workdays
+        # The start day is always the first workday
+        return 1 + self.workday_calendar.count(
+            start_day + timedelta(days=1), local_day + timedelta(days=1)
+        )
 
     def workday_to_datetime(self, workdays):
-        start_day = self.start_day
         if workdays == 0:
             return None
-
-        start = 1
-        while start != workdays:
-            start_day += timedelta(days=1)
-            if start_day.weekday() not in [5, 6]:
-                start += 1
-        return start_day
+        if workdays == 1:
+            return self.start_day
+        return self.workday_calendar.add(self.start_day, workdays - 1)
 
     def offboarding_workday_to_date(self, workdays):
         # Converts the workday (before the end date) to the actual date on which it
-        # triggers. This will skip any weekends.
-        base_date = self.termination_date
-
-        while workdays > 0:
-            base_date -= timedelta(days=1)
-            if base_date.weekday() not in [5, 6]:
-                workdays -= 1
-
-        return base_date
+        # triggers. This will skip any weekends (and holidays).
+        if workdays <= 0:
+            return self.termination_date
+        return self.workday_calendar.add(self.termination_date, -workdays)
 
     @cached_property
     def days_before_termination_date(self):
         # Checks how many workdays we are away from the employee's last day.
-        # This will skip any weekends.
+        # This will skip any weekends (and holidays).
         date = self.get_local_time().date()
 
         termination_date = self.termination_date
@@ -484,12 +530,9 @@ class User(AbstractBaseUser):
             # passed the termination date
             return -1
 
-        days = 0
-        while termination_date != date:
-            date += timedelta(days=1)
-            if date.weekday() not in [5, 6]:
-                days += 1
-        return days
+        return self.workday_calendar.count(
+            date + timedelta(days=1), termination_date + timedelta(days=1)
+        )
 
     @cached_property
     def days_before_starting(self):
@@ -498,6 +541,39 @@ class User(AbstractBaseUser):
             return 0
         return (self.start_day - self.get_local_time().date()).days
 
+    def get_condition_trigger_datetime(self, condition, timezone_name):
+        # Returns the moment (in UTC) on which a timed condition triggers for this
+        # user. None if it never triggers.
+        # Values could still be datetime objects if they haven't been refreshed yet
+        start_day = self._meta.get_field("start_day").to_python(self.start_day)
+        termination_date = self._meta.get_field("termination_date").to_python(
+            self.termination_date
+        )
+
+        if termination_date is not None:
+            if condition.condition_type != Condition.Type.BEFORE:
+                return None
+            trigger_date = offboarding_trigger_date(
+                termination_date, condition.days, calendar=self.workday_calendar
+            )
+        elif self.role == User.Role.NEWHIRE and start_day is not None:
+            trigger_date = onboarding_trigger_date(
+                start_day,
+                condition.days,
+                before=condition.condition_type == Condition.Type.BEFORE,
+                calendar=self.workday_calendar,
+            )
+        else:
+            return None
+
+        if trigger_date is None:
+            return None
+
+        return trigger_datetime(trigger_date, condition.time, timezone_name)
+
+    def update_condition_triggers(self):
+        ConditionTrigger.objects.schedule([self])
+
     def get_local_time(self, date=None):
         from organization.models import Organization
 
@@ -518,10 +594,24 @@ class User(AbstractBaseUser):
         )
         return us_tz.normalize(local.astimezone(us_tz))
 
-    def personalize(self, text, extra_values=None):
-        if extra_values is None:
-            extra_values = {}
-        t = Template(text)
+    @property
+    def personalize_context(self):
+        # Built once and reused for every text that gets personalized for this user.
+        # Rebuilt when any of the values it's based on changed.
+        state = (
+            self.position,
+            self.last_name,
+            self.first_name,
+            self.email,
+            self.start_day,
+            self.department_id,
+            self.manager_id,
+            self.buddy_id,
+        )
+        cached = self.__dict__.get("_personalize_context")
+        if cached is not None and cached[0] == state:
+            return cached[1]
+
         department = ""
         manager = ""
         manager_email = ""
@@ -548,8 +638,16 @@ class User(AbstractBaseUser):
             "access_overview": lazy(self.get_access_overview, str),
             "department": department,
         }
+        self._personalize_context = (state, new_hire_context)
+        return new_hire_context
+
+    def personalize(self, text, extra_values=None):
+        if extra_values is None:
+            extra_values = {}
 
-        text = t.render(Context(new_hire_context | extra_values))
+        text = template_cache.render(
+            text, lambda: Context(self.personalize_context | extra_values)
+        )
         # Remove non breakable space html code (if any). These could show up in the
         # Slack bot.
         text = text.replace("&nbsp;", " ")
@@ -574,8 +672,11 @@ class User(AbstractBaseUser):
         for integration_user in IntegrationUser.objects.filter(user=self):
             items[integration_user.integration.name] = not integration_user.revoked
 
-        for integration in Integration.objects.filter(manifest__exists__isnull=False):
-            items[integration.name] = integration.user_exists(self)
+        results = Integration.objects.check_user_exists(
+            self, Integration.objects.filter(manifest__exists__isnull=False)
+        )
+        for integration, exists in results.items():
+            items[integration.name] = exists
 
         return items
 
@@ -798,27 +899,28 @@ class NewHireWelcomeMessage(models.Model):
     message = models.TextField()
 
 
-class IntegrationUser(models.Model):
-    # logging when an integration was enabled and revoked
-    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
-    integration = models.ForeignKey(
-        "integrations.Integration", on_delete=models.CASCADE
-    )
-    revoked = models.BooleanField(default=False)
-
-    class Meta:
-        unique_together = ["user", "integration"]
+class IntegrationUserManager(models.Manager):
+    def save_results(self, user, results):
+        # results: {integration: user exists}
+        self.bulk_create(
+            [
+                IntegrationUser(user=user, integration=integration, revoked=not exists)
+                for integration, exists in results.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "integration"],
+            update_fields=["revoked"],
+        )
+        self.trigger_revoked_condition(user)
 
-    def save(self, *args, **kwargs):
-        integration_user = super().save(*args, **kwargs)
-        user = self.user
+    def trigger_revoked_condition(self, user):
         if (
             user.is_offboarding
             and not user.ran_integrations_condition
             and user.conditions.filter(
                 condition_type=Condition.Type.INTEGRATIONS_REVOKED
             ).exists()
-            and not IntegrationUser.objects.filter(user=user, revoked=False).exists()
+            and not self.filter(user=user, revoked=False).exists()
         ):
             from admin.sequences.tasks import process_condition
 
@@ -837,4 +939,21 @@ class IntegrationUser(models.Model):
             user.ran_integrations_condition = True
             user.save()
 
+
+class IntegrationUser(models.Model):
+    # logging when an integration was enabled and revoked
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    integration = models.ForeignKey(
+        "integrations.Integration", on_delete=models.CASCADE
+    )
+    revoked = models.BooleanField(default=False)
+
+    objects = IntegrationUserManager()
+
+    class Meta:
+        unique_together = ["user", "integration"]
+
+    def save(self, *args, **kwargs):
+        integration_user = super().save(*args, **kwargs)
+        IntegrationUser.objects.trigger_revoked_condition(self.user)
         return integration_user
@@ -7,6 +7,8 @@ from django.utils import timezone
 from freezegun import freeze_time
 
 from admin.sequences.models import IntegrationConfig
+from admin.sequences.workdays import WorkdayCalendar
+from misc.template_cache import TemplateCache, template_cache
 from organization.models import Organization
 from users.tasks import hourly_check_for_new_hire_send_credentials
 
@@ -119,6 +121,47 @@ def test_offboarding_workday_to_date(date, days_before, new_hire_factory):
     freezer.stop()
 
 
+@pytest.mark.django_db
+def test_workdays_skip_holidays(new_hire_factory):
+    org = Organization.object.get()
+    # Thursday, and one in the weekend (doesn't change anything)
+    org.holidays = [datetime.date(2021, 1, 14), datetime.date(2021, 1, 16)]
+    org.save()
+
+    # Start on Tuesday
+    with freeze_time("2021-01-12"):
+        new_hire = new_hire_factory(start_day=datetime.date(2021, 1, 12))
+    with freeze_time("2021-01-15"):
+        assert new_hire.workday == 3
+    assert new_hire.workday_to_datetime(3) == datetime.date(2021, 1, 15)
+    assert new_hire.workday_to_datetime(4) == datetime.date(2021, 1, 18)
+
+    # Last day on Monday
+    with freeze_time("2021-01-12"):
+        employee = new_hire_factory(termination_date=datetime.date(2021, 1, 18))
+        assert employee.days_before_termination_date == 3
+    assert employee.offboarding_workday_to_date(2) == datetime.date(2021, 1, 13)
+
+
+@pytest.mark.django_db
+def test_workday_calendar():
+    calendar = WorkdayCalendar(holidays=[datetime.date(2021, 1, 14)])
+
+    assert calendar.is_workday(datetime.date(2021, 1, 13))
+    assert not calendar.is_workday(datetime.date(2021, 1, 14))
+    assert not calendar.is_workday(datetime.date(2021, 1, 16))
+    # Monday up to the next Monday
+    assert calendar.count(datetime.date(2021, 1, 11), datetime.date(2021, 1, 18)) == 4
+    # Over years, without walking every day
+    assert calendar.count(datetime.date(2021, 1, 4), datetime.date(2031, 1, 6)) == (
+        (datetime.date(2031, 1, 6) - datetime.date(2021, 1, 4)).days // 7 * 5 - 1
+    )
+    # Wednesday + 1 skips the holiday, Friday + 1 skips the weekend
+    assert calendar.add(datetime.date(2021, 1, 13), 1) == datetime.date(2021, 1, 15)
+    assert calendar.add(datetime.date(2021, 1, 15), 1) == datetime.date(2021, 1, 18)
+    assert calendar.add(datetime.date(2021, 1, 18), -2) == datetime.date(2021, 1, 13)
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize(
     "first_name, last_name, initials, full_name",
@@ -214,7 +257,7 @@ def test_personalize(
 
     # Service errored
     with patch(
-        "admin.integrations.models.Integration.user_exists",
+        "admin.integrations.models.Integration._request_exists",
         Mock(return_value=(None)),
     ):
         assert new_hire.personalize(text) == expected_output
@@ -223,6 +266,50 @@ def test_personalize(
         )
 
 
+@pytest.mark.django_db
+def test_personalize_template_cache(
+    new_hire_factory, manager_factory, django_assert_num_queries
+):
+    template_cache.clear()
+    new_hire = new_hire_factory(first_name="john", manager=manager_factory())
+
+    assert new_hire.personalize("Hi {{ first_name }}") == "Hi john"
+    # Compiled template and context get reused
+    with django_assert_num_queries(0):
+        assert new_hire.personalize("Hi {{ first_name }}") == "Hi john"
+        assert new_hire.personalize("Hi {{ manager }}") == (
+            f"Hi {new_hire.manager.full_name}"
+        )
+    # Text without variables doesn't get compiled
+    assert new_hire.personalize("Hi&nbsp;there") == "Hi there"
+
+    # Context gets rebuilt when the user changed
+    new_hire.first_name = "jane"
+    assert new_hire.personalize("Hi {{ first_name }}") == "Hi jane"
+
+    assert template_cache.stats() == {
+        "size": 2,
+        "hits": 2,
+        "misses": 2,
+        "skipped": 1,
+        "hit_rate": 0.5,
+    }
+
+
+@pytest.mark.django_db
+def test_template_cache_evicts_least_recently_used():
+    cache = TemplateCache(maxsize=2)
+    first = cache.get("{{ first_name }}")
+    cache.get("{{ last_name }}")
+    # Mark first one as recently used
+    assert cache.get("{{ first_name }}") is first
+    cache.get("{{ email }}")
+
+    assert cache.stats()["size"] == 2
+    assert cache.get("{{ first_name }}") is first
+    assert cache.stats()["misses"] == 3
+
+
 @pytest.mark.django_db
 def test_check_integration_access(
     new_hire_factory, custom_integration_factory, integration_user_factory
@@ -235,7 +322,7 @@ def test_check_integration_access(
 
     # integration service errored
     with patch(
-        "admin.integrations.models.Integration.user_exists",
+        "admin.integrations.models.Integration._request_exists",
         Mock(return_value=(None)),
     ):
         access = new_hire.check_integration_access()
@@ -45,6 +45,9 @@ export default defineConfig({
           {text: 'Error logging', link: 'config/errorlogging'},
           {text: 'Google SSO', link: 'config/google-sso'},
           {text: 'Slackbot', link: 'config/slackbot'},
+          {text: 'Integrations', link: 'config/integrations'},
+          {text: 'Cache', link: 'config/cache'},
+          {text: 'Background tasks', link: 'config/tasks'},
           {text: 'OIDC Single Sign-On (SSO)', link: 'config/oidc'},
         ]
       },